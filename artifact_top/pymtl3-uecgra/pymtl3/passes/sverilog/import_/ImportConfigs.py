@@ -7,6 +7,8 @@
 
 import os
 import subprocess
+from functools import lru_cache
+from hashlib import blake2b
 from textwrap import fill, indent
 
 from pymtl3.dsl import Placeholder
@@ -15,7 +17,11 @@ from pymtl3.passes.PassConfigs import BasePassConfigs
 from pymtl3.passes.rtlir import RTLIRDataType as rdt
 from pymtl3.passes.rtlir import RTLIRType as rt
 from pymtl3.passes.rtlir import get_component_ifc_rtlir
-from pymtl3.passes.sverilog.util.utility import expand, get_component_unique_name
+from pymtl3.passes.sverilog.util.utility import (
+    expand,
+    get_component_unique_name,
+    get_user_cache_dir,
+)
 
 
 class ImportConfigs( BasePassConfigs ):
@@ -25,17 +31,41 @@ class ImportConfigs( BasePassConfigs ):
 
     s.set_checkers(
         ['import_', 'enable_assert', 'vl_W_lint', 'vl_W_style', 'vl_W_fatal',
-         'vl_trace', 'verbose', 'has_clk', 'has_reset', 'vl_debug'],
+         'vl_trace', 'verbose', 'has_clk', 'has_reset', 'vl_debug',
+         'c_incremental', 'use_cache', 'port_buffer'],
         lambda v: isinstance(v, bool),
         "expects a boolean")
     s.set_checkers(
-        ['c_flags', 'ld_flags', 'ld_libs'],
+        ['c_flags', 'ld_flags', 'ld_libs', 'c_runtime_dir', 'cache_dir'],
         lambda v: isinstance(v, str),
         "expects a string")
     s.set_checkers(
-        ['vl_unroll_count', 'vl_unroll_stmts'],
+        ['vl_unroll_count', 'vl_unroll_stmts', 'c_jobs', 'cache_max_mb'],
         lambda v: isinstance(v, int) and v >= 0,
         "expects an integer >= 0")
+    s.set_checker(
+        "vl_threads",
+        lambda v: isinstance(v, int) and v >= 0,
+        "expects an integer >= 0")
+    s.set_checker(
+        "vl_threads_max_mtasks",
+        lambda v: isinstance(v, int) and v >= 0 and \
+                  (v == 0 or s.get_option("vl_threads") > 0),
+        "expects an integer >= 0; requires vl_threads > 0 if non-zero")
+    s.set_checker(
+        "vl_prof_threads",
+        lambda v: isinstance(v, bool) and \
+                  (not v or s.get_option("vl_threads") > 0),
+        "expects a boolean; requires vl_threads > 0 if True")
+    s.set_checker(
+        "vl_threads_profile",
+        lambda v: v == "" or isinstance(v, str) and \
+                  os.path.isfile(expand(v)) and s.get_option("vl_threads") > 0,
+        "expects a path to a file; requires vl_threads > 0")
+    s.set_checker(
+        "c_opt_level",
+        lambda v: isinstance(v, int) and 0 <= v <= 3,
+        "expects an integer between 0 and 3")
     s.set_checker(
         "top_module",
         lambda v: isinstance(v, str) and v,
@@ -111,6 +141,30 @@ class ImportConfigs( BasePassConfigs ):
       # Map pymtl names to Verilog names
       "port_map" : {},
 
+      # Marshal the ports through the port buffers of the C wrapper?
+      # The wrapper then only converts the ports whose values changed, and
+      # test drivers can access the buffers directly through
+      # `get_port_buffers`.
+      "port_buffer" : False,
+
+      # Model cache options
+      # Verilated models can be shared between working directories through
+      # a user-level cache. A model is keyed by its translated source, the
+      # C wrapper, the import options, and the verilator and C compiler
+      # versions. Only components translated by pymtl translation passes are
+      # cached.
+
+      # Look up and store the verilated model in the cache?
+      "use_cache" : False,
+
+      # Expects the path of the cache directory;
+      # "" to use `models` under the user cache directory
+      "cache_dir" : "",
+
+      # Expects the size limit of the cache in MB; the least recently used
+      # models are evicted when it is exceeded. 0 to disable eviction
+      "cache_max_mb" : 4096,
+
       # Verilator code generation options
       # These options will be passed to verilator to generate the C simulator.
       # By default, verilator is called with `--cc`.
@@ -179,6 +233,27 @@ class ImportConfigs( BasePassConfigs ):
       # The given list should only include strings that appear in `Warnings`
       "vl_Wno_list" : [],
 
+      # Verilator multithreading options
+
+      # --threads
+      # Expects the number of threads the verilated model runs on;
+      # 0 to generate a single-threaded model
+      "vl_threads" : 0,
+
+      # --threads-max-mtasks
+      # Expects the maximum number of tasks the model is partitioned into
+      # before they are scheduled on the threads; 0 to use verilator's default
+      "vl_threads_max_mtasks" : 0,
+
+      # --prof-threads
+      # Make the model record the execution of its tasks on each thread
+      "vl_prof_threads" : False,
+
+      # Expects the path of a profile of a previous run of the model for
+      # profile-guided scheduling of its tasks (the `.vlt` file written by
+      # models verilated with `--prof-pgo`); "" to disable this option
+      "vl_threads_profile" : "",
+
       # Verilator misc options
 
       # --trace
@@ -201,6 +276,24 @@ class ImportConfigs( BasePassConfigs ):
       # "" to disable this option
       "c_flags" : "",
 
+      # -O0/1/2/3
+      # Optimization level of the C compiler
+      "c_opt_level" : 0,
+
+      # Compile every C source into its own object file, in parallel, and
+      # only recompile and relink what changed since the last build. The
+      # verilator runtime objects are compiled once and shared by all models.
+      # False to compile and link everything with a single compiler call.
+      "c_incremental" : False,
+
+      # Number of parallel C compiler jobs of the incremental build
+      # 0 to run one job per CPU
+      "c_jobs" : 0,
+
+      # Where the incremental build keeps the shared verilator runtime objects
+      # "" to use `vl_runtime` under the user cache directory
+      "c_runtime_dir" : "",
+
       # Additional include search path of the C compiler.
       # [] to disable this option
       "c_include_path" : [],
@@ -223,6 +316,12 @@ class ImportConfigs( BasePassConfigs ):
 
   PassName = 'sverilog.ImportPass'
 
+  # Options that do not change the verilated model
+  NonModelOptions = [
+      'verbose', 'use_cache', 'cache_dir', 'cache_max_mb', 'c_incremental',
+      'c_jobs', 'c_runtime_dir', 'port_buffer',
+    ]
+
   #-----------------------------------------------------------------------
   # Public APIs
   #-----------------------------------------------------------------------
@@ -242,26 +341,43 @@ class ImportConfigs( BasePassConfigs ):
     stmt_unroll = "" if s.get_option("vl_unroll_stmts") == 0 else \
                   f"--unroll-stmts {s.get_option('vl_unroll_stmts')}"
     trace       = "" if s.is_default("vl_trace") else "--trace"
+    threads     = s.create_vl_threads_cmd()
     warnings    = s.create_vl_warning_cmd()
 
     all_opts = [
       top_module, mk_dir, include, en_assert, opt_level, loop_unroll,
-      stmt_unroll, trace, warnings, flist, src
+      stmt_unroll, trace, threads, warnings, flist, src
     ]
 
     return f"verilator --cc {' '.join(opt for opt in all_opts if opt)}"
 
   def create_cc_cmd( s ):
-    c_flags = "-O0 -fPIC -shared" + \
-             ("" if s.is_default("c_flags") else f" {s.get_option('c_flags')}")
+    c_flags = f"-O{s.get_option('c_opt_level')} -fPIC -shared" + \
+             ("" if s.is_default("c_flags") else f" {s.get_option('c_flags')}") + \
+             ("" if not s.is_vl_threaded() else f" {s.get_c_threads_flags()}")
     c_include_path = " ".join("-I"+p for p in s.get_all_includes() if p)
     out_file = s.get_shared_lib_path()
     c_src_files = " ".join(s.get_c_src_files())
     ld_flags = s.get_option("ld_flags")
-    ld_libs = s.get_option("ld_libs")
+    ld_libs = s.get_ld_libs()
     return f"g++ {c_flags} {c_include_path} {ld_flags}"\
            f" -o {out_file} {c_src_files} {ld_libs}"
 
+  def create_cc_obj_cmd( s, c_flags, src, obj, dep = "" ):
+    """Return the command that compiles `src` into object file `obj`.
+
+    `c_flags` is the result of `get_c_obj_flags`. If `dep` is given, the
+    compiler also writes the headers `src` depends on to that file.
+    """
+    dep_flags = f" -MMD -MF {dep}" if dep else ""
+    return f"g++ {c_flags}{dep_flags} -c -o {obj} {src}"
+
+  def create_ld_cmd( s, objs ):
+    out_file = s.get_shared_lib_path()
+    ld_flags = s.get_option("ld_flags")
+    ld_libs = s.get_ld_libs()
+    return f"g++ -shared {ld_flags} -o {out_file} {' '.join(objs)} {ld_libs}"
+
   def fill_missing( s, m ):
     rtype = get_component_ifc_rtlir(m)
     s.v_param = rtype.get_params()
@@ -336,6 +452,21 @@ class ImportConfigs( BasePassConfigs ):
   def is_vl_trace_enabled( s ):
     return s.get_option( "vl_trace" )
 
+  def is_vl_threaded( s ):
+    return s.get_option( "vl_threads" ) > 0
+
+  def is_c_incremental( s ):
+    return s.get_option( "c_incremental" )
+
+  def is_cache_enabled( s ):
+    return s.get_option( "use_cache" )
+
+  def get_c_jobs( s ):
+    return s.get_option( "c_jobs" ) or os.cpu_count() or 1
+
+  def is_port_buffered( s ):
+    return s.get_option( "port_buffer" )
+
   def is_port_mapped( s ):
     return bool(s.get_option("port_map"))
 
@@ -373,6 +504,74 @@ class ImportConfigs( BasePassConfigs ):
   def get_vl_mk_dir( s ):
     return s.get_option( "vl_mk_dir" )
 
+  def get_cache_dir( s ):
+    cache_dir = s.get_option( "cache_dir" )
+    if not cache_dir:
+      cache_dir = os.path.join( get_user_cache_dir(), "models" )
+    return expand( cache_dir )
+
+  def get_cache_max_bytes( s ):
+    return s.get_option( "cache_max_mb" ) * 2**20
+
+  def get_model_options( s ):
+    """Return the options that affect the verilated model, sorted by name."""
+    return sorted( ( opt, value ) for opt, value in s.options.items() \
+                   if opt not in s.NonModelOptions )
+
+  def get_tool_versions( s ):
+    """Return the versions of verilator and the C compiler."""
+    return [ get_tool_version( "verilator --version" ),
+             get_tool_version( "g++ --version" ) ]
+
+  def get_vl_runtime_dir( s ):
+    runtime_dir = s.get_option( "c_runtime_dir" )
+    if not runtime_dir:
+      runtime_dir = os.path.join( get_user_cache_dir(), "vl_runtime" )
+    return expand( runtime_dir )
+
+  def get_c_threads_flags( s ):
+    """Return the C compiler flags of a multithreaded model."""
+    return "-DVL_THREADED -pthread"
+
+  def get_ld_libs( s ):
+    """Return `ld_libs` and the libraries a multithreaded model needs."""
+    ld_libs = s.get_option( "ld_libs" )
+    if s.is_vl_threaded():
+      ld_libs = " ".join( l for l in [ "-pthread -latomic", ld_libs ] if l )
+    return ld_libs
+
+  def get_c_obj_flags( s ):
+    """Return the C compiler flags of the incremental build."""
+    c_flags = f"-O{s.get_option('c_opt_level')} -fPIC" + \
+             ("" if s.is_default("c_flags") else f" {s.get_option('c_flags')}") + \
+             ("" if not s.is_vl_threaded() else f" {s.get_c_threads_flags()}")
+    c_include_path = " ".join("-I"+p for p in s.get_all_includes() if p)
+    return f"{c_flags} {c_include_path}"
+
+  def get_c_obj_path( s, src ):
+    """Return the object file of model or wrapper source `src`.
+
+    These objects live in the verilator output directory so that they are
+    discarded together with the model when it is verilated again.
+    """
+    stem = os.path.splitext( os.path.basename( src ) )[0]
+    return f"{s.get_vl_mk_dir()}/{stem}.o"
+
+  def get_vl_runtime_obj_path( s, src, c_flags ):
+    """Return the shared object file of verilator runtime source `src`.
+
+    The name is keyed by the compiler flags, the compiler version, and the
+    source file so that objects built for different configurations or
+    verilator installations never collide.
+    """
+    stat = os.stat( src )
+    key = blake2b( digest_size=8 )
+    key.update( f"{c_flags}|{os.path.abspath(src)}|"\
+                f"{stat.st_size}|{stat.st_mtime_ns}|"\
+                f"{s.get_tool_versions()[1]}".encode() )
+    stem = os.path.splitext( os.path.basename( src ) )[0]
+    return os.path.join( s.get_vl_runtime_dir(), f"{stem}__{key.hexdigest()}.o" )
+
   def vprint( s, msg, nspaces = 0, use_fill = False ):
     if s.get_option("verbose"):
       if use_fill:
@@ -401,7 +600,7 @@ class ImportConfigs( BasePassConfigs ):
         f"All ports of {rtype.get_name()} should be mapped to a new name!")
 
   def get_all_includes( s ):
-    includes = s.get_option("c_include_path")
+    includes = list(s.get_option("c_include_path"))
 
     # Try to obtain verilator include path either from environment variable
     # or from `pkg-config`
@@ -411,6 +610,7 @@ class ImportConfigs( BasePassConfigs ):
       try:
         vl_include_dir = \
             subprocess.check_output(get_dir_cmd, stderr = subprocess.STDOUT).strip()
+        vl_include_dir = vl_include_dir.decode('ascii')
       except OSError as e:
         vl_include_dir_msg = \
 """\
@@ -426,7 +626,7 @@ $PYMTL_VERILATOR_INCLUDE_DIR is set or `pkg-config` has been configured properly
     return includes
 
   def get_c_src_files( s ):
-    srcs = s.get_option("c_srcs")
+    srcs = list(s.get_option("c_srcs"))
     top_module = s.get_top_module()
     vl_mk_dir = s.get_option("vl_mk_dir")
     vl_class_mk = f"{vl_mk_dir}/V{top_module}_classes.mk"
@@ -444,12 +644,19 @@ $PYMTL_VERILATOR_INCLUDE_DIR is set or `pkg-config` has been configured properly
           class_mk, vl_mk_dir, "VM_SUPPORT_FAST")
       srcs += s.get_srcs_from_vl_class_mk(
           class_mk, vl_mk_dir, "VM_SUPPORT_SLOW")
-      srcs += s.get_srcs_from_vl_class_mk(
-          class_mk, s.vl_include_dir, "VM_GLOBAL_FAST")
-      srcs += s.get_srcs_from_vl_class_mk(
-          class_mk, s.vl_include_dir, "VM_GLOBAL_SLOW")
 
-    return srcs
+    return srcs + s.get_vl_runtime_src_files()
+
+  def get_vl_runtime_src_files( s ):
+    """Return the verilator runtime sources the model has to be linked with."""
+    vl_class_mk = f"{s.get_option('vl_mk_dir')}/V{s.get_top_module()}_classes.mk"
+    if not hasattr(s, "vl_include_dir"):
+      s.get_all_includes()
+    with open(vl_class_mk, "r") as class_mk:
+      return s.get_srcs_from_vl_class_mk(
+                 class_mk, s.vl_include_dir, "VM_GLOBAL_FAST") + \
+             s.get_srcs_from_vl_class_mk(
+                 class_mk, s.vl_include_dir, "VM_GLOBAL_SLOW")
 
   def get_srcs_from_vl_class_mk( s, mk, path, label ):
     """Return all files under `path` directory in `label` section of `mk`."""
@@ -466,6 +673,17 @@ $PYMTL_VERILATOR_INCLUDE_DIR is set or `pkg-config` has been configured properly
           srcs.append( path + "/" + file_name + ".cpp" )
     return srcs
 
+  def create_vl_threads_cmd( s ):
+    if not s.is_vl_threaded():
+      return ""
+    threads = f"--threads {s.get_option('vl_threads')}"
+    mtasks = "" if s.is_default("vl_threads_max_mtasks") else \
+             f"--threads-max-mtasks {s.get_option('vl_threads_max_mtasks')}"
+    prof = "" if s.is_default("vl_prof_threads") else "--prof-threads"
+    profile = "" if s.is_default("vl_threads_profile") else \
+              expand(s.get_option("vl_threads_profile"))
+    return " ".join(o for o in [threads, mtasks, prof, profile] if o)
+
   def create_vl_warning_cmd( s ):
     lint = "" if s.is_default("vl_W_lint") else "--Wno-lint"
     style = "" if s.is_default("vl_W_style") else "--Wno-style"
@@ -475,3 +693,12 @@ $PYMTL_VERILATOR_INCLUDE_DIR is set or `pkg-config` has been configured properly
 
   def is_default( s, opt ):
     return s.options[opt] == s.Options[opt]
+
+@lru_cache()
+def get_tool_version( cmd ):
+  """Return the output of version command `cmd`, "" if it fails."""
+  try:
+    return subprocess.check_output( cmd, stderr = subprocess.STDOUT, shell = True,
+                                    universal_newlines = True ).strip()
+  except subprocess.CalledProcessError:
+    return ""
@@ -12,6 +12,9 @@ import os
 import shutil
 import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
 from textwrap import indent
 
 from pymtl3.datatypes import Bits, BitStruct, mk_bits
@@ -144,18 +147,27 @@ class ImportPass( BasePass ):
         [ (n, p_map(n), p) for n, p in _packed_ports ]#\
           # if not (n == 'clk' and no_clk or n == 'reset' and no_reset)]
 
+    config.check_options()
+
     cached = s.is_cached( m, full_name )
 
     # Create a new Verilog source file if a new top-level wrapper is needed
     if config.is_top_wrapper():
       s.add_param_wrapper( m, config, rtype, packed_ports )
 
-    s.create_verilator_model( m, config, cached )
-
     port_cdefs = \
         s.create_verilator_c_wrapper( m, config, packed_ports, cached )
 
-    s.create_shared_lib( m, config, cached )
+    # Reuse the shared lib from the model cache if it has been built before
+    cache_key = s.get_model_cache_key( m, config, cached )
+
+    if cache_key is None or not s.fetch_cached_model( config, cache_key ):
+      s.create_verilator_model( m, config, cached )
+
+      s.create_shared_lib( m, config, cached )
+
+      if cache_key is not None:
+        s.store_cached_model( config, cache_key )
 
     symbols = \
         s.create_py_wrapper( m, config, rtype, packed_ports, port_cdefs, cached )
@@ -170,7 +182,6 @@ class ImportPass( BasePass ):
 
   def create_verilator_model( s, m, config, cached ):
     """Verilate module `m`."""
-    config.check_options()
     config.vprint("\n=====Verilate model=====")
     if not cached:
       # Generate verilator command
@@ -212,6 +223,7 @@ class ImportPass( BasePass ):
     """
     component_name = config.get_top_module()
     dump_vcd = int(config.is_vl_trace_enabled())
+    model_threads = config.get_option( "vl_threads" )
     vcd_timescale = config.get_vl_trace_timescale()
     half_cycle_time = config.get_vl_trace_half_cycle_time()
     wrapper_name = config.get_c_wrapper_path()
@@ -239,6 +251,35 @@ class ImportPass( BasePass ):
     make_indent( port_inits, 1 )
     port_inits = '\n'.join( port_inits )
 
+    # Generate the port accesses of the port words
+    in_ports, out_ports = s.gen_port_words( packed_ports )
+    n_in_words = sum( nwords for _, _, _, _, nwords in in_ports )
+    n_out_words = sum( nwords for _, _, _, _, nwords in out_ports )
+    words_inputs = s.gen_words_input_c( in_ports )
+    words_outputs = s.gen_words_output_c( out_ports )
+    run_cycles_inputs = s.gen_words_input_c( in_ports, hold = True )
+    if config.has_clk():
+      clk = s._verilator_name(
+          next(filter(lambda x: x[0]=='clk', packed_ports))[1] )
+      words_clk = [ f"*m->{clk} = 0;", "eval( m );",
+                    f"*m->{clk} = 1;", "eval( m );" ]
+    else:
+      words_clk = []
+    run_cycles_outputs = copy.copy( words_outputs )
+    run_cycles_clk = copy.copy( words_clk )
+    make_indent( words_inputs, 1 )
+    make_indent( words_outputs, 1 )
+    make_indent( words_clk, 1 )
+    make_indent( run_cycles_inputs, 3 )
+    make_indent( run_cycles_outputs, 2 )
+    make_indent( run_cycles_clk, 2 )
+    words_inputs = '\n'.join( words_inputs )
+    words_outputs = '\n'.join( words_outputs )
+    words_clk = '\n'.join( words_clk )
+    run_cycles_inputs = '\n'.join( run_cycles_inputs )
+    run_cycles_outputs = '\n'.join( run_cycles_outputs )
+    run_cycles_clk = '\n'.join( run_cycles_clk )
+
     # Fill in the C wrapper template
 
     # Since we may run import with or without dump_vcd enabled, we need
@@ -247,9 +288,19 @@ class ImportPass( BasePass ):
     # TODO: we can avoid dumping C wrapper if we attach some metadata to
     # tell if the wrapper was generated with or without `dump_vcd` enabled.
     with open( template_name, 'r' ) as template:
+      c_wrapper = template.read()
+      c_wrapper = c_wrapper.format( **locals() )
+
+    # Keep the time stamp of an unchanged wrapper so that an incremental
+    # build does not recompile it.
+    try:
+      with open( wrapper_name, 'r' ) as output:
+        is_same = output.read() == c_wrapper
+    except OSError:
+      is_same = False
+
+    if not is_same:
       with open( wrapper_name, 'w' ) as output:
-        c_wrapper = template.read()
-        c_wrapper = c_wrapper.format( **locals() )
         output.write( c_wrapper )
 
     config.vprint(f"Successfully generated C wrapper {wrapper_name}!", 2)
@@ -271,29 +322,252 @@ class ImportPass( BasePass ):
     # TODO: A better caching strategy is to attach some metadata
     # to the C wrapper so that we know the wrapper was generated with or
     # without dump_vcd enabled.
-    if dump_vcd or not cached:
+    if config.is_c_incremental():
+      s.build_shared_lib( m, config )
+
+    elif dump_vcd or not cached:
       cmd = config.create_cc_cmd()
 
       # Try to call the C compiler
-      try:
-        config.vprint("Compiling shared library with command:", 2)
-        config.vprint(f"{cmd}", 4)
-        subprocess.check_output( cmd, stderr = subprocess.STDOUT, shell = True,
-                                 universal_newlines=True )
-      except subprocess.CalledProcessError as e:
-        err_msg = e.output if not isinstance(e.output, bytes) else \
-                  e.output.decode('utf-8')
-        import_err_msg = \
-            f"Failed to compile Verilated model into a shared library:\n"\
-            f"  C compiler command:\n{indent(cmd, '  ')}\n\n"\
-            f"  C compiler output:\n{indent(wrap(err_msg), '  ')}\n"
-        raise SVerilogImportError(m, import_err_msg) from e
+      config.vprint("Compiling shared library with command:", 2)
+      s.run_cc( m, config, cmd )
       config.vprint(f"Successfully compiled shared library "\
                     f"{config.get_shared_lib_path()}!", 2)
 
     else:
       config.vprint(f"Didn't compile shared library because it's cached!", 2)
 
+  #-----------------------------------------------------------------------
+  # build_shared_lib
+  #-----------------------------------------------------------------------
+
+  def build_shared_lib( s, m, config ):
+    """Incrementally build the shared lib of the verilated model.
+
+    Each C source is compiled into its own object file by a pool of
+    parallel compiler jobs. An object is only rebuilt if its compiler
+    command, its source, or a header it includes changed. The verilator
+    runtime objects are kept in a directory shared by all models; they are
+    compiled to a temporary file first so that concurrent builds never see
+    a partially written object. The shared lib is only relinked if one of
+    its objects changed.
+    """
+    c_flags = config.get_c_obj_flags()
+    runtime_srcs = config.get_vl_runtime_src_files()
+    runtime_dir = config.get_vl_runtime_dir()
+    os.makedirs( runtime_dir, exist_ok = True )
+
+    objs, jobs = [], []
+    for src in config.get_c_src_files():
+      if src in runtime_srcs:
+        obj = config.get_vl_runtime_obj_path( src, c_flags )
+        if not os.path.exists( obj ):
+          jobs.append( ( src, obj, None ) )
+      else:
+        obj = config.get_c_obj_path( src )
+        cmd = config.create_cc_obj_cmd( c_flags, src, obj, obj[:-2]+'.d' )
+        if s.is_obj_stale( obj, cmd ):
+          jobs.append( ( src, obj, cmd ) )
+      objs.append( obj )
+
+    def compile_obj( src, obj, cmd ):
+      if cmd is None:
+        fd, tmp = tempfile.mkstemp( suffix = '.o', dir = runtime_dir )
+        os.close( fd )
+        try:
+          s.run_cc( m, config, config.create_cc_obj_cmd( c_flags, src, tmp ) )
+          os.replace( tmp, obj )
+        finally:
+          if os.path.exists( tmp ):
+            os.remove( tmp )
+      else:
+        s.run_cc( m, config, cmd )
+        with open( obj+'.cmd', 'w' ) as cmd_file:
+          cmd_file.write( cmd )
+
+    config.vprint(f"Compiling {len(jobs)} out of {len(objs)} object files "\
+                  f"with {config.get_c_jobs()} jobs", 2)
+    with ThreadPoolExecutor( max_workers = config.get_c_jobs() ) as pool:
+      for future in [ pool.submit( compile_obj, *job ) for job in jobs ]:
+        future.result()
+
+    # Relink if any object is newer than the shared lib
+    shared_lib = config.get_shared_lib_path()
+    cmd = config.create_ld_cmd( objs )
+    try:
+      lib_time = os.path.getmtime( shared_lib )
+      with open( f"{config.get_vl_mk_dir()}/{shared_lib}.cmd" ) as cmd_file:
+        is_stale = cmd_file.read() != cmd or \
+                   any( os.path.getmtime( obj ) > lib_time for obj in objs )
+    except OSError:
+      is_stale = True
+
+    if is_stale:
+      s.run_cc( m, config, cmd )
+      with open( f"{config.get_vl_mk_dir()}/{shared_lib}.cmd", 'w' ) as cmd_file:
+        cmd_file.write( cmd )
+      config.vprint(f"Successfully linked shared library {shared_lib}!", 2)
+    else:
+      config.vprint("Didn't relink shared library because it's up to date!", 2)
+
+  def is_obj_stale( s, obj, cmd ):
+    """Return whether object file `obj` has to be rebuilt with `cmd`."""
+    try:
+      with open( obj+'.cmd', 'r' ) as cmd_file:
+        if cmd_file.read() != cmd:
+          return True
+      obj_time = os.path.getmtime( obj )
+      # The dependency file is a make rule `obj: src header...`
+      with open( obj[:-2]+'.d', 'r' ) as dep_file:
+        deps = dep_file.read().replace( '\\\n', ' ' ).split( ':', 1 )[1].split()
+      return any( os.path.getmtime( dep ) > obj_time for dep in deps )
+    except OSError:
+      return True
+
+  def run_cc( s, m, config, cmd ):
+    try:
+      config.vprint(f"{cmd}", 4)
+      subprocess.check_output( cmd, stderr = subprocess.STDOUT, shell = True,
+                               universal_newlines=True )
+    except subprocess.CalledProcessError as e:
+      err_msg = e.output if not isinstance(e.output, bytes) else \
+                e.output.decode('utf-8')
+      import_err_msg = \
+          f"Failed to compile Verilated model into a shared library:\n"\
+          f"  C compiler command:\n{indent(cmd, '  ')}\n\n"\
+          f"  C compiler output:\n{indent(wrap(err_msg), '  ')}\n"
+      raise SVerilogImportError(m, import_err_msg) from e
+
+  #-----------------------------------------------------------------------
+  # Model cache
+  #-----------------------------------------------------------------------
+  # The model cache is a directory shared by all working directories. Each
+  # entry is a directory named after the cache key of a model and holds its
+  # shared lib. Entries are created and removed by renaming so that
+  # concurrent imports never see a partially written entry.
+
+  def get_model_cache_key( s, m, config, cached ):
+    """Return the cache key of the verilated model, None if not cacheable.
+
+    The key is a hash of the import options, the tool versions, and the
+    content of every file the shared lib is built from.
+    """
+    if not config.is_cache_enabled():
+      return None
+
+    # Only components translated by pymtl translation passes will be cached
+    try:
+      s.get_translation_namespace( m )
+    except AttributeError:
+      return None
+
+    # The shared lib in the current directory is reused anyway
+    if cached and not config.is_vl_trace_enabled():
+      return None
+
+    srcs = [ config.get_option( "vl_src" ), config.get_c_wrapper_path() ]
+    srcs += config.get_option( "c_srcs" )
+    if config.is_top_wrapper():
+      srcs.append( config.get_param_include() )
+    if not config.is_default( "vl_threads_profile" ):
+      srcs.append( config.get_option( "vl_threads_profile" ) )
+
+    key = blake2b( digest_size=16 )
+    key.update( repr( config.get_model_options() ).encode() )
+    key.update( repr( config.get_tool_versions() ).encode() )
+    try:
+      for src in srcs:
+        with open( expand( src ), 'rb' ) as src_file:
+          key.update( src_file.read() )
+    except OSError:
+      return None
+    return key.hexdigest()
+
+  def fetch_cached_model( s, config, key ):
+    """Copy the cached shared lib of `key` to the current directory.
+
+    Return whether the model was found in the cache.
+    """
+    config.vprint("\n=====Fetch cached model=====")
+    entry = os.path.join( config.get_cache_dir(), key )
+    shared_lib = config.get_shared_lib_path()
+    try:
+      fd, tmp = tempfile.mkstemp( suffix = '.so', dir = '.' )
+      os.close( fd )
+      try:
+        shutil.copyfile( os.path.join( entry, shared_lib ), tmp )
+        os.replace( tmp, shared_lib )
+      finally:
+        if os.path.exists( tmp ):
+          os.remove( tmp )
+      # Mark the entry as recently used
+      os.utime( entry )
+    except OSError:
+      config.vprint(f"{config.get_top_module()} not found in the model cache", 2)
+      return False
+    config.vprint(f"Fetched shared library {shared_lib} from {entry}!", 2)
+    return True
+
+  def store_cached_model( s, config, key ):
+    """Add the shared lib in the current directory to the model cache."""
+    cache_dir = config.get_cache_dir()
+    shared_lib = config.get_shared_lib_path()
+    try:
+      os.makedirs( cache_dir, exist_ok = True )
+      tmp = tempfile.mkdtemp( prefix = '.tmp-', dir = cache_dir )
+      shutil.copyfile( shared_lib, os.path.join( tmp, shared_lib ) )
+      try:
+        os.rename( tmp, os.path.join( cache_dir, key ) )
+      except OSError:
+        # Another import has stored the same model
+        shutil.rmtree( tmp, ignore_errors = True )
+      else:
+        config.vprint(f"Stored shared library {shared_lib} in {cache_dir}!", 2)
+    except OSError as e:
+      config.vprint(f"Failed to store {shared_lib} in the model cache: {e}", 2)
+      return
+    s.evict_cached_models( config, key )
+
+  def evict_cached_models( s, config, keep ):
+    """Remove least recently used models until the cache fits its limit."""
+    max_bytes = config.get_cache_max_bytes()
+    if max_bytes == 0:
+      return
+
+    cache_dir = config.get_cache_dir()
+    entries = []
+    for name in os.listdir( cache_dir ):
+      entry = os.path.join( cache_dir, name )
+      if name.startswith( '.' ) or name == keep:
+        continue
+      try:
+        size = sum( os.path.getsize( os.path.join( entry, f ) ) \
+                    for f in os.listdir( entry ) )
+        entries.append( ( os.path.getmtime( entry ), size, name ) )
+      except OSError:
+        continue
+
+    try:
+      total = sum( os.path.getsize( os.path.join( cache_dir, keep, f ) ) \
+                   for f in os.listdir( os.path.join( cache_dir, keep ) ) )
+    except OSError:
+      total = 0
+    total += sum( size for _, size, _ in entries )
+
+    for _, size, name in sorted( entries ):
+      if total <= max_bytes:
+        break
+      # Move the entry out of the way first so that it is never fetched
+      # while being removed
+      evicted = os.path.join( cache_dir, f".evict-{name}-{os.getpid()}" )
+      try:
+        os.rename( os.path.join( cache_dir, name ), evicted )
+      except OSError:
+        continue
+      shutil.rmtree( evicted, ignore_errors = True )
+      total -= size
+      config.vprint(f"Evicted {name} from the model cache", 2)
+
   #-----------------------------------------------------------------------
   # create_py_wrapper
   #-----------------------------------------------------------------------
@@ -322,10 +596,23 @@ class ImportPass( BasePass ):
     make_indent( wire_defs, 2 )
 
     # Set upblk inputs and outputs
-    set_comb_input = s.gen_comb_input( packed_ports )
-    set_comb_output = s.gen_comb_output( packed_ports )
+    clk = 'inv_clk' if not config.has_clk() else \
+          next(filter(lambda x: x[0]=='clk', packed_ports))[1]
+    in_ports, out_ports = s.gen_port_words( packed_ports )
+    if config.is_port_buffered():
+      set_comb_input = s.gen_buffered_comb_input( in_ports )
+      set_comb_output = s.gen_buffered_comb_output( out_ports )
+      comb_eval = "_ffi_inst.eval_words( _ffi_m )"
+      seq_eval = [ "_ffi_inst.tick_words( _ffi_m )" ]
+    else:
+      set_comb_input = s.gen_comb_input( packed_ports )
+      set_comb_output = s.gen_comb_output( packed_ports )
+      comb_eval = "_ffi_inst.eval( _ffi_m )"
+      seq_eval = [ f"_ffi_m.{clk}[0] = 0", "_ffi_inst.eval( _ffi_m )",
+                   f"_ffi_m.{clk}[0] = 1", "_ffi_inst.eval( _ffi_m )" ]
     make_indent( set_comb_input, 3 )
     make_indent( set_comb_output, 3 )
+    make_indent( seq_eval, 4 )
 
     # Generate constraints for sequential block
     constraints = s.gen_constraints( packed_ports )
@@ -345,29 +632,49 @@ constraint_list = [
     # Internal line trace
     in_line_trace = s.gen_internal_line_trace_py( packed_ports )
 
+    # Layout of the port words
+    in_ports_layout = s.gen_port_words_layout_py( in_ports )
+    out_ports_layout = s.gen_port_words_layout_py( out_ports )
+
     # Fill in the python wrapper template
-    if not cached:
-      with open( template_name, 'r' ) as template:
-        with open( wrapper_name, 'w' ) as output:
-          py_wrapper = template.read()
-          py_wrapper = py_wrapper.format(
-            component_name  = config.get_top_module(),
-            has_clk         = int(config.has_clk()),
-            clk             = 'inv_clk' if not config.has_clk() else \
-                              next(filter(lambda x: x[0]=='clk', packed_ports))[1],
-            lib_file        = config.get_shared_lib_path(),
-            port_cdefs      = ('  '*4+'\n').join( port_cdefs ),
-            port_defs       = '\n'.join( port_defs ),
-            wire_defs       = '\n'.join( wire_defs ),
-            connections     = '\n'.join( connections ),
-            set_comb_input  = '\n'.join( set_comb_input ),
-            set_comb_output = '\n'.join( set_comb_output ),
-            constraint_str  = constraint_str,
-            line_trace      = line_trace,
-            in_line_trace   = in_line_trace,
-            dump_vcd        = int(config.is_vl_trace_enabled())
-          )
-          output.write( py_wrapper )
+    with open( template_name, 'r' ) as template:
+      py_wrapper = template.read()
+      py_wrapper = py_wrapper.format(
+        component_name  = config.get_top_module(),
+        has_clk         = int(config.has_clk()),
+        port_buffer     = int(config.is_port_buffered()),
+        lib_file        = config.get_shared_lib_path(),
+        port_cdefs      = ('  '*4+'\n').join( port_cdefs ),
+        port_defs       = '\n'.join( port_defs ),
+        wire_defs       = '\n'.join( wire_defs ),
+        connections     = '\n'.join( connections ),
+        set_comb_input  = '\n'.join( set_comb_input ),
+        set_comb_output = '\n'.join( set_comb_output ),
+        comb_eval       = comb_eval,
+        seq_eval        = '\n'.join( seq_eval ),
+        n_in_ports      = len( in_ports ),
+        n_out_ports     = len( out_ports ),
+        in_words_len    = sum( p[4] for p in in_ports ) + 1,
+        out_words_len   = sum( p[4] for p in out_ports ) + 1,
+        constraint_str  = constraint_str,
+        line_trace      = line_trace,
+        in_line_trace   = in_line_trace,
+        in_ports        = in_ports_layout,
+        out_ports       = out_ports_layout,
+        dump_vcd        = int(config.is_vl_trace_enabled())
+      )
+
+    # The wrapper of a cached model is only rewritten if it changed, e.g.
+    # because `port_buffer` was toggled
+    try:
+      with open( wrapper_name, 'r' ) as output:
+        is_same = output.read() == py_wrapper
+    except OSError:
+      is_same = False
+
+    if not is_same:
+      with open( wrapper_name, 'w' ) as output:
+        output.write( py_wrapper )
 
     config.vprint(f"Successfully generated PyMTL wrapper {wrapper_name}!", 2)
     return symbols
@@ -914,6 +1221,133 @@ m->{name}{sub} = {deference}model->{name}{sub};
         ret += s.gen_port_array_output( lhs, rhs, dtype, p_n_dim )
     return ret
 
+  #-------------------------------------------------------------------------
+  # gen_port_words
+  #-------------------------------------------------------------------------
+  # The port words of the C wrapper are a flat representation of all ports
+  # in arrays of 32-bit words. They are the stimulus and response buffers of
+  # `run_cycles` and the port buffers of `eval_words`. Each port (or element
+  # of a port array) takes (nbits-1)//32+1 words, least significant word
+  # first, in the order of the packed ports.
+
+  def gen_port_words( s, packed_ports ):
+    """Return the input and output ports in the port words.
+
+    Each port is a tuple (name, c_ref, nbits, offset, nwords) where `name`
+    is the PyMTL name of the port with indices of port arrays, `c_ref` is
+    the port field of the C wrapper, and `offset` and `nwords` are the
+    location of the port in the words.
+    """
+    def flatten( name, c_ref, n_dim ):
+      if not n_dim:
+        return [ ( name, c_ref ) ]
+      else:
+        ret = []
+        for idx in range( n_dim[0] ):
+          ret += flatten( f"{name}[{idx}]", f"{c_ref}[{idx}]", n_dim[1:] )
+        return ret
+
+    in_ports, out_ports = [], []
+    for py_name, v_name, rtype in packed_ports:
+      p_n_dim, p_rtype = s._get_rtype( rtype )
+      direction = s._get_direction( p_rtype )
+      # Only the C wrapper drives `clk`
+      if not v_name or py_name == 'clk' and direction == 'InPort':
+        continue
+      ports = in_ports if direction == 'InPort' else out_ports
+      nbits = p_rtype.get_dtype().get_length()
+      nwords = (nbits-1)//32+1
+      c_ref = "m->"+s._verilator_name(v_name)
+      for name, ref in flatten( py_name, c_ref, p_n_dim ):
+        offset = ports[-1][3] + ports[-1][4] if ports else 0
+        ports.append( ( name, ref, nbits, offset, nwords ) )
+    return in_ports, out_ports
+
+  def gen_words_input_c( s, in_ports, hold = False ):
+    """Return C statements that read the input ports from words `in`.
+
+    If `hold` is True, input port `i` is skipped if `hold[i]` is set.
+    """
+    ret = []
+    for idx, ( name, c_ref, nbits, offset, nwords ) in enumerate( in_ports ):
+      cond = f"if ( !hold[{idx}] ) " if hold else ""
+      if nbits <= 32:
+        ret.append( f"{cond}*{c_ref} = in[{offset}];" )
+      elif nbits <= 64:
+        ret.append( f"{cond}*{c_ref} = (uint64_t) in[{offset}] | "
+                    f"(uint64_t) in[{offset+1}] << 32;" )
+      else:
+        ret.append( f"{cond}{{" )
+        for i in range( nwords ):
+          ret.append( f"  {c_ref}[{i}] = in[{offset+i}];" )
+        ret.append( "}" )
+    return ret
+
+  def gen_words_output_c( s, out_ports ):
+    """Return C statements that write the output ports to words `out`."""
+    ret = []
+    for name, c_ref, nbits, offset, nwords in out_ports:
+      if nbits <= 32:
+        ret.append( f"out[{offset}] = *{c_ref};" )
+      elif nbits <= 64:
+        ret.append( f"out[{offset}] = (uint32_t) *{c_ref};" )
+        ret.append( f"out[{offset+1}] = (uint32_t) ( *{c_ref} >> 32 );" )
+      else:
+        for i in range( nwords ):
+          ret.append( f"out[{offset+i}] = {c_ref}[{i}];" )
+    return ret
+
+  def gen_port_words_layout_py( s, ports ):
+    """Return the literal of the {name: (offset, nwords, nbits)} layout."""
+    ret = [ "{" ]
+    for name, c_ref, nbits, offset, nwords in ports:
+      ret.append( f"  {name!r} : ( {offset}, {nwords}, {nbits} )," )
+    ret.append( "}" )
+    make_indent( ret, 1 )
+    return '\n'.join( ret ).lstrip()
+
+  #-------------------------------------------------------------------------
+  # gen_buffered_comb_input
+  #-------------------------------------------------------------------------
+  # With `port_buffer` enabled the wrapper marshals the ports through the
+  # port words and only converts the ports whose values changed since the
+  # last evaluation. `_in_prev` and `_out_prev` hold the last values.
+
+  def gen_buffered_comb_input( s, in_ports ):
+    ret = []
+    for idx, ( name, c_ref, nbits, offset, nwords ) in enumerate( in_ports ):
+      wire = "s.mangled__"+s._verilator_name(name)
+      ret += [
+        f"_v = int({wire})",
+        f"if _v != _in_prev[{idx}]:",
+        f"  _in_prev[{idx}] = _v",
+      ]
+      if nwords == 1:
+        ret.append( f"  _in_words[{offset}] = _v" )
+      else:
+        for i in range( nwords ):
+          ret.append( f"  _in_words[{offset+i}] = ( _v >> {32*i} ) & 0xffffffff" )
+    return ret
+
+  #-------------------------------------------------------------------------
+  # gen_buffered_comb_output
+  #-------------------------------------------------------------------------
+
+  def gen_buffered_comb_output( s, out_ports ):
+    ret = []
+    for idx, ( name, c_ref, nbits, offset, nwords ) in enumerate( out_ports ):
+      wire = "s.mangled__"+s._verilator_name(name)
+      words = " | ".join( f"_out_words[{offset}]" if i == 0 else \
+                          f"_out_words[{offset+i}] << {32*i}" \
+                          for i in range( nwords ) )
+      ret += [
+        f"_v = {words}",
+        f"if _v != _out_prev[{idx}]:",
+        f"  _out_prev[{idx}] = _v",
+        f"  {wire} = Bits{nbits}(_v)",
+      ]
+    return ret
+
   #-------------------------------------------------------------------------
   # gen_constraints
   #-------------------------------------------------------------------------
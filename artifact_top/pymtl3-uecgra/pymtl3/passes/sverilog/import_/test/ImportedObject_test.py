@@ -5,9 +5,14 @@
 # Date   : Jun 2, 2019
 """Test if the imported object works correctly."""
 
+import os
+
+import pytest
 
 from pymtl3.datatypes import Bits1, Bits32, Bits64, clog2, mk_bits
 from pymtl3.dsl import Component, InPort, Interface, OutPort, Placeholder, connect
+from pymtl3.passes import SimpleSim
+from pymtl3.passes.errors import InvalidPassOptionValue
 from pymtl3.passes.rtlir.util.test_utility import do_test
 from pymtl3.passes.sverilog import ImportConfigs, ImportPass
 from pymtl3.passes.sverilog.util.utility import get_dir
@@ -54,6 +59,54 @@ def test_reg( do_test ):
   a._tv_out = tv_out
   do_test( a )
 
+def test_reg_run_cycles():
+  class VReg( Component ):
+    def construct( s ):
+      s.clk = InPort( Bits1 )
+      s.reset = InPort( Bits1 )
+      s.in_ = InPort( Bits32 )
+      s.out = OutPort( Bits32 )
+      s.sverilog_import = ImportConfigs(
+          vl_src = get_dir(__file__)+'VReg.sv',
+          port_map = {
+            "clk" : "clk",
+            "reset" : "reset",
+            "in_" : "d",
+            "out" : "q",
+          }
+      )
+  a = VReg()
+  a.elaborate()
+  a.sverilog_import.fill_missing( a )
+  m = ImportPass().get_imported_object( a )
+  m.elaborate()
+  m.apply( SimpleSim )
+  m.sim_reset()
+  try:
+    # Drive the register from a stimulus buffer
+    ncycles = 8
+    stim = m.alloc_stimulus( ncycles )
+    resp = m.alloc_response( ncycles )
+    for i in range( ncycles ):
+      m.set_stimulus( stim, i, 'in_', i+1 )
+    assert m.run_cycles( ncycles, stim, resp, hold = ['reset'] ) == ncycles
+    for i in range( 1, ncycles ):
+      assert m.get_response( resp, i, 'out' ) == Bits32( i )
+
+    # Stop as soon as the register has been 5 for one cycle
+    assert m.run_cycles( ncycles, stim, resp, watch = [('out', 5, 1)] ) == 6
+
+    # Hold all inputs at the values of the last cycle
+    assert m.run_cycles( 2, response = resp ) == 2
+    assert m.get_response( resp, 0, 'out' ) == Bits32( 6 )
+    assert m.get_response( resp, 1, 'out' ) == Bits32( 6 )
+
+    # The PyMTL simulation continues from the last cycle
+    m.tick()
+    assert m.out == Bits32( 6 )
+  finally:
+    m.finalize()
+
 def test_adder( do_test ):
   def tv_in( m, test_vector ):
     m.in0 = Bits32( test_vector[0] )
@@ -83,6 +136,140 @@ def test_adder( do_test ):
   a._tv_out = tv_out
   do_test( a )
 
+def test_adder_incremental_build( tmpdir ):
+  def tv_in( m, test_vector ):
+    m.in0 = Bits32( test_vector[0] )
+    m.in1 = Bits32( test_vector[1] )
+    m.cin = Bits1( test_vector[2] )
+  def tv_out( m, test_vector ):
+    assert m.out == Bits32( test_vector[3] )
+    assert m.cout == Bits32( test_vector[4] )
+  class VAdder( Component ):
+    def construct( s ):
+      s.clk = InPort( Bits1 )
+      s.reset = InPort( Bits1 )
+      s.in0 = InPort( Bits32 )
+      s.in1 = InPort( Bits32 )
+      s.cin = InPort( Bits1 )
+      s.out = OutPort( Bits32 )
+      s.cout = OutPort( Bits1 )
+      s.sverilog_import = ImportConfigs(
+          vl_src = get_dir(__file__)+'VAdder.sv',
+          c_incremental = True,
+          c_opt_level = 2,
+          c_runtime_dir = str(tmpdir),
+      )
+  # The verilator runtime objects are only compiled by the first import
+  runtime_objs = None
+  for _ in range( 2 ):
+    a = VAdder()
+    a._test_vectors = [
+      [    1,      1,     1,     3, 0 ],
+      [   42,    -43,     1,     0, 1 ],
+    ]
+    a._tv_in = tv_in
+    a._tv_out = tv_out
+    local_do_test( a )
+    objs = { f: os.path.getmtime( str(tmpdir.join(f)) ) for f in os.listdir( str(tmpdir) ) }
+    assert objs and ( runtime_objs is None or objs == runtime_objs )
+    runtime_objs = objs
+
+def test_adder_port_buffer():
+  class VAdder( Component ):
+    def construct( s ):
+      s.clk = InPort( Bits1 )
+      s.reset = InPort( Bits1 )
+      s.in0 = InPort( Bits32 )
+      s.in1 = InPort( Bits32 )
+      s.cin = InPort( Bits1 )
+      s.out = OutPort( Bits32 )
+      s.cout = OutPort( Bits1 )
+      s.sverilog_import = ImportConfigs(
+          vl_src = get_dir(__file__)+'VAdder.sv',
+          port_buffer = True,
+      )
+  a = VAdder()
+  a.elaborate()
+  a.sverilog_import.fill_missing( a )
+  m = ImportPass().get_imported_object( a )
+  m.elaborate()
+  m.apply( SimpleSim )
+  m.sim_reset()
+  try:
+    for in0, in1, cin, out, cout in [
+      [    1,      1,     1,     3, 0 ],
+      [    1,     -1,     0,     0, 1 ],
+      [   42,     42,     1,    85, 0 ],
+      [   42,    -43,     1,     0, 1 ],
+    ]:
+      m.in0 = Bits32( in0 )
+      m.in1 = Bits32( in1 )
+      m.cin = Bits1( cin )
+      m.tick()
+      assert m.out == Bits32( out )
+      assert m.cout == Bits1( cout )
+
+    # Ports written to the buffer directly stay until the PyMTL port changes
+    in_words, out_words = m.get_port_buffers()
+    in_words = memoryview( in_words ).cast( 'I' )
+    out_words = memoryview( out_words ).cast( 'I' )
+    in_words[ m._in_ports['in0'][0] ] = 100
+    m.tick()
+    assert out_words[ m._out_ports['out'][0] ] == 100 - 43 + 1
+    assert m.out == Bits32( 100 - 43 + 1 )
+  finally:
+    m.finalize()
+
+def test_adder_threads():
+  class VAdder( Component ):
+    def construct( s ):
+      s.clk = InPort( Bits1 )
+      s.reset = InPort( Bits1 )
+      s.in0 = InPort( Bits32 )
+      s.in1 = InPort( Bits32 )
+      s.cin = InPort( Bits1 )
+      s.out = OutPort( Bits32 )
+      s.cout = OutPort( Bits1 )
+      s.sverilog_import = ImportConfigs(
+          vl_src = get_dir(__file__)+'VAdder.sv',
+          vl_threads = 2,
+          # The adder is too small to be split across threads
+          vl_Wno_list = [ 'UNOPTTHREADS' ],
+      )
+  a = VAdder()
+  a.elaborate()
+  a.sverilog_import.fill_missing( a )
+  assert "--threads 2" in a.sverilog_import.create_vl_cmd()
+
+  # Multithreading options other than vl_threads require vl_threads > 0
+  vl_src = get_dir(__file__)+'VAdder.sv'
+  assert ImportConfigs( vl_src = vl_src, top_module = 'VAdder',
+      vl_threads = 2, vl_threads_max_mtasks = 4 ).check_options()
+  with pytest.raises( InvalidPassOptionValue ) as e:
+    ImportConfigs( vl_src = vl_src, top_module = 'VAdder',
+        vl_threads_max_mtasks = 4 ).check_options()
+  assert "vl_threads_max_mtasks" in str( e.value )
+
+  m = ImportPass().get_imported_object( a )
+  m.elaborate()
+  m.apply( SimpleSim )
+  m.sim_reset()
+  try:
+    for in0, in1, cin, out, cout in [
+      [    1,      1,     1,     3, 0 ],
+      [    1,     -1,     0,     0, 1 ],
+      [   42,     42,     1,    85, 0 ],
+      [   42,    -43,     1,     0, 1 ],
+    ]:
+      m.in0 = Bits32( in0 )
+      m.in1 = Bits32( in1 )
+      m.cin = Bits1( cin )
+      m.tick()
+      assert m.out == Bits32( out )
+      assert m.cout == Bits1( cout )
+  finally:
+    m.finalize()
+
 def test_normal_queue( do_test ):
   def tv_in( m, tv ):
     m.enq_en = Bits1( tv[0] )
@@ -5,8 +5,10 @@
 # Date   : Jun 5, 2019
 """Test ad-hoc components with SystemVerilog translation and import."""
 
+from pymtl3.datatypes import Bits1, Bits32
+from pymtl3.dsl import Component, InPort, OutPort
 from pymtl3.passes.rtlir.util.test_utility import do_test
-from pymtl3.passes.sverilog import TranslationImportPass
+from pymtl3.passes.sverilog import ImportConfigs, ImportPass, TranslationImportPass
 from pymtl3.stdlib.test import TestVectorSimulator
 
 from ..translation.behavioral.test.SVBehavioralTranslatorL1_test import (
@@ -90,3 +92,36 @@ def local_do_test( _m ):
     except UnboundLocalError:
       # This test fails due to translation errors
       pass
+
+def test_model_cache( tmpdir, monkeypatch ):
+  def tv_in( m, tv ):
+    m.in_ = Bits32( tv[0] )
+  def tv_out( m, tv ):
+    assert m.out == Bits32( tv[1] )
+  class A( Component ):
+    def construct( s ):
+      s.clk = InPort( Bits1 )
+      s.reset = InPort( Bits1 )
+      s.in_ = InPort( Bits32 )
+      s.out = OutPort( Bits32 )
+      @s.update
+      def upblk():
+        s.out = s.in_
+      s.sverilog_import = ImportConfigs(
+          vl_Wno_list = ['UNOPTFLAT', 'UNSIGNED'],
+          use_cache = True,
+          cache_dir = str(tmpdir.join('cache')),
+      )
+  def import_in( dirname ):
+    monkeypatch.chdir( tmpdir.mkdir( dirname ) )
+    a = A()
+    a._test_vectors = [ [ 1, 1 ], [ 42, 42 ], [ -1, -1 ] ]
+    a._tv_in = tv_in
+    a._tv_out = tv_out
+    local_do_test( a )
+  import_in( 'a' )
+  # The second import reuses the model verilated by the first one
+  def create_verilator_model( *args ):
+    assert False, "model should be fetched from the cache"
+  monkeypatch.setattr( ImportPass, 'create_verilator_model', create_verilator_model )
+  import_in( 'b' )
@@ -40,3 +40,15 @@ def expand( v ):
 
 def get_dir( cur_file ):
   return os.path.dirname(os.path.abspath(cur_file))+os.path.sep
+
+def get_user_cache_dir():
+  """Return the per-user directory where shared build products are kept.
+
+  $PYMTL_CACHE_DIR takes precedence; otherwise this is `pymtl3` under the
+  XDG cache directory (~/.cache by default).
+  """
+  cache_dir = os.environ.get("PYMTL_CACHE_DIR")
+  if not cache_dir:
+    xdg_cache = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    cache_dir = os.path.join(xdg_cache, "pymtl3")
+  return expand(cache_dir)
@@ -4,18 +4,58 @@
 #=========================================================================
 # Imports a DFG from a CGRA configuration files (json).
 #
+# The constructed graph is cached next to the json (as
+# <json>.graph.cache) so that later loads only need to unpickle it. The
+# cache is keyed on the contents of the json, on the dvfs modes and ops
+# that Graph.configure_json copies into the graph (conf_dvfs and conf_ops
+# in parameters.py), and on reader_version, so it is rebuilt whenever
+# any of them changes. Bump reader_version whenever
+# Graph.configure_json changes the graph it builds.
+#
 # Author : Christopher Torng
 # Date   : August 20, 2019
 #
 
-from Graph import Graph
+import hashlib
+import os
+import pickle
+
+from Graph      import Graph
+from parameters import conf_dvfs, conf_ops
+
+reader_version = 1
+
+# json_sha256
+#
+# Hash of the contents of a json, or None if there is no such file (e.g.,
+# for a DFG constructed in dfgs.py)
+
+def json_sha256( json ):
+  try:
+    with open( json, 'rb' ) as fd:
+      return hashlib.sha256( fd.read() ).hexdigest()
+  except OSError:
+    return None
 
 class DfgJsonReader():
 
-  def __init__( s, json ):
-    s.json = json
-    s.g    = Graph()
-    s.g.configure_json( json )
+  def __init__( s, json, cache=True ):
+    s.json    = json
+    s.cache_f = json + '.graph.cache' if cache else None
+
+    s.header = {
+      'version' : reader_version,
+      'sha256'  : json_sha256( json ),
+      'dvfs'    : conf_dvfs,
+      'ops'     : conf_ops,
+    }
+
+    s.g = s.load_cache()
+
+    if s.g is None:
+      s.g = Graph()
+      s.g.configure_json( json )
+      s.save_cache()
 
   def get( s ):
     return s.g
@@ -23,4 +63,48 @@ class DfgJsonReader():
   def plot( s ):
     s.g.plot( dot_f = s.json.split('/')[-1] + '.dot' )
 
+  # load_cache
+  #
+  # Returns the cached graph, or None if there is no cache or if it was
+  # built from a different json, parameters, or reader version. The
+  # header is pickled separately so that a stale cache is rejected
+  # without loading the graph.
+
+  def load_cache( s ):
+
+    if not s.cache_f:
+      return None
+
+    try:
+      with open( s.cache_f, 'rb' ) as fd:
+        if pickle.load( fd ) != s.header:
+          return None
+        g = pickle.load( fd )
+    except Exception:
+      return None
+
+    # The same json may be loaded through a different path
+
+    g.json = s.json
+
+    return g
+
+  # save_cache
+  #
+  # We write to a temporary file first so that concurrent loads never see
+  # a truncated cache.
+
+  def save_cache( s ):
+
+    if not s.cache_f:
+      return
+
+    tmp_f = s.cache_f + '.' + str( os.getpid() ) + '.tmp'
 
+    try:
+      with open( tmp_f, 'wb' ) as fd:
+        pickle.dump( s.header, fd, pickle.HIGHEST_PROTOCOL )
+        pickle.dump( s.g,      fd, pickle.HIGHEST_PROTOCOL )
+      os.replace( tmp_f, s.cache_f )
+    except OSError:
+      pass
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+#=========================================================================
+# EventQueue.py
+#=========================================================================
+# A binary-heap event queue that schedules node ticks for the
+# discrete-event Simulator.
+#
+# Events are (time, name) pairs. Events are popped in order of increasing
+# time, and events at the same time are popped in order of increasing
+# rank. The rank of each node is precomputed once from a tie-break policy
+# so that adding and popping an event costs O(log N) with no list scans.
+#
+
+import heapq
+
+#-------------------------------------------------------------------------
+# Tie-break policies
+#-------------------------------------------------------------------------
+# A tie-break policy takes the topological order of the graph and returns
+# a dictionary mapping each node name to its rank. Nodes with lower rank
+# tick first when they are scheduled at the same time.
+#
+# - reverse_topo : Tick in reverse topological order (the default). This
+#                  models hardware with input-registered nodes.
+# - topo         : Tick in topological order
+# - name         : Tick in lexical order of the node names
+#
+
+def rank_reverse_topo( order ):
+  return { name: i for i, name in enumerate( reversed( order ) ) }
+
+def rank_topo( order ):
+  return { name: i for i, name in enumerate( order ) }
+
+def rank_name( order ):
+  return { name: i for i, name in enumerate( sorted( order ) ) }
+
+tie_break_policies = {
+  'reverse_topo' : rank_reverse_topo,
+  'topo'         : rank_topo,
+  'name'         : rank_name,
+}
+
+#-------------------------------------------------------------------------
+# EventQueue
+#-------------------------------------------------------------------------
+
+class EventQueue( object ):
+
+  # The tie-break policy can either be the name of a policy registered in
+  # tie_break_policies or a callable with the same signature.
+
+  def __init__( s, order, policy='reverse_topo' ):
+
+    if callable( policy ):
+      rank_fn = policy
+    else:
+      assert policy in tie_break_policies, \
+        'Error: Unsupported tie-break policy "%s"' % policy
+      rank_fn = tie_break_policies[ policy ]
+
+    s.policy    = policy
+    s.rank      = rank_fn( list( order ) )
+    s.container = []
+
+  def add( s, time, name ):
+    heapq.heappush( s.container, ( time, s.rank[name], name ) )
+
+  def pop( s ):
+    time, _, name = heapq.heappop( s.container )
+    return time, name
+
+  def peek_time( s ):
+    return s.container[0][0]
+
+  def empty( s ):
+    return len( s.container ) == 0
+
+  def clear( s ):
+    s.container = []
+
+  # snapshot and restore
+  #
+  # A copy of a heap is still a heap, so saving and restoring the pending
+  # events is a list copy
+
+  def snapshot( s ):
+    return list( s.container )
+
+  def restore( s, events ):
+    s.container = list( events )
+
+  def __len__( s ):
+    return len( s.container )
+
@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+#=========================================================================
+# Explorer.py
+#=========================================================================
+# An exploration engine that sweeps every voltage-frequency configuration
+# of a DFG (i.e., the green dots in Figure 3 of the paper).
+#
+# Nodes are assigned to groups, and each group sweeps over a grid of
+# voltages. The points of the sweep are split into shards and evaluated
+# on a pool of worker processes. Each worker builds its PowerModel (and
+# Simulator) once and reuses it for every point it evaluates.
+#
+# Results stream into a checkpoint file as each shard finishes, so an
+# interrupted sweep resumes where it left off. When the sweep completes,
+# all results are written in columnar form (one list per field, in sweep
+# order) to the output file, which plot-explore.py reads directly.
+#
+# Usage:
+#
+#     % python Explorer.py
+#     % python Explorer.py -j 8
+#
+
+import argparse
+import itertools
+import json
+import os
+
+from multiprocessing import Pool
+
+from PowerModel import PowerModel
+
+#-------------------------------------------------------------------------
+# Worker
+#-------------------------------------------------------------------------
+# Each worker process keeps one PowerModel around for the whole sweep.
+
+_worker = {}
+
+def _worker_init( dfg, groups, ops, PERF_N, E_N ):
+  model = PowerModel( graph = dfg().get() )
+  if ops:
+    model.set_op_range( ops )
+  _worker['model']  = model
+  _worker['groups'] = groups
+  _worker['PERF_N'] = PERF_N
+  _worker['E_N']    = E_N
+
+def _worker_run( shard ):
+  model  = _worker['model']
+  groups = _worker['groups']
+  rows   = []
+  for i, Vs in shard:
+    V_range = {}
+    for group, V in zip( groups, Vs ):
+      for node_name in group:
+        V_range[node_name] = V
+    model.set_V_range( V_range )
+    model.calc_performance()
+    perf = _worker['PERF_N'] / model.latency
+    ee   = _worker['E_N']    / model.E_cgra_total()
+    rows.append( [ i, perf, ee ] )
+  return rows
+
+#-------------------------------------------------------------------------
+# Explorer
+#-------------------------------------------------------------------------
+
+class Explorer( object ):
+
+  # - dfg    : DFG class (e.g., ToyDfg4) that builds the graph with get()
+  # - groups : List of groups, each a list of node names that share a
+  #            voltage
+  # - Vs     : Voltage grid swept by every group
+  # - ops    : Optional dict of node name to op (see set_op_range)
+
+  def __init__( s, dfg, groups, Vs, ops=None, processes=None,
+                                             shard_size=32 ):
+
+    s.dfg        = dfg
+    s.groups     = groups
+    s.Vs         = Vs
+    s.ops        = ops
+    s.processes  = processes or os.cpu_count()
+    s.shard_size = shard_size
+
+  # points
+  #
+  # All points of the sweep in order, with the first group varying the
+  # slowest
+
+  def points( s ):
+    return list( itertools.product( s.Vs, repeat=len( s.groups ) ) )
+
+  # label
+  #
+  # Label of a point, e.g., "0.61_0.90_1.23_0.90_0.90_0.90"
+
+  def label( s, Vs ):
+    return '_'.join( '{:3.2f}'.format( V ) for V in Vs )
+
+  # nominal
+  #
+  # Latency and energy of the DFG as built (i.e., all nodes at nominal
+  # voltage), which every point is normalized to
+
+  def nominal( s ):
+    model = PowerModel( graph = s.dfg().get() )
+    model.calc_performance()
+    return model.latency, model.E_cgra_total()
+
+  # load_checkpoint
+  #
+  # Returns the rows (indexed by point) in the checkpoint file. A
+  # partially written last line (e.g., from a killed run) is ignored.
+
+  def load_checkpoint( s, ckpt_f ):
+    done = {}
+    if not os.path.exists( ckpt_f ):
+      return done
+    with open( ckpt_f, 'r' ) as fd:
+      for line in fd:
+        try:
+          rows = json.loads( line )
+        except ValueError:
+          break
+        for i, perf, ee in rows:
+          done[i] = ( perf, ee )
+    return done
+
+  # run
+  #
+  # Run the sweep and dump the columnar results to dumpfile
+
+  def run( s, dumpfile ):
+
+    ckpt_f = dumpfile + '.ckpt'
+
+    points = s.points()
+    done   = s.load_checkpoint( ckpt_f )
+
+    todo   = [ ( i, Vs ) for i, Vs in enumerate( points ) if i not in done ]
+    shards = [ todo[ k : k + s.shard_size ]
+                 for k in range( 0, len( todo ), s.shard_size ) ]
+
+    print( 'Exploring {} points ({} from checkpoint) on {} processes'
+             .format( len( points ), len( done ), s.processes ) )
+
+    if shards:
+
+      PERF_N, E_N = s.nominal()
+
+      initargs = ( s.dfg, s.groups, s.ops, PERF_N, E_N )
+
+      with open( ckpt_f, 'a' ) as fd, \
+           Pool( s.processes, _worker_init, initargs ) as pool:
+        for rows in pool.imap_unordered( _worker_run, shards ):
+          fd.write( json.dumps( rows ) + '\n' )
+          fd.flush()
+          for i, perf, ee in rows:
+            done[i] = ( perf, ee )
+          print( '- {:6} of {:6} points'.format( len( done ),
+                                                   len( points ) ) )
+
+    # Dump columnar results in sweep order
+
+    data = { 'ee' : [], 'label' : [], 'perf' : [] }
+
+    for i, Vs in enumerate( points ):
+      perf, ee = done[i]
+      data['ee'].append( ee )
+      data['label'].append( s.label( Vs ) )
+      data['perf'].append( perf )
+
+    tmp_f = dumpfile + '.tmp'
+    with open( tmp_f, 'w' ) as fd:
+      json.dump( data, fd, sort_keys=True, indent=4,
+        separators=(',', ': ') )
+    os.replace( tmp_f, dumpfile )
+
+    if os.path.exists( ckpt_f ):
+      os.remove( ckpt_f )
+
+    return data
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+  from task_explore import DFG, explore_groups, explore_ops, explore_Vs
+
+  parser = argparse.ArgumentParser( description='Sweep the VF space' )
+  parser.add_argument( '-j', '--processes', type=int, default=None,
+    help='Number of worker processes (default: number of cpus)' )
+  parser.add_argument( '-o', '--output',
+    default='explore-data/plot-explore-list.json',
+    help='Columnar output file (read by plot-explore.py)' )
+  args = parser.parse_args()
+
+  explorer = Explorer( dfg       = DFG,
+                       groups    = explore_groups,
+                       Vs        = explore_Vs,
+                       ops       = explore_ops,
+                       processes = args.processes )
+
+  explorer.run( args.output )
+
@@ -10,6 +10,7 @@
 #
 
 import json
+import os
 
 from Node import Node
 from parameters import conf_dvfs, conf_ops
@@ -27,6 +28,16 @@ class Graph( object ):
 
     s.recurrence_edges = []
 
+    # Cached topological order and rank of each node in it (None if stale).
+    # Any change to the nodes or edges invalidates the cache.
+
+    s.topo_order = None
+    s.topo_rank  = None
+
+    # Edges broken by the last topological sort to break cycles
+
+    s.broken_edges = []
+
     # JSON file for dumping
 
     s.json = 'graph.json'
@@ -38,12 +49,14 @@ class Graph( object ):
     assert key not in s.nodes.keys(), \
       'Duplicate node %s! If this is intentional, first change the node name' % key
     s.nodes[ key ] = node
+    s.invalidate_order()
 
   def get_node( s, node_name ):
     return s.nodes[ node_name ]
 
   def delete_node( s, node_name ):
     del s.nodes[ node_name ]
+    s.invalidate_order()
 
   def all_nodes( s ):
     return s.nodes.keys()
@@ -92,8 +105,12 @@ class Graph( object ):
     if recurrence:
       s.recurrence_edges.append( (src_name, dst_name) )
 
+    s.invalidate_order()
+
   def disconnect( s, src_name, dst_name, recurrence=False ):
 
+    s.invalidate_order()
+
     if src_name in s.dsts_adjlist.keys():
       if dst_name in s.dsts_adjlist[ src_name ]:
         s.dsts_adjlist[ src_name ].remove( dst_name )
@@ -110,66 +127,215 @@ class Graph( object ):
   # Ordering
   #-----------------------------------------------------------------------
 
+  # topological_sort
+  #
+  # Kahn's algorithm in O(V+E), ignoring the recurrence edges. Nodes are
+  # visited in the order they were added to the graph, and the fanout of
+  # each node is visited in that order too, so the result is
+  # deterministic.
+  #
+  # Breaking a cycle for topo sort
+  #
+  # If nodes are left but none of them is ready, the remaining edges form
+  # a cycle. We then break a single edge on that cycle (see
+  # find_cycle_edge) and carry on, one edge per stall. Nodes that are
+  # merely downstream of a cycle keep their edges. The broken edges are
+  # kept in broken_edges.
+  #
+  # The order is cached until the graph changes. This returns a copy, so
+  # callers are free to modify it.
+
   def topological_sort( s ):
+    if s.topo_order is None:
+      s.topo_order = s.calc_topological_sort()
+      s.topo_rank  = { name: i for i, name in enumerate( s.topo_order ) }
+    return list( s.topo_order )
+
+  # topological_rank
+  #
+  # Position of each node in the topological order
 
-    order = []
+  def topological_rank( s ):
+    if s.topo_rank is None:
+      s.topological_sort()
+    return s.topo_rank
 
-    # Make a deep copy of the edges (destructive algorithm)
+  def invalidate_order( s ):
+    s.topo_order = None
+    s.topo_rank  = None
 
-    adjlist = {}
-    for node_name, src_list in s.srcs_adjlist.items():
-      adjlist[ node_name ] = list(src_list)
+  def calc_topological_sort( s ):
 
-    # Remove any recurrence edges
+    names = list( s.all_nodes() )
+    index = { name: i for i, name in enumerate( names ) }
 
-    for e in s.recurrence_edges:
-      src_name, dst_name = e
-      idx = adjlist[ dst_name ].index( src_name )
-      del( adjlist[ dst_name ][ idx ] )
+    # Count the input edges of each node, without the recurrence edges
 
-    # Consider all nodes in the graph
+    recurrence = set( s.recurrence_edges )
 
-    nodes = set( s.all_nodes() )
+    n_deps = { name: 0 for name in names }
+
+    for name in names:
+      for src in s.get_srcs( name ):
+        if ( src, name ) not in recurrence:
+          n_deps[ name ] += 1
 
     # Topological sort
 
-    while( nodes ):
+    order   = []
+    done    = set()
+    ready   = [ name for name in names if n_deps[ name ] == 0 ]
+    head    = 0 # next node in ready to visit
+    broken  = set()
 
-      nodes_with_deps    = set( adjlist.keys() )
-      nodes_without_deps = nodes.difference( nodes_with_deps )
+    s.broken_edges = []
 
-      order.extend( nodes_without_deps )
-      nodes = nodes_with_deps
+    while len( order ) < len( names ):
 
-      keys_to_delete = []
-      for node_name, src_list in adjlist.items():
-        idx_to_delete = []
-        for i, src in enumerate( src_list ):
-          if src in order:
-            idx_to_delete.append( i )
-        for i in reversed( idx_to_delete ):
-          del( src_list[i] )
-        if src_list == []:
-          keys_to_delete.append( node_name )
+      if head == len( ready ):
 
-      for k in keys_to_delete:
-        del( adjlist[k] )
+        src, name = s.find_cycle_edge( names, n_deps, done, recurrence,
+                                       broken )
 
-      # Breaking a cycle for topo sort
-      #
-      # - If we detect a cycle, break a random edge
-      #
+        print( 'Note: Breaking edge -- from', src, 'to', name )
+        s.broken_edges.append( ( src, name ) )
+        broken.add( ( src, name ) )
+
+        n_deps[ name ] -= 1
+        if n_deps[ name ] == 0:
+          ready.append( name )
+        continue
 
-      if not nodes_without_deps:
-        any_node = list(nodes)[0]
-        print( 'Note: Randomly breaking edge -- from', \
-                 adjlist[any_node][-1], 'to', any_node )
-        del( adjlist[any_node][-1] )
-        if adjlist[any_node] == []:
-          del( adjlist[any_node] )
+      name  = ready[ head ]
+      head += 1
+
+      order.append( name )
+      done.add( name )
+
+      for dst in sorted( s.get_dsts( name ), key=index.get ):
+        if ( name, dst ) in recurrence or ( name, dst ) in broken:
+          continue
+        n_deps[ dst ] -= 1
+        if n_deps[ dst ] == 0:
+          ready.append( dst )
 
     return order
 
+  # find_cycle_edge
+  #
+  # Returns an edge ( src, name ) to break when the topological sort
+  # stalls. An edge is on a cycle of the remaining edges if and only if
+  # both of its nodes are in the same strongly connected component (see
+  # find_components), so only those edges are considered.
+  #
+  # - Edges into phi nodes are broken last. A phi node that comes first
+  #   in its loop ticks after the rest of the loop (in reverse
+  #   topological order), so a token from the loop can overwrite its
+  #   initial token before it is delivered. The loop then loses its token
+  #   and the Simulator deadlocks (see ThroughputBound.lost_tokens).
+  # - Otherwise, we pick the edge that makes the most nodes ready once it
+  #   is broken, so that as few edges as possible are broken overall.
+  #   Only an edge into a node with no other input edge left makes any
+  #   node ready.
+  # - Ties go to the earliest added node and then to the latest added
+  #   src.
+  #
+  # Finding the components costs O(V+E), and counting the nodes that
+  # become ready costs O(V+E) per edge into a node with one input edge
+  # left, so this is O(E(V+E)) per broken edge in the worst case. It only
+  # runs when the sort stalls, once per broken edge.
+
+  def find_cycle_edge( s, names, n_deps, done, recurrence, broken ):
+
+    index = { name: i for i, name in enumerate( names ) }
+
+    def dsts_left( src ):
+      return [ dst for dst in s.get_dsts( src )
+                 if dst not in done and ( src, dst ) not in recurrence
+                                    and ( src, dst ) not in broken ]
+
+    component = s.find_components(
+      [ name for name in names if name not in done ], dsts_left )
+
+    # Number of nodes that become ready if the edge is broken
+
+    def n_ready( edge ):
+      if n_deps[ edge[1] ] != 1:
+        return 0
+      deps  = {}
+      stack = [ edge[1] ]
+      count = 0
+      while stack:
+        src    = stack.pop()
+        count += 1
+        for dst in dsts_left( src ):
+          if ( src, dst ) != edge:
+            deps[ dst ] = deps.get( dst, n_deps[ dst ] ) - 1
+            if deps[ dst ] == 0:
+              stack.append( dst )
+      return count
+
+    best = None
+
+    for src in component:
+      for name in dsts_left( src ):
+        if component[ name ] == component[ src ]:
+          key = ( s.get_node( name ).op != 'phi', n_ready( ( src, name ) ),
+                  -index[ name ], index[ src ] )
+          if best is None or key > best[0]:
+            best = ( key, ( src, name ) )
+
+    assert best, 'Error: Topological sort stalled without a cycle'
+
+    return best[1]
+
+  # find_components
+  #
+  # Tarjan's algorithm in O(V+E), without recursion so that long chains
+  # do not hit the recursion limit. Returns the component of each of the
+  # given nodes, following the edges given by dsts( name ).
+
+  def find_components( s, names, dsts ):
+
+    component = {}
+    lowlink   = {}
+    order     = {}
+    stack     = []
+    on_stack  = set()
+
+    for root in names:
+      if root in order:
+        continue
+      order[ root ] = lowlink[ root ] = len( order )
+      stack.append( root )
+      on_stack.add( root )
+      work = [ ( root, iter( dsts( root ) ) ) ]
+      while work:
+        name, it = work[-1]
+        dst = next( it, None )
+        if dst is not None:
+          if dst not in order:
+            order[ dst ] = lowlink[ dst ] = len( order )
+            stack.append( dst )
+            on_stack.add( dst )
+            work.append( ( dst, iter( dsts( dst ) ) ) )
+          elif dst in on_stack:
+            lowlink[ name ] = min( lowlink[ name ], order[ dst ] )
+          continue
+        work.pop()
+        if work:
+          src = work[-1][0]
+          lowlink[ src ] = min( lowlink[ src ], lowlink[ name ] )
+        if lowlink[ name ] == order[ name ]:
+          while True:
+            node = stack.pop()
+            on_stack.discard( node )
+            component[ node ] = name
+            if node == name:
+              break
+
+    return component
+
   #-----------------------------------------------------------------------
   # Import
   #-----------------------------------------------------------------------
@@ -208,9 +374,19 @@ class Graph( object ):
       else               : config['dvfs'] = 'sprint'
 
     new_json = s.json.split('.json')[0] + suffix + '.json'
-    with open( new_json, 'w' ) as fd:
-        json.dump( data, fd, sort_keys=True, indent=4,
-                       separators=(',', ': ') )
+    s.dump_json( data, new_json )
+
+  # dump_json
+  #
+  # Dump data to a json file. We write to a temporary file first so that
+  # readers (e.g., other mapping runs) never see a partially written file.
+
+  def dump_json( s, data, json_f ):
+    tmp_f = json_f + '.tmp'
+    with open( tmp_f, 'w' ) as fd:
+      json.dump( data, fd, sort_keys=True, indent=4,
+                     separators=(',', ': ') )
+    os.replace( tmp_f, json_f )
 
   # configure_json
   #
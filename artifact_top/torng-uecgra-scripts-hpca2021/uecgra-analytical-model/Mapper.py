@@ -0,0 +1,228 @@
+#! /usr/bin/env python
+#=========================================================================
+# Mapper.py
+#=========================================================================
+# A batch driver for the compiler power-mapping pass. Each job maps one
+# kernel with one objective, either performance-optimized (e.g., "bf")
+# or energy-optimized (e.g., "bf-eeff", where eeff is for 'energy
+# efficient').
+#
+# Jobs run concurrently on a pool of worker processes. Each job dumps
+# its graphviz .dot file and the log of its search to <job>.dot and
+# <job>.log, and the mapping outputs (.pre.groups, .pre.nodes,
+# .final.nodes, and the _dvfs.json config) next to the DFG json as
+# before. When all jobs are done, we print a summary with the time and
+# number of simulations that each job took.
+#
+# Usage:
+#
+#     % python Mapper.py                  # all jobs
+#     % python Mapper.py bf fft-eeff      # some jobs
+#     % python Mapper.py -j 4 --prune
+#
+
+import argparse
+import contextlib
+import os
+import time
+import traceback
+
+from multiprocessing import Pool
+
+from DfgJsonReader import DfgJsonReader
+from Simulator     import Simulator
+from PowerModel    import PowerModel
+
+#-------------------------------------------------------------------------
+# Kernels
+#-------------------------------------------------------------------------
+# DFG json of each kernel (None for the toy DFG built in dfgs.py)
+
+kernels = {
+  'toy'    : None,
+  'bf'     : 'jsons/bf_pro.json',
+  'dither' : 'jsons/dither.json',
+  'fft'    : 'jsons/fft_pro.json',
+  'llist'  : 'jsons/llist.json',
+  'susan'  : 'jsons/susan_pro.json',
+}
+
+all_jobs = list( kernels.keys() ) + [ k + '-eeff' for k in kernels.keys() ]
+
+def get_graph( kernel ):
+  if kernels[ kernel ] is None:
+    from dfgs import ToyDfg4 as toydfg
+    return toydfg().get()
+  return DfgJsonReader( kernels[ kernel ] ).get()
+
+#-------------------------------------------------------------------------
+# Worker
+#-------------------------------------------------------------------------
+# Maps a single job and returns its summary
+
+def _map( job, options ):
+
+  kernel            = job.split( '-eeff' )[0]
+  prioritize_energy = job.endswith( '-eeff' )
+
+  summary = { 'job': job, 'error': None }
+  start   = time.time()
+
+  with open( job + '.log', 'w' ) as fd, contextlib.redirect_stdout( fd ):
+    try:
+
+      g = get_graph( kernel )
+      g.plot( dot_f = job + '.dot' )
+
+      sim = Simulator( graph = g, verbose=False, do_plot=False )
+
+      p = PowerModel( graph = g, sim = sim, verbose=True,
+                      prune         = options['prune'],
+                      activity      = options['activity'],
+                      persist_cache = options['persist_cache'] )
+      p.autosearch( prioritize_energy = prioritize_energy,
+                    search            = options['search'],
+                    beam_width        = options['beam_width'],
+                    order             = options['order'] )
+
+      p.verbose = False
+      results   = p.compare()
+
+      summary['perf']  = results['throughput']
+      summary['eeff']  = results['eeff']
+      summary['sims']  = p.cache.stats()['misses']
+
+    except Exception:
+      traceback.print_exc( file = fd )
+      summary['error'] = 'see ' + job + '.log'
+
+  summary['time'] = time.time() - start
+
+  return summary
+
+def _map_star( args ):
+  return _map( *args )
+
+#-------------------------------------------------------------------------
+# Mapper
+#-------------------------------------------------------------------------
+
+class Mapper( object ):
+
+  # - jobs    : List of jobs (e.g., [ 'bf', 'bf-eeff' ])
+  # - options : Options passed to every PowerModel and autosearch
+
+  def __init__( s, jobs=None, processes=None, prune=False,
+                                              search='greedy',
+                                              beam_width=4,
+                                              order='index',
+                                              activity='global',
+                                              persist_cache=False ):
+
+    s.jobs      = jobs or all_jobs
+    s.processes = min( processes or os.cpu_count(), len( s.jobs ) )
+    s.options   = {
+      'prune'         : prune,
+      'search'        : search,
+      'beam_width'    : beam_width,
+      'order'         : order,
+      'activity'      : activity,
+      'persist_cache' : persist_cache,
+    }
+
+    for job in s.jobs:
+      assert job in all_jobs, \
+        'Unknown job %s (choose from %s)' % ( job, ' '.join( all_jobs ) )
+
+  # run
+  #
+  # Map all jobs and return their summaries in job order
+
+  def run( s ):
+
+    print( 'Mapping {} jobs on {} processes'.format( len( s.jobs ),
+                                                     s.processes ) )
+
+    start     = time.time()
+    summaries = {}
+
+    with Pool( s.processes ) as pool:
+      args = [ ( job, s.options ) for job in s.jobs ]
+      for summary in pool.imap_unordered( _map_star, args ):
+        summaries[ summary['job'] ] = summary
+        print( '- {:12} done in {:8.2f}s'.format( summary['job'],
+                                                   summary['time'] ) )
+
+    summaries = [ summaries[ job ] for job in s.jobs ]
+
+    s.print_summary( summaries, time.time() - start )
+
+    return summaries
+
+  # print_summary
+
+  def print_summary( s, summaries, elapsed ):
+
+    template = '{:12} {:>10} {:>8} {:>8} {:>8}'
+
+    print()
+    print( template.format( 'job', 'time (s)', 'sims', 'perf', 'eeff' ) )
+    print( '-' * 50 )
+
+    for summary in summaries:
+      if summary['error']:
+        print( template.format( summary['job'],
+                                '{:.2f}'.format( summary['time'] ),
+                                '-', '-', '-' ),
+               ' failed --', summary['error'] )
+        continue
+      print( template.format( summary['job'],
+                              '{:.2f}'.format( summary['time'] ),
+                              summary['sims'],
+                              '{:4.2f}x'.format( summary['perf'] ),
+                              '{:4.2f}x'.format( summary['eeff'] ) ) )
+
+    total = sum( summary['time'] for summary in summaries )
+
+    print( '-' * 50 )
+    print( 'Total {:.2f}s of mapping in {:.2f}s'.format( total, elapsed ) )
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser( description='Map kernels in batch' )
+  parser.add_argument( 'jobs', nargs='*',
+    help='Jobs to map, e.g., bf or bf-eeff (default: all of {})'.format(
+           ' '.join( all_jobs ) ) )
+  parser.add_argument( '-j', '--processes', type=int, default=None,
+    help='Number of worker processes (default: number of cpus)' )
+  parser.add_argument( '--prune', action='store_true',
+    help='Prune trial settings with the static throughput bound' )
+  parser.add_argument( '--search', choices=[ 'greedy', 'beam' ],
+    default='greedy', help='Phase 2 search (default: greedy)' )
+  parser.add_argument( '--beam-width', type=int, default=4,
+    help='Beam width for --search beam (default: 4)' )
+  parser.add_argument( '--order', choices=[ 'index', 'bottleneck' ],
+    default='index', help='Order of the groups in Phase 2 (default: index)' )
+  parser.add_argument( '--activity', choices=[ 'global', 'node' ],
+    default='global',
+    help='Scale dynamic power by the CGRA throughput or by the activity '
+         'of each node (default: global)' )
+  parser.add_argument( '--persist-cache', action='store_true',
+    help='Save simulated results next to each DFG json and reuse them in '
+         'later runs' )
+  args = parser.parse_args()
+
+  mapper = Mapper( jobs          = args.jobs,
+                   processes     = args.processes,
+                   prune         = args.prune,
+                   search        = args.search,
+                   beam_width    = args.beam_width,
+                   order         = args.order,
+                   activity      = args.activity,
+                   persist_cache = args.persist_cache )
+
+  mapper.run()
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+#=========================================================================
+# PerfCache.py
+#=========================================================================
+# A bounded least-recently-used (LRU) cache for performance results.
+#
+# The power-mapping pass evaluates many voltage-frequency settings, and
+# the same setting is often visited more than once (e.g., when a trial
+# setting is reverted). Since the simulated performance only depends on
+# the cycle time of each node, we key the cache on the per-node T vector
+# and skip re-simulating settings we have already seen.
+#
+# The cache can also be saved to and loaded from a json file so that
+# results can be shared across runs on the same DFG. A header describing
+# the graph and the simulator knobs is stored with the entries, and the
+# file is ignored if the header does not match.
+#
+
+from collections import OrderedDict
+
+import json
+import os
+import tempfile
+
+class PerfCache( object ):
+
+  def __init__( s, maxsize=4096 ):
+
+    s.maxsize = maxsize
+    s.entries = OrderedDict()
+
+    # Statistics
+
+    s.hits      = 0
+    s.misses    = 0
+    s.evictions = 0
+
+  # get
+  #
+  # Returns a copy of the cached value (or None on a miss) and marks the
+  # entry as most recently used
+
+  def get( s, key ):
+    if key in s.entries:
+      s.entries.move_to_end( key )
+      s.hits += 1
+      return dict( s.entries[key] )
+    s.misses += 1
+    return None
+
+  # put
+  #
+  # Inserts a value and evicts the least recently used entries if the
+  # cache is over capacity
+
+  def put( s, key, value ):
+    s.entries[key] = dict( value )
+    s.entries.move_to_end( key )
+    while len( s.entries ) > s.maxsize:
+      s.entries.popitem( last=False )
+      s.evictions += 1
+
+  def clear( s ):
+    s.entries.clear()
+
+  def __len__( s ):
+    return len( s.entries )
+
+  def __contains__( s, key ):
+    return key in s.entries
+
+  # stats
+
+  def stats( s ):
+    return {
+      'hits'      : s.hits,
+      'misses'    : s.misses,
+      'evictions' : s.evictions,
+      'entries'   : len( s.entries ),
+      'maxsize'   : s.maxsize,
+    }
+
+  # load
+  #
+  # Loads entries from a json file if it exists and was saved with the
+  # same header. Returns the number of entries loaded.
+
+  def load( s, json_f, header ):
+
+    try:
+      with open( json_f, 'r' ) as fd:
+        data = json.load( fd )
+    except ( FileNotFoundError, ValueError ):
+      return 0
+
+    if data.get( 'header' ) != header:
+      return 0
+
+    n = 0
+    for key, value in data['entries']:
+      s.put( tuple( key ), value )
+      n += 1
+
+    return n
+
+  # save
+  #
+  # Saves all entries (least recently used first) to a json file. We
+  # write to a temporary file first so that an interrupted run never
+  # leaves a truncated cache behind. The temporary file is unique, since
+  # several runs on the same DFG (e.g., bf and bf-eeff in Mapper.py) may
+  # save their caches at the same time.
+
+  def save( s, json_f, header ):
+
+    data = {
+      'header'  : header,
+      'entries' : [ [ list( k ), v ] for k, v in s.entries.items() ],
+    }
+
+    fd, tmp_f = tempfile.mkstemp( suffix = '.tmp',
+                                  dir = os.path.dirname( json_f ) or '.' )
+    try:
+      with os.fdopen( fd, 'w' ) as f:
+        json.dump( data, f )
+      os.replace( tmp_f, json_f )
+    finally:
+      if os.path.exists( tmp_f ):
+        os.remove( tmp_f )
+
@@ -12,11 +12,34 @@
 #
 
 from functools import reduce
+from multiprocessing import get_context
 
-from Simulator import Simulator
+from DfgJsonReader import json_sha256
+from PerfCache import PerfCache
+from Simulator import Simulator, perf_version
+from ThroughputBound import ThroughputBound
 from parameters import conf_dvfs
 
 import json
+import numpy as np
+
+#-------------------------------------------------------------------------
+# Worker
+#-------------------------------------------------------------------------
+# Worker processes are forked from the PowerModel that runs the search,
+# so each one starts with its own copy of the graph and simulator
+# (including the tick order and the hash seed, which the simulated
+# results depend on). Each job is a full per-node voltage setting.
+
+_worker = {}
+
+def _worker_init( model ):
+  _worker['model'] = model
+
+def _worker_run( V_range ):
+  model = _worker['model']
+  model.set_V_range( V_range )
+  return model.cache_key(), model.sim.calc_performance()
 
 #-------------------------------------------------------------------------
 # Calculate power
@@ -24,7 +47,13 @@ import json
 
 class PowerModel:
 
-  def __init__( s, graph, sim=None, verbose=False ):
+  def __init__( s, graph, sim=None, verbose=False, prune=False,
+                                                 prune_margin=1.10,
+                                                 cache_size=4096,
+                                                 persist_cache=False,
+                                                 warm_start=False,
+                                                 processes=1,
+                                                 activity='global' ):
 
     s.verbose = verbose
 
@@ -39,6 +68,83 @@ class PowerModel:
     if not sim:
       s.sim = Simulator( graph = s.g )
 
+    # Pruning with the static throughput bound
+    #
+    # If pruning is enabled, autosearch first estimates each trial setting
+    # with the static throughput bound and only confirms the setting with
+    # the simulator if the estimate, padded by the prune margin, could
+    # improve on the current results. Trial settings that are pruned are
+    # treated as not improving.
+
+    s.prune        = prune
+    s.prune_margin = prune_margin
+    s.bound        = ThroughputBound( graph = s.g )
+
+    s.n_trials = 0
+    s.n_pruned = 0
+
+    # Performance cache
+    #
+    # Simulated performance only depends on the cycle time of each node,
+    # so we memoize calc_performance on the per-node T vector. If
+    # persist_cache is set, the cache is loaded from and saved to a file
+    # next to the DFG json so that it carries across runs.
+
+    s.cache_names = sorted( s.g.all_nodes() )
+    s.cache       = PerfCache( maxsize = cache_size )
+    s.cache_f     = s.g.json + '.perf.cache' if persist_cache else None
+
+    # Warm start
+    #
+    # If warm start is enabled, simulations fork from a steady-state
+    # checkpoint of a base setting (see rebase) instead of running from
+    # time 0, and only the nodes whose T differs from the base setting
+    # are updated. Autosearch rebases whenever it accepts a new setting,
+    # so each trial setting is only a small change from the base. We keep
+    # the checkpoint (or None if steady state was not found) of every
+    # setting simulated from time 0 so that rebasing onto a setting that
+    # was already simulated cold does not simulate it again.
+
+    s.warm_start     = warm_start
+    s.checkpoint     = None
+    s.checkpoint_key = None
+    s.checkpoints    = {}
+
+    # Parallel evaluation
+    #
+    # With more than one process, autosearch speculatively simulates the
+    # trial settings it may visit next (see speculate) on a pool of
+    # forked workers. Their results wait in prefetched until the search
+    # actually asks for them, so the cache, the pruning, and the
+    # decisions are the same as in the serial search. Warm-start
+    # simulations depend on the current checkpoint, so they stay serial.
+
+    s.processes  = processes
+    s.pool       = None
+    s.prefetched = {}
+
+    # Activity
+    #
+    # By default (activity='global'), the dynamic power of each tile and
+    # sram scales with the throughput of the whole CGRA. With
+    # activity='node', it scales with the activity of its own node
+    # instead, i.e., how often the node fired per cycle in the simulation
+    # (see node_activity), so that nodes that rarely fire (e.g., on a
+    # branch that is rarely taken) draw less dynamic power.
+
+    assert activity in [ 'global', 'node' ], \
+      'Unknown activity %s' % activity
+
+    s.activity_mode = activity
+    s.activity      = None
+    s.perf          = None
+
+    if s.cache_f:
+      n = s.cache.load( s.cache_f, s.cache_header() )
+      if s.verbose:
+        print( 'Loaded {} cached performance results from {}'.format(
+                 n, s.cache_f ) )
+
     # Live-in and live-out nodes
     #
     # Track these nodes so we can use their voltages for the SRAMs
@@ -156,6 +262,20 @@ class PowerModel:
     s.P_alloc = s.N_T * s.P_tile_total( s.V_N, 'mul' ) \
               + s.N_S * s.P_sram_total( s.V_N )
 
+    # Array-backed node attributes
+    #
+    # The CGRA power and energy kernels are vectorized over the active
+    # nodes (in the order of s.nodes). We keep the voltage, cycle time,
+    # and op (as an index into alpha_ops) of each node in arrays, which
+    # set_V_node and set_op_range keep in sync with the graph. The sram
+    # counts track how many srams are attached to each node.
+
+    s.alpha_ops  = [ 'mul', 'alu', 'cp', 'cmp', 'byp', 'sram', 'phi', 'br',
+                     'const', 'zero' ]
+    s.node_index = { n.name: i for i, n in enumerate( s.nodes ) }
+
+    s.sync_arrays()
+
   # f
   #
   # A rough approximation of frequency vs voltage
@@ -199,6 +319,20 @@ class PowerModel:
     return \
       ( s.gamma * s.P_tile_dynamic( s.V_N, 'mul' ) ) / ( s.V_N * ( 1 - s.gamma ) )
 
+  # sync_arrays
+  #
+  # Rebuild the node attribute arrays from the graph (e.g., if nodes were
+  # modified without going through the power model)
+
+  def sync_arrays( s ):
+    s.V_array     = np.array( [ n.V for n in s.nodes ], dtype=float )
+    s.T_array     = np.array( [ n.T for n in s.nodes ], dtype=float )
+    s.alpha_index = np.array( [ s.alpha_ops.index( n.op ) for n in s.nodes ],
+                              dtype=int )
+    s.sram_count  = np.zeros( len( s.nodes ) )
+    for n in s.l_nodes:
+      s.sram_count[ s.node_index[ n.name ] ] += 1
+
   # alpha
   #
   # Dynamic power factors relative to a multiply
@@ -218,6 +352,13 @@ class PowerModel:
     }
     return alpha_dict[op]
 
+  # alpha_table
+  #
+  # Dynamic power factors for each op in alpha_ops
+
+  def alpha_table( s ):
+    return np.array( [ s.alpha( op ) for op in s.alpha_ops ] )
+
   # Tile power
   #
   # - P_tile_static depends on V (linear)
@@ -233,61 +374,74 @@ class PowerModel:
   def P_tile_static( s, V ):
     return V * s.I_L()
 
-  def P_tile_dynamic( s, V, op ):
-    return s.alpha(op) * s.throughput * s.f(V) * V**s.s
+  def P_tile_dynamic( s, V, op, activity=None ):
+    if activity is None:
+      activity = s.throughput
+    return s.alpha(op) * activity * s.f(V) * V**s.s
 
-  def P_tile_total( s, V, op ):
-    return s.P_tile_static( V ) + s.P_tile_dynamic( V, op )
+  def P_tile_total( s, V, op, activity=None ):
+    return s.P_tile_static( V ) + s.P_tile_dynamic( V, op, activity )
 
-  def E_tile_total( s, V, op ):
-    return s.P_tile_total( V, op ) * s.latency
+  def E_tile_total( s, V, op, activity=None ):
+    return s.P_tile_total( V, op, activity ) * s.latency
 
   # SRAM
 
   def P_sram_static( s, V ):
     return V * s.I_L() * s.beta
 
-  def P_sram_dynamic( s, V ):
-    return s.alpha('sram') * s.throughput * s.f(V) * V**s.s
+  def P_sram_dynamic( s, V, activity=None ):
+    if activity is None:
+      activity = s.throughput
+    return s.alpha('sram') * activity * s.f(V) * V**s.s
 
-  def P_sram_total( s, V ):
-    return s.P_sram_static( V ) + s.P_sram_dynamic( V )
+  def P_sram_total( s, V, activity=None ):
+    return s.P_sram_static( V ) + s.P_sram_dynamic( V, activity )
 
-  def E_sram_total( s, V ):
-    return s.P_sram_total( V ) * s.latency
+  def E_sram_total( s, V, activity=None ):
+    return s.P_sram_total( V, activity ) * s.latency
 
   # CGRA Power
+  #
+  # In verbose mode, we walk the nodes to print a breakdown. Otherwise we
+  # evaluate the vectorized kernels below for the current configuration.
 
   def P_cgra_static_tiles( s ):
+    if not s.verbose:
+      return s.P_cgra_parts()['static_tiles']
     P_s = 0.0
     for n in s.nodes:
-      if s.verbose:
-        print( '    - Tile Psta {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', s.P_tile_static( n.V ) ) )
+      print( '    - Tile Psta {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', s.P_tile_static( n.V ) ) )
       P_s += s.P_tile_static( n.V )
     return P_s
 
   def P_cgra_static_srams( s ):
+    if not s.verbose:
+      return s.P_cgra_parts()['static_srams']
     P_s = 0.0
     for n in s.l_nodes:
-      if s.verbose:
-        print( '    - Sram Psta {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', s.P_sram_static( n.V ) ) )
+      print( '    - Sram Psta {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', s.P_sram_static( n.V ) ) )
       P_s += s.P_sram_static( n.V )
     return P_s
 
   def P_cgra_dynamic_tiles( s ):
+    if not s.verbose:
+      return s.P_cgra_parts()['dynamic_tiles']
     P_d = 0.0
     for n in s.nodes:
-      if s.verbose:
-        print( '    - Tile Pdyn {:<20} : {:20.2f}'.format( str(n.name) + ' ' + n.op + ' ' + str(n.V) + 'V', s.P_tile_dynamic( n.V, n.op ) ))
-      P_d += s.P_tile_dynamic( n.V, n.op )
+      P_n = s.P_tile_dynamic( n.V, n.op, s.activity_of( n ) )
+      print( '    - Tile Pdyn {:<20} : {:20.2f}'.format( str(n.name) + ' ' + n.op + ' ' + str(n.V) + 'V', P_n ))
+      P_d += P_n
     return P_d
 
   def P_cgra_dynamic_srams( s ):
+    if not s.verbose:
+      return s.P_cgra_parts()['dynamic_srams']
     P_d = 0.0
     for n in s.l_nodes:
-      if s.verbose:
-        print( '    - Sram Pdyn {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', s.P_sram_dynamic( n.V ) ) )
-      P_d += s.P_sram_dynamic( n.V )
+      P_n = s.P_sram_dynamic( n.V, s.activity_of( n ) )
+      print( '    - Sram Pdyn {:<20} : {:20.2f}'.format( str(n.name) + ' ' + str(n.V) + 'V', P_n ) )
+      P_d += P_n
     return P_d
 
   def P_cgra_static( s ):
@@ -298,7 +452,8 @@ class PowerModel:
       print( '  - ^-- CGRA Pstatic tiles : {:20.2f}'.format( static_t ) )
       print( '  - CGRA Pstatic srams : {:20.2f}'.format( static_s ) )
       return total
-    return s.P_cgra_static_tiles() + s.P_cgra_static_srams()
+    parts = s.P_cgra_parts()
+    return parts['static_tiles'] + parts['static_srams']
 
   def P_cgra_dynamic( s ):
     if s.verbose:
@@ -308,7 +463,8 @@ class PowerModel:
       print( '  - ^-- CGRA Pdynamic tiles : {:20.2f}'.format( dynamic_t ) )
       print( '  - CGRA Pdynamic srams : {:20.2f}'.format( dynamic_s ) )
       return total
-    return s.P_cgra_dynamic_tiles() + s.P_cgra_dynamic_srams()
+    parts = s.P_cgra_parts()
+    return parts['dynamic_tiles'] + parts['dynamic_srams']
 
   def P_cgra_tiles( s ):
     return s.P_cgra_static_tiles() + s.P_cgra_dynamic_tiles()
@@ -325,7 +481,88 @@ class PowerModel:
       total = static + dynamic
       print( '- CGRA Ptotal   : {:20.2f}'.format( total ) )
       return total
-    return s.P_cgra_static() + s.P_cgra_dynamic()
+    return sum( s.P_cgra_parts().values() )
+
+  # P_cgra_parts
+  #
+  # Static and dynamic power of the tiles and srams for the current
+  # configuration
+
+  def P_cgra_parts( s ):
+    activity = None
+    if s.activity is not None:
+      activity = s.activity[ np.newaxis, : ]
+    parts = s.P_cgra_batch( s.V_array[ np.newaxis, : ], [ s.throughput ],
+                            activity )
+    return { k: float( v[0] ) for k, v in parts.items() }
+
+  # activity_of
+  #
+  # Activity of node n with activity='node' (None otherwise, i.e., the
+  # throughput of the CGRA)
+
+  def activity_of( s, n ):
+    if s.activity is None:
+      return None
+    return float( s.activity[ s.node_index[ n.name ] ] )
+
+  # node_activity
+  #
+  # Activity of each node (in the order of s.nodes) from the counters of
+  # a simulation, i.e., the number of times it fired per nominal cycle
+
+  def node_activity( s, counters ):
+    cycles = counters['cycles']
+    if not cycles:
+      return np.zeros( s.N_N )
+    index = { name: i for i, name in enumerate( s.sim.node_names ) }
+    return np.array( [ counters['fired'][ index[ n.name ] ] / cycles
+                         for n in s.nodes ], dtype=float )
+
+  #-----------------------------------------------------------------------
+  # Batch power and energy kernels
+  #-----------------------------------------------------------------------
+  # These evaluate a batch of M configurations in one pass. V is an M x N
+  # matrix of node voltages (with columns in the order of s.nodes), and
+  # throughput and latency are vectors of length M. Note that I_L
+  # depends on the throughput, so it is computed once per configuration.
+  # Dynamic power scales with the throughput or, given an M x N activity
+  # matrix (see node_activity), with the activity of each node.
+
+  def I_L_batch( s, throughput ):
+    return ( s.gamma * s.alpha_mul * throughput * s.f( s.V_N ) * s.V_N**s.s ) \
+             / ( s.V_N * ( 1 - s.gamma ) )
+
+  def P_cgra_batch( s, V, throughput, activity=None ):
+
+    V          = np.atleast_2d( np.asarray( V, dtype=float ) )
+    throughput = np.asarray( throughput, dtype=float )
+
+    I_L   = s.I_L_batch( throughput )
+    alpha = s.alpha_table()[ s.alpha_index ]
+    fV    = s.f( V ) * V**s.s
+
+    if activity is None:
+      dynamic_tiles = throughput * ( fV @ alpha )
+      dynamic_srams = throughput * s.alpha_sram * ( fV @ s.sram_count )
+    else:
+      fV            = fV * np.asarray( activity, dtype=float )
+      dynamic_tiles = fV @ alpha
+      dynamic_srams = s.alpha_sram * ( fV @ s.sram_count )
+
+    return {
+      'static_tiles'  : I_L * V.sum( axis=1 ),
+      'static_srams'  : I_L * s.beta * ( V @ s.sram_count ),
+      'dynamic_tiles' : dynamic_tiles,
+      'dynamic_srams' : dynamic_srams,
+    }
+
+  def P_cgra_total_batch( s, V, throughput, activity=None ):
+    return sum( s.P_cgra_batch( V, throughput, activity ).values() )
+
+  def E_cgra_total_batch( s, V, throughput, latency, activity=None ):
+    return s.P_cgra_total_batch( V, throughput, activity ) \
+             * np.asarray( latency, dtype=float )
 
   # CGRA Energy
 
@@ -367,13 +604,239 @@ class PowerModel:
   # Changing VF
 
   def calc_performance( s ):
-    perf = s.sim.calc_performance()
+    key  = s.cache_key()
+    perf = s.cache.get( key )
+    if perf is None:
+      perf = s.prefetched.pop( key, None )
+      if perf is None and s.checkpoint:
+        perf = s.sim.calc_performance_warm( s.checkpoint,
+                                            s.changed_nodes( key ) )
+      elif perf is None:
+        perf = s.sim.calc_performance()
+        if s.warm_start:
+          s.checkpoints[ key ] = s.sim.checkpoint()
+      s.cache.put( key, perf )
+    s.perf       = perf
     s.throughput = perf['throughput']
     s.latency    = perf['latency']
+    if s.activity_mode == 'node':
+      s.activity = s.node_activity( perf['counters'] )
+
+  # rebase
+  #
+  # With warm start, simulate the current setting from time 0 and keep its
+  # steady-state checkpoint as the base for later simulations. The cold
+  # results replace any cached (warm) results for this setting.
+
+  def rebase( s ):
+    if not s.warm_start:
+      return
+    key = s.cache_key()
+    if key not in s.checkpoints:
+      s.cache.put( key, s.sim.calc_performance() )
+      s.checkpoints[ key ] = s.sim.checkpoint()
+    s.checkpoint     = s.checkpoints[ key ]
+    s.checkpoint_key = key
+
+  # changed_nodes
+  #
+  # Names of the nodes whose T in the given cache key differs from the
+  # base setting of the checkpoint
+
+  def changed_nodes( s, key ):
+    return [ name for name, T, T_base in zip( s.cache_names, key,
+                                              s.checkpoint_key )
+               if T != T_base ]
+
+  # open_pool / close_pool
+  #
+  # The pool is forked on first use, after the graph is fully set up.
+  # With a single process (or with warm starts, which depend on the
+  # checkpoint of the current mapping), there is no pool.
+
+  def use_pool( s ):
+    return s.processes > 1 and not s.warm_start
+
+  def open_pool( s ):
+    if s.pool is None and s.use_pool():
+      s.pool = get_context( 'fork' ).Pool( s.processes, _worker_init,
+                                           ( s, ) )
+    return s.pool
+
+  def close_pool( s ):
+    if s.pool is not None:
+      s.pool.close()
+      s.pool.join()
+      s.pool = None
+    s.prefetched = {}
+
+  # prefetch
+  #
+  # Simulates the given per-node voltage settings on the worker pool and
+  # keeps the results for calc_performance. Settings that are cached or
+  # already prefetched are skipped.
+
+  def prefetch( s, V_ranges ):
+
+    if not V_ranges or not s.open_pool():
+      return
+
+    jobs = {}
+    for V_range in V_ranges:
+      key = s.V_range_key( V_range )
+      if key not in s.cache and key not in s.prefetched:
+        jobs[key] = V_range
+
+    for key, perf in s.pool.imap( _worker_run, jobs.values() ):
+      s.prefetched[key] = perf
+
+  # speculate
+  #
+  # Per-node voltage settings of the trials the greedy search may visit
+  # in its next few steps. Each step is a list of alternative updates to
+  # the setting, and keep is True if the search can also leave the
+  # setting as is. We expand the tree of outcomes one step at a time
+  # until there are enough new trials to keep the workers busy.
+  # to_V_range converts a setting into a per-node voltage setting.
+  # Without a worker pool, the search evaluates its trials inline and
+  # there is nothing to speculate.
+
+  def speculate( s, setting, steps, to_V_range ):
+    if not s.use_pool():
+      return []
+    trials   = []
+    n_new    = 0
+    frontier = [ setting ]
+    for updates, keep in steps:
+      if n_new >= s.processes:
+        break
+      next_frontier = []
+      for base in frontier:
+        for update in updates:
+          trial = dict( base )
+          trial.update( update )
+          V_range = to_V_range( trial )
+          key     = s.V_range_key( V_range )
+          if key not in s.cache and key not in s.prefetched:
+            n_new += 1
+          trials.append( V_range )
+          next_frontier.append( trial )
+        if keep:
+          next_frontier.append( base )
+      frontier = next_frontier
+    return trials
+
+  # V_range_key
+  #
+  # Cache key of a per-node voltage setting (see cache_key)
+
+  def V_range_key( s, V_range ):
+    return tuple( round( s.T( V_range[_] ), 6 ) for _ in s.cache_names )
+
+  # cache_key
+  #
+  # Canonical per-node T vector (in sorted node order). We round to
+  # absorb floating-point noise from the voltage-to-T conversion.
+
+  def cache_key( s ):
+    return tuple( round( s.g.get_node( _ ).T, 6 ) for _ in s.cache_names )
+
+  # cache_header
+  #
+  # Everything besides the T vector that the simulated performance
+  # depends on. The contents of the DFG json are hashed, since an edited
+  # json can keep the same nodes and tick order (e.g., with different
+  # recurrence edges or ops). The tick order of the simulator comes from the
+  # topological sort, which can change from run to run when cycles are
+  # broken. Results are versioned so that caches saved before a change
+  # to what calc_performance returns (e.g., the activity counters) are
+  # dropped.
+
+  def cache_header( s ):
+    rank = s.sim.pq.rank
+    return {
+      'json'       : json_sha256( s.g.json ),
+      'nodes'      : s.cache_names,
+      'tick_order' : sorted( rank, key=rank.get ),
+      'max_tokens' : s.sim.max_tokens,
+      'timebase'   : s.sim.ticks_per_cycle,
+      'warm_start' : s.warm_start,
+      'results'    : perf_version,
+    }
+
+  # save_cache
+
+  def save_cache( s ):
+    if s.cache_f:
+      s.cache.save( s.cache_f, s.cache_header() )
+
+  # print_cache_stats
+
+  def print_cache_stats( s ):
+    stats = s.cache.stats()
+    print( 'Performance cache -- {hits} hits, {misses} misses, '
+           '{evictions} evictions, {entries} of {maxsize} entries'.format(
+             **stats ) )
+
+  # estimate_performance
+  #
+  # Estimate the throughput and latency from the static throughput bound.
+  # The simulated throughput also counts the tokens still in flight at
+  # the end of the run, so rather than using 1/ii directly, we scale the
+  # simulated nominal results by the change in the ii bound.
+
+  def estimate_performance( s ):
+    ii = s.bound.calc_ii()
+    s.throughput = s._1_throughput * s._1_ii / ii
+    s.latency    = s._1_latency    * ii     / s._1_ii
+    if s._1_activity is not None:
+      s.activity = s._1_activity * s._1_ii / ii
+
+  # prune_setting
+  #
+  # Applies the setting and returns True if it can be skipped without
+  # simulation, i.e., if even the estimate does not improve the
+  # perf-eeff product over the current results.
+
+  def prune_setting( s, groups, setting, current_results ):
+
+    s.set_V_setting( groups, setting )
+    s.n_trials += 1
+
+    # No need to estimate if we already know the simulated results
+
+    if not s.prune or s.cache_key() in s.cache:
+      return False
+
+    throughput = s.throughput
+    latency    = s.latency
+    activity   = s.activity
+    verbose    = s.verbose
+
+    s.estimate_performance()
+    s.verbose = False
+    results   = s.compare()
+
+    s.throughput = throughput
+    s.latency    = latency
+    s.activity   = activity
+    s.verbose    = verbose
+
+    perf_diff = results['throughput'] / current_results['throughput']
+    eeff_diff = results['eeff']       / current_results['eeff']
+
+    if perf_diff * eeff_diff * s.prune_margin > 1.00:
+      return False
+
+    s.n_pruned += 1
+    return True
 
   def set_V_node( s, node_name, V ):
     s.g.get_node( node_name ).set_V( V )
     s.g.get_node( node_name ).set_T( s.T(V) )
+    if node_name in s.node_index:
+      s.V_array[ s.node_index[node_name] ] = V
+      s.T_array[ s.node_index[node_name] ] = s.T(V)
     #print( 'setting', node_name, V, s.T(V) )
 
   def set_V_range( s, V_range ):
@@ -383,6 +846,8 @@ class PowerModel:
   def set_op_range( s, op_range ):
     for node_name, op in op_range.items():
       s.g.get_node( node_name ).set_op( op )
+      if node_name in s.node_index:
+        s.alpha_index[ s.node_index[node_name] ] = s.alpha_ops.index( op )
 
   #-----------------------------------------------------------------------
   # Autosearch
@@ -450,12 +915,31 @@ class PowerModel:
 
     return groups
 
+  # group_order
+  #
+  # Order in which Phase 2 visits the groups. With order='index', this is
+  # the group numbering. With order='bottleneck', the groups go from the
+  # worst bottleneck in the current setting (see Simulator.bottlenecks),
+  # ranking each group by its worst node, so the groups that hold back
+  # the rest of the CGRA get the first pick.
+
+  def group_order( s, groups, order='index' ):
+    keys = sorted( groups.keys() )
+    if order == 'index':
+      return keys
+    rank = { name: i for i, name in
+               enumerate( s.sim.bottlenecks( s.perf['counters'] ) ) }
+    return sorted( keys, key=lambda k: min( rank[_] for _ in groups[k] ) )
+
   # set_V_group
 
+  def V_mode( s, mode ):
+    if mode == 'r': return 0.61
+    if mode == 'n': return 0.90
+    if mode == 's': return 1.23
+
   def set_V_group( s, group, mode ):
-    if mode == 'r': V = 0.61
-    if mode == 'n': V = 0.90
-    if mode == 's': V = 1.23
+    V = s.V_mode( mode )
     V_range = { node_name: V for node_name in group }
     s.set_V_range( V_range )
 
@@ -465,6 +949,42 @@ class PowerModel:
     for k in setting.keys():
       s.set_V_group( groups[k], setting[k] )
 
+  # setting_V_range
+  #
+  # Per-node voltage setting of a per-group mode setting
+
+  def setting_V_range( s, groups, setting ):
+    return { node_name: s.V_mode( setting[k] )
+               for k in setting.keys() for node_name in groups[k] }
+
+  # tile_vf_options
+  #
+  # Voltages to try for a tile given the voltages of its nodes, or None
+  # if the nodes already agree
+
+  def tile_vf_options( s, vfs ):
+
+    highest_vf = max( vfs )
+    lowest_vf  = min( vfs )
+
+    vdiff = lowest_vf - highest_vf
+    if vdiff > -0.01 and vdiff < 0.01: # same
+      return None
+
+    vf_options = []
+    if lowest_vf < 0.65:
+      vf_options.append( 0.61 )
+      if highest_vf < 0.95:
+        vf_options.append( 0.90 )
+      else:
+        vf_options.append( 0.90 )
+        vf_options.append( 1.23 )
+    else:
+      vf_options.append( 0.90 )
+      vf_options.append( 1.23 )
+
+    return vf_options
+
   # compare
 
   def compare( s ):
@@ -498,6 +1018,8 @@ class PowerModel:
       print( '{}: {:>15} -- {:20.2f}'.format( 'X', 'power',      results['power']      ) )
       print( '{}: {:>15} -- {:20.2f}'.format( 'X', 'eeff',       results['eeff']       ) )
       print()
+      s.print_cache_stats()
+      print()
 
     return results
 
@@ -530,11 +1052,183 @@ class PowerModel:
       setting = json.load( fd )
     s.set_V_range( setting )
 
+  #-----------------------------------------------------------------------
+  # Beam search
+  #-----------------------------------------------------------------------
+  # An alternative to the greedy Phase 2 of autosearch. The greedy pass
+  # visits the groups in order and keeps a single setting, so its result
+  # depends on the group numbering. Here we visit the groups in the same
+  # order but keep the beam_width best settings (by the perf-eeff
+  # product) after each group, expanding each with every mode.
+  #
+  # Children of the beam are branch-and-bounded with the static
+  # throughput bound: they are simulated in order of their estimated
+  # perf-eeff product, and we stop once even the estimate, padded by the
+  # prune margin, cannot make it into the beam.
+  #
+  # Every simulated setting is kept, and the Pareto set of (perf, eeff)
+  # over all of them is reported along with the number of simulations.
+  # The groups are visited in the given order (see group_order).
+
+  def beamsearch( s, groups, beam_width=4, prioritize_energy=False,
+                                           order='index' ):
+
+    if not prioritize_energy:
+      modes, default = [ 'r', 'n', 's' ], 's'
+    else:
+      modes, default = [ 'r', 'n' ], 'n'
+
+    s._1_ii = s.bound.calc_ii()
+
+    keys       = sorted( groups.keys() )
+    to_V_range = lambda trial: s.setting_V_range( groups, trial )
+    label      = lambda trial: ''.join( trial[k] for k in keys )
+
+    misses   = s.cache.stats()['misses']
+    n_pruned = 0
+    verbose  = s.verbose
+    s.verbose = False
+
+    # Every simulated setting by label, with its results
+
+    found = {}
+
+    def evaluate( trial ):
+      s.set_V_setting( groups, trial )
+      s.calc_performance()
+      results = s.compare()
+      found[ label( trial ) ] = ( trial, results )
+      return results['throughput'] * results['eeff']
+
+    def estimate( trial ):
+      s.set_V_setting( groups, trial )
+      s.estimate_performance()
+      results = s.compare()
+      return results['throughput'] * results['eeff']
+
+    template = 'Group {g:3} of {gtot:3} : {perf:4.2f}x perf, {eeff:4.2f}x eeff -- {sims:4} simulated, {pruned:4} pruned'
+
+    start = { k: default for k in keys }
+    beam  = [ ( evaluate( start ), label( start ), start ) ]
+
+    for k in s.group_order( groups, order ):
+
+      # Expand the beam. Settings that leave this group as is were
+      # already simulated, so they go first.
+
+      children = {}
+      for score, _, trial in beam:
+        for mode in modes:
+          child = dict( trial )
+          child[k] = mode
+          if label( child ) not in children:
+            children[ label( child ) ] = child
+
+      known   = [ c for c in children.values() if label( c ) in found ]
+      unknown = [ ( estimate( c ), label( c ), c ) for c in children.values()
+                    if label( c ) not in found ]
+      unknown.sort( key=lambda x: ( -x[0], x[1] ) )
+
+      scored = [ ( evaluate( c ), label( c ), c ) for c in known ]
+
+      # Simulate the rest in order of their estimates (in batches, so that
+      # the batch can be evaluated on the worker pool)
+
+      batch_size = max( 1, s.processes )
+
+      while unknown:
+        scored.sort( key=lambda x: ( -x[0], x[1] ) )
+        cutoff = scored[ beam_width-1 ][0] \
+                   if len( scored ) >= beam_width else 0.0
+        batch  = [ x for x in unknown[ : batch_size ]
+                     if x[0] * s.prune_margin > cutoff ]
+        if not batch:
+          n_pruned += len( unknown )
+          break
+        unknown = unknown[ len( batch ) : ]
+        s.prefetch( [ to_V_range( c ) for _, _, c in batch ] )
+        scored += [ ( evaluate( c ), l, c ) for _, l, c in batch ]
+
+      scored.sort( key=lambda x: ( -x[0], x[1] ) )
+      beam = scored[ : beam_width ]
+
+      best = found[ beam[0][1] ][1]
+      print( template.format(
+        perf   = best['throughput'],
+        eeff   = best['eeff'],
+        g      = k,
+        gtot   = len( keys ),
+        sims   = s.cache.stats()['misses'] - misses,
+        pruned = n_pruned,
+      ) )
+    print()
+
+    # Pareto set over everything we simulated
+
+    points = sorted( found.values(), key=lambda x: (
+                       -x[1]['throughput'], -x[1]['eeff'], label( x[0] ) ) )
+    pareto = []
+    for trial, results in points:
+      if not pareto or results['eeff'] > pareto[-1][1]['eeff']:
+        pareto.append( ( trial, results ) )
+
+    n_sims = s.cache.stats()['misses'] - misses
+
+    print( 'Pareto set -- {} of {} settings, {} simulations, {} pruned'
+             .format( len( pareto ), len( found ), n_sims, n_pruned ) )
+    print()
+    for trial, results in pareto:
+      print( '  {:4.2f}x perf, {:4.2f}x eeff -- {}'.format(
+               results['throughput'], results['eeff'], label( trial ) ) )
+    print()
+
+    # Leave the model at the best setting
+
+    setting = beam[0][2]
+    s.set_V_setting( groups, setting )
+    s.verbose = verbose
+
+    return {
+      'setting' : setting,
+      'results' : found[ beam[0][1] ][1],
+      'pareto'  : pareto,
+      'n_sims'  : n_sims,
+    }
+
   #-----------------------------------------------------------------------
   # Compiler Power-Mapping Algorithm -- As described in Paper Section III
   #-----------------------------------------------------------------------
 
-  def autosearch( s, skip_search=False, prioritize_energy=False ):
+  # autosearch
+  #
+  # With search='beam', Phase 2 uses beamsearch (with the given beam
+  # width) instead of the greedy pass over the groups. With
+  # order='bottleneck', Phase 2 visits the groups from the worst
+  # bottleneck of the initialized setting instead of in group order (see
+  # group_order). The worker pool (if any) is closed when the search
+  # ends, including when it fails.
+
+  def autosearch( s, skip_search=False, prioritize_energy=False,
+                                        search='greedy', beam_width=4,
+                                        order='index' ):
+    try:
+      s.run_phases( skip_search, prioritize_energy, search, beam_width,
+                    order )
+    finally:
+      s.close_pool()
+
+  # run_phases
+  #
+  # The three phases of autosearch
+
+  def run_phases( s, skip_search, prioritize_energy, search, beam_width,
+                     order ):
+
+    assert search in [ 'greedy', 'beam' ], \
+      'Unknown search %s' % search
+
+    assert order in [ 'index', 'bottleneck' ], \
+      'Unknown order %s' % order
 
     #---------------------------------------------------------------------
     # Phase 1: Complexity-Reduction Phase
@@ -552,6 +1246,10 @@ class PowerModel:
     s._1_energy     = s.E_cgra_total()
     s._1_throughput = s.throughput
     s._1_latency    = s.latency
+    s._1_activity   = s.activity
+
+    if s.prune:
+      s._1_ii = s.bound.calc_ii()
 
     #---------------------------------------------------------------------
     # Phase 2: Energy-Delay-Optimization Phase
@@ -566,6 +1264,29 @@ class PowerModel:
         with open( s.g.json + '.pre.eeff.nodes', 'r' ) as fd:
           extracted_settings = json.load( fd )
 
+    elif search == 'beam':
+
+      prefix = s.g.json + ( '.pre.eeff' if prioritize_energy else '.pre' )
+
+      beam = s.beamsearch( groups, beam_width, prioritize_energy, order )
+      setting = beam['setting']
+
+      s.verbose = True
+      s.calc_performance()
+      s.compare()
+
+      # Dump mapping before bypass adjustment
+
+      mapping = { k: { 'mode': setting[k], 'nodes': groups[k] } for k in groups.keys() }
+
+      s.g.dump_json( mapping, prefix + '.groups' )
+
+      extracted_settings = s.extract_node_settings()
+
+      s.g.dump_json( extracted_settings, prefix + '.nodes' )
+
+      s.save_cache()
+
     else:
 
       if not prioritize_energy:
@@ -574,6 +1295,8 @@ class PowerModel:
 
         results_tmpl = '[ {} : {:4.2f}x perf, {:4.2f}x eeff -- ({:4.2f}x, {:4.2f}x) ]'
 
+        pruned_tmpl  = '[ {} : pruned ]'
+
         setting = { k: 's' for k in groups.keys() }
 
         s.set_V_setting( groups, setting )
@@ -588,6 +1311,7 @@ class PowerModel:
         print()
 
         current_results = results
+        s.rebase()
 
         def try_run( groups, setting ):
           s.set_V_setting( groups, setting )
@@ -595,34 +1319,50 @@ class PowerModel:
           results = s.compare()
           return results
 
+        to_V_range = lambda trial: s.setting_V_range( groups, trial )
+
         s.verbose = False
-        for k in sorted( groups.keys() ):
+        keys = s.group_order( groups, order )
+        for i, k in enumerate( keys ):
+          s.prefetch( s.speculate( setting,
+            [ ( [ { j: 'r' }, { j: 'n' } ], True ) for j in keys[i:] ],
+            to_V_range ) )
           rest_str = ''
           nom_str = ''
           done = False
           setting[k] = 'r'
-          results = try_run( groups, setting )
-          perf_diff = results['throughput'] / current_results['throughput']
-          eeff_diff = results['eeff']       / current_results['eeff']
-          rest_str  = results_tmpl.format( setting[k], \
-                        results['throughput'], results['eeff'],
-                        perf_diff, eeff_diff )
-          if perf_diff * eeff_diff > 1.00: done = True
-          if not done and perf_diff * eeff_diff < 1.07:
-            setting[k] = 'n'
+          pruned = s.prune_setting( groups, setting, current_results )
+          if pruned:
+            rest_str = pruned_tmpl.format( setting[k] )
+          else:
             results = try_run( groups, setting )
             perf_diff = results['throughput'] / current_results['throughput']
             eeff_diff = results['eeff']       / current_results['eeff']
-            nom_str  = results_tmpl.format( setting[k], \
-                         results['throughput'], results['eeff'],
-                         perf_diff, eeff_diff )
+            rest_str  = results_tmpl.format( setting[k], \
+                          results['throughput'], results['eeff'],
+                          perf_diff, eeff_diff )
             if perf_diff * eeff_diff > 1.00: done = True
-            if not done and perf_diff * eeff_diff < 1.07:
+          if not done and ( pruned or perf_diff * eeff_diff < 1.07 ):
+            setting[k] = 'n'
+            pruned = s.prune_setting( groups, setting, current_results )
+            if pruned:
+              nom_str = pruned_tmpl.format( setting[k] )
+            else:
+              results = try_run( groups, setting )
+              perf_diff = results['throughput'] / current_results['throughput']
+              eeff_diff = results['eeff']       / current_results['eeff']
+              nom_str  = results_tmpl.format( setting[k], \
+                           results['throughput'], results['eeff'],
+                           perf_diff, eeff_diff )
+              if perf_diff * eeff_diff > 1.00: done = True
+            if not done and ( pruned or perf_diff * eeff_diff < 1.07 ):
               setting[k] = 's'
               s.set_V_setting( groups, setting )
           chosen_str = setting[k]
           if setting[k] != 's':
             current_results = results
+            s.set_V_setting( groups, setting )
+            s.rebase()
           output_str = template.format(
             perf=current_results['throughput'],
             eeff=current_results['eeff'],
@@ -635,6 +1375,11 @@ class PowerModel:
           print( output_str )
         print()
 
+        if s.prune:
+          print( 'Pruned {} of {} trial settings with the throughput '
+                 'bound'.format( s.n_pruned, s.n_trials ) )
+          print()
+
         s.verbose = True
         s.calc_performance()
         s.compare()
@@ -643,15 +1388,13 @@ class PowerModel:
 
         mapping = { k: { 'mode': setting[k], 'nodes': groups[k] } for k in groups.keys() }
 
-        with open( s.g.json + '.pre.groups', 'w' ) as fd:
-          json.dump( mapping, fd, sort_keys=True, indent=4,
-            separators=(',', ': ') )
+        s.g.dump_json( mapping, s.g.json + '.pre.groups' )
 
         extracted_settings = s.extract_node_settings()
 
-        with open( s.g.json + '.pre.nodes', 'w' ) as fd:
-          json.dump( extracted_settings, fd, sort_keys=True, indent=4,
-            separators=(',', ': ') )
+        s.g.dump_json( extracted_settings, s.g.json + '.pre.nodes' )
+
+        s.save_cache()
 
       else:
 
@@ -659,6 +1402,8 @@ class PowerModel:
 
         results_tmpl = '[ {} : {:4.2f}x perf, {:4.2f}x eeff -- ({:4.2f}x, {:4.2f}x) ]'
 
+        pruned_tmpl  = '[ {} : pruned ]'
+
         setting = { k: 'n' for k in groups.keys() }
 
         s.set_V_setting( groups, setting )
@@ -673,6 +1418,7 @@ class PowerModel:
         print()
 
         current_results = results
+        s.rebase()
 
         def try_run( groups, setting ):
           s.set_V_setting( groups, setting )
@@ -680,24 +1426,35 @@ class PowerModel:
           results = s.compare()
           return results
 
+        to_V_range = lambda trial: s.setting_V_range( groups, trial )
+
         s.verbose = False
-        for k in sorted( groups.keys() ):
+        keys = s.group_order( groups, order )
+        for i, k in enumerate( keys ):
+          s.prefetch( s.speculate( setting,
+            [ ( [ { j: 'r' } ], True ) for j in keys[i:] ],
+            to_V_range ) )
           rest_str = ''
           done = False
           setting[k] = 'r'
-          results = try_run( groups, setting )
-          perf_diff = results['throughput'] / current_results['throughput']
-          eeff_diff = results['eeff']       / current_results['eeff']
-          rest_str  = results_tmpl.format( setting[k], \
-                        results['throughput'], results['eeff'],
-                        perf_diff, eeff_diff )
-          if perf_diff * eeff_diff > 1.00: done = True
+          if s.prune_setting( groups, setting, current_results ):
+            rest_str = pruned_tmpl.format( setting[k] )
+          else:
+            results = try_run( groups, setting )
+            perf_diff = results['throughput'] / current_results['throughput']
+            eeff_diff = results['eeff']       / current_results['eeff']
+            rest_str  = results_tmpl.format( setting[k], \
+                          results['throughput'], results['eeff'],
+                          perf_diff, eeff_diff )
+            if perf_diff * eeff_diff > 1.00: done = True
           if not done:
             setting[k] = 'n'
             s.set_V_setting( groups, setting )
           chosen_str = setting[k]
           if setting[k] != 'n':
             current_results = results
+            s.set_V_setting( groups, setting )
+            s.rebase()
           output_str = template.format(
             perf=current_results['throughput'],
             eeff=current_results['eeff'],
@@ -709,6 +1466,11 @@ class PowerModel:
           print( output_str )
         print()
 
+        if s.prune:
+          print( 'Pruned {} of {} trial settings with the throughput '
+                 'bound'.format( s.n_pruned, s.n_trials ) )
+          print()
+
         s.verbose = True
         s.calc_performance()
         s.compare()
@@ -717,15 +1479,13 @@ class PowerModel:
 
         mapping = { k: { 'mode': setting[k], 'nodes': groups[k] } for k in groups.keys() }
 
-        with open( s.g.json + '.pre.eeff.groups', 'w' ) as fd:
-          json.dump( mapping, fd, sort_keys=True, indent=4,
-            separators=(',', ': ') )
+        s.g.dump_json( mapping, s.g.json + '.pre.eeff.groups' )
 
         extracted_settings = s.extract_node_settings()
 
-        with open( s.g.json + '.pre.eeff.nodes', 'w' ) as fd:
-          json.dump( extracted_settings, fd, sort_keys=True, indent=4,
-            separators=(',', ': ') )
+        s.g.dump_json( extracted_settings, s.g.json + '.pre.eeff.nodes' )
+
+        s.save_cache()
 
     #---------------------------------------------------------------------
     # Phase 3: Constraint Phase -- for Physical Co-Location
@@ -758,6 +1518,7 @@ class PowerModel:
       print()
 
       current_results = results
+      s.rebase()
 
       def try_bypass_run( try_setting ):
         s.set_V_range( try_setting )
@@ -765,37 +1526,35 @@ class PowerModel:
         results = s.compare()
         return results
 
-      # Normalize within a tile to same VF
+      # Get the possible vf options for each tile. A tile only changes
+      # the voltages of its own nodes, so these do not depend on the
+      # choices for the other tiles.
 
-      s.verbose = False
+      tile_list    = list( tile_groups.values() )
+      tile_options = \
+        [ s.tile_vf_options( [ s.g.get_node( node_name ).V
+                                 for node_name in tiles ] )
+            for tiles in tile_list ]
 
-      for tile_i, tiles in enumerate( tile_groups.values() ):
+      # Normalize within a tile to same VF
 
-        nodes = [ s.g.get_node( node_name ) for node_name in tiles ]
-        vfs   = [ node.V for node in nodes ]
-        ops   = [ node.op for node in nodes ]
+      s.verbose = False
 
-        # Get the possible vf options for this tile
+      for tile_i, tiles in enumerate( tile_list ):
 
-        highest_vf = max( vfs )
-        lowest_vf  = min( vfs )
+        vf_options = tile_options[tile_i]
 
-        vdiff = lowest_vf - highest_vf
-        if vdiff > -0.01 and vdiff < 0.01: # same
+        if vf_options is None:
           print( 'skipping tile', tile_i+1 )
           continue
 
-        vf_options = []
-        if lowest_vf < 0.65:
-          vf_options.append( 0.61 )
-          if highest_vf < 0.95:
-            vf_options.append( 0.90 )
-          else:
-            vf_options.append( 0.90 )
-            vf_options.append( 1.23 )
-        else:
-          vf_options.append( 0.90 )
-          vf_options.append( 1.23 )
+        s.prefetch( s.speculate( setting,
+          [ ( [ { node_name: vf for node_name in _tiles }
+                  for vf in _options ], False )
+              for _tiles, _options in zip( tile_list[tile_i:],
+                                           tile_options[tile_i:] )
+              if _options ],
+          dict ) )
 
         # Run each option
 
@@ -826,6 +1585,9 @@ class PowerModel:
 
         current_results = results[max_vf]
 
+        s.set_V_range( setting )
+        s.rebase()
+
         # Print
 
         for vf, value in ed_product.items():
@@ -899,9 +1661,11 @@ class PowerModel:
 
       extracted_settings = s.extract_node_settings()
 
-      with open( s.g.json + '.final.nodes', 'w' ) as fd:
-        json.dump( extracted_settings, fd, sort_keys=True, indent=4,
-          separators=(',', ': ') )
+      s.g.dump_json( extracted_settings, s.g.json + '.final.nodes' )
+
+      # Save performance cache for future runs on this DFG
+
+      s.save_cache()
 
       # Dump search results
 
@@ -923,6 +1687,7 @@ class PowerModel:
       print()
 
       current_results = results
+      s.rebase()
 
       def try_bypass_run( try_setting ):
         s.set_V_range( try_setting )
@@ -930,27 +1695,35 @@ class PowerModel:
         results = s.compare()
         return results
 
-      # Normalize within a tile to same VF
+      # Get the possible vf options for each tile (see above)
 
-      s.verbose = False
+      tile_list    = list( tile_groups.values() )
+      tile_options = \
+        [ s.tile_vf_options( [ s.g.get_node( node_name ).V
+                                 for node_name in tiles ] )
+            for tiles in tile_list ]
+      tile_options = \
+        [ None if _ is None else [ 0.61, 0.90 ] for _ in tile_options ]
 
-      for tile_i, tiles in enumerate( tile_groups.values() ):
+      # Normalize within a tile to same VF
 
-        nodes = [ s.g.get_node( node_name ) for node_name in tiles ]
-        vfs   = [ node.V for node in nodes ]
-        ops   = [ node.op for node in nodes ]
+      s.verbose = False
 
-        # Get the possible vf options for this tile
+      for tile_i, tiles in enumerate( tile_list ):
 
-        highest_vf = max( vfs )
-        lowest_vf  = min( vfs )
+        vf_options = tile_options[tile_i]
 
-        vdiff = lowest_vf - highest_vf
-        if vdiff > -0.01 and vdiff < 0.01: # same
+        if vf_options is None:
           print( 'skipping tile', tile_i+1 )
           continue
 
-        vf_options = [ 0.61, 0.90 ]
+        s.prefetch( s.speculate( setting,
+          [ ( [ { node_name: vf for node_name in _tiles }
+                  for vf in _options ], False )
+              for _tiles, _options in zip( tile_list[tile_i:],
+                                           tile_options[tile_i:] )
+              if _options ],
+          dict ) )
 
         # Run each option
 
@@ -981,6 +1754,9 @@ class PowerModel:
 
         current_results = results[max_vf]
 
+        s.set_V_range( setting )
+        s.rebase()
+
         # Print
 
         for vf, value in ed_product.items():
@@ -1005,9 +1781,11 @@ class PowerModel:
 
       extracted_settings = s.extract_node_settings()
 
-      with open( s.g.json + '.final.eeff.nodes', 'w' ) as fd:
-        json.dump( extracted_settings, fd, sort_keys=True, indent=4,
-          separators=(',', ': ') )
+      s.g.dump_json( extracted_settings, s.g.json + '.final.eeff.nodes' )
+
+      # Save performance cache for future runs on this DFG
+
+      s.save_cache()
 
       # Dump search results
 
@@ -11,61 +11,536 @@
 # Date   : August 13, 2019
 #
 
-from collections import deque
+from EventQueue import EventQueue
+from Trace      import TraceWriter, dump_dot
+from Trace      import FIRE, PUSH, POP, STALL, SINK
+from parameters import dvfs_ticks, ticks_per_cycle
+
+# Version of the results of calc_performance, which keys persisted
+# results (e.g., the performance cache of the power model). Bump it
+# whenever the results change.
+
+perf_version = 2
+
+# TokenArray
+#
+# Struct-of-arrays storage for a set of tokens. Tokens represent data and
+# live on wires, so the simulator keeps one entry per edge. Each token has
+# a value, and a guard that only releases the value once the guard span
+# has elapsed since the guard began (modeling the critical path of the
+# producer). A value of False means the token is not set.
+#
+# Guard times and spans are in integer ticks (see parameters.py).
+
+class TokenArray( object ):
+
+  __slots__ = ( 'value', 'guard_begin', 'guard_span', 'guard_set' )
+
+  def __init__( s, n ):
+    s.value       = [ False ] * n
+    s.guard_begin = [ 0     ] * n
+    s.guard_span  = [ 0     ] * n
+    s.guard_set   = [ False ] * n
+
+  def __len__( s ):
+    return len( s.value )
+
+  def clear( s ):
+    n = len( s.value )
+    s.value[:]       = [ False ] * n
+    s.guard_begin[:] = [ 0     ] * n
+    s.guard_span[:]  = [ 0     ] * n
+    s.guard_set[:]   = [ False ] * n
+
+  # copy_from
+  #
+  # Copy token i from another token array
+
+  def copy_from( s, other, i ):
+    s.value[i]       = other.value[i]
+    s.guard_begin[i] = other.guard_begin[i]
+    s.guard_span[i]  = other.guard_span[i]
+    s.guard_set[i]   = other.guard_set[i]
+
+  # assign
+  #
+  # Copy all tokens from another token array in place (views into this
+  # array stay valid)
+
+  def assign( s, other ):
+    s.value[:]       = other.value
+    s.guard_begin[:] = other.guard_begin
+    s.guard_span[:]  = other.guard_span
+    s.guard_set[:]   = other.guard_set
+
+  def copy( s ):
+    c = TokenArray( 0 )
+    c.assign( s )
+    return c
+
+# QueueArray
+#
+# Struct-of-arrays storage for a set of fixed-capacity FIFO queues, with
+# one queue per edge (i.e., the input queue of the destination node for
+# tokens from the source node). Each queue is a ring buffer with a head
+# (the oldest entry) and a count. Pushing into a full queue drops the
+# oldest entry.
+
+class QueueArray( object ):
+
+  __slots__ = ( 'capacity', 'head', 'count', 'data' )
+
+  def __init__( s, n, capacity=2 ):
+    s.capacity = capacity
+    s.head     = [ 0 ] * n
+    s.count    = [ 0 ] * n
+    s.data     = [ False ] * ( n * capacity )
+
+  def __len__( s ):
+    return len( s.count )
+
+  def clear( s ):
+    n = len( s.count )
+    s.head[:]  = [ 0 ] * n
+    s.count[:] = [ 0 ] * n
+    s.data[:]  = [ False ] * ( n * s.capacity )
+
+  def push( s, i, v ):
+    C = s.capacity
+    if s.count[i] == C:
+      s.head[i] = ( s.head[i] + 1 ) % C
+    else:
+      s.count[i] += 1
+    s.data[ i*C + ( s.head[i] + s.count[i] - 1 ) % C ] = v
+
+  def pop( s, i ):
+    if not s.count[i]:
+      raise IndexError( 'pop from an empty queue' )
+    C = s.capacity
+    v = s.data[ i*C + s.head[i] ]
+    s.head[i]   = ( s.head[i] + 1 ) % C
+    s.count[i] -= 1
+    return v
+
+  # peek
+  #
+  # Oldest entry of queue i (False if the queue is empty)
+
+  def peek( s, i ):
+    if not s.count[i]:
+      return False
+    return s.data[ i*s.capacity + s.head[i] ]
+
+  # entries
+  #
+  # Entries of queue i from newest to oldest
+
+  def entries( s, i ):
+    C = s.capacity
+    return [ s.data[ i*C + ( s.head[i] + k ) % C ]
+               for k in reversed( range( s.count[i] ) ) ]
+
+  def copy_from( s, other, i ):
+    C = s.capacity
+    s.head[i]  = other.head[i]
+    s.count[i] = other.count[i]
+    s.data[ i*C : (i+1)*C ] = other.data[ i*C : (i+1)*C ]
+
+  def assign( s, other ):
+    s.capacity = other.capacity
+    s.head[:]  = other.head
+    s.count[:] = other.count
+    s.data[:]  = other.data
+
+  def copy( s ):
+    c = QueueArray( 0, s.capacity )
+    c.assign( s )
+    return c
+
+# SimState
+#
+# The whole mutable state of the simulator as flat arrays:
+#
+# - wires         : Tokens on the real wires, indexed by edge
+# - shadow        : Tokens on the shadow wires, indexed by edge
+# - queues        : Real input queues, indexed by edge
+# - shadow_queues : Shadow input queues, indexed by edge
+# - live_out      : Special token of each live-out node, indexed by node
+# - time          : Time of the next tick of each node (in ticks)
+# - period        : Cycle time of each node (in ticks)
+# - token_counter : Next token to send from each live-in node
+# - pipewait      : Whether each node pushed a token this timestep
+#
+# Copying the state is a handful of list copies, so the whole simulator
+# can be snapshotted and restored cheaply.
+
+class SimState( object ):
+
+  __slots__ = ( 'wires', 'shadow', 'queues', 'shadow_queues', 'live_out',
+                'time', 'period', 'token_counter', 'pipewait' )
+
+  def __init__( s, n_nodes, n_edges, capacity=2 ):
+    s.wires         = TokenArray( n_edges )
+    s.shadow        = TokenArray( n_edges )
+    s.queues        = QueueArray( n_edges, capacity )
+    s.shadow_queues = QueueArray( n_edges, capacity )
+    s.live_out      = TokenArray( n_nodes )
+    s.time          = [ 0     ] * n_nodes
+    s.period        = [ 0     ] * n_nodes
+    s.token_counter = [ 1     ] * n_nodes
+    s.pipewait      = [ False ] * n_nodes
+
+  def assign( s, other ):
+    s.wires.assign( other.wires )
+    s.shadow.assign( other.shadow )
+    s.queues.assign( other.queues )
+    s.shadow_queues.assign( other.shadow_queues )
+    s.live_out.assign( other.live_out )
+    s.time[:]          = other.time
+    s.period[:]        = other.period
+    s.token_counter[:] = other.token_counter
+    s.pipewait[:]      = other.pipewait
+
+  def copy( s ):
+    c = SimState( 0, 0, s.queues.capacity )
+    c.assign( s )
+    return c
+
+# SimCounters
+#
+# Activity counters of the sim nodes and edges as flat arrays, which the
+# sim nodes update as they tick:
+#
+# - fired        : Times each node fired (or sent a live-in token)
+# - stalled      : Ticks in which each node had a token ready on an output
+#                  wire but the downstream queue was not ready
+#                  (backpressure)
+# - active       : Ticks in which each node was not starved, i.e., it had
+#                  tokens left to send (or sent some this timestep) or a
+#                  full set of input tokens
+# - edge_stalled : Ticks in which the source of each edge stalled on it
+# - occupancy    : Histogram of the time (in ticks) that the queue of each
+#                  edge held 0, 1, ... tokens (depth entries per edge,
+#                  flattened)
+#
+# Most ticks of most nodes are spent starved, so we only count the other
+# ticks, and the simulator works out the number of ticks of each node
+# from its period (see since). The occupancy is only updated when a
+# queue changes, so the time since its last change (changed) is still
+# pending and added in by occupancy_at.
+#
+# While the simulator looks for steady state, it needs the counters at
+# the start of the period, which is only known once the period is found.
+# Instead of copying the counters at every timestep, each update is then
+# also logged, and a mark is just a position in the log. The counters
+# at a mark are recovered by undoing the updates logged since.
+#
+# The counters are not part of the simulator state, so they do not
+# affect steady-state detection or snapshots.
+
+class SimCounters( object ):
+
+  __slots__ = ( 'fired', 'stalled', 'active', 'edge_stalled', 'occupancy',
+                'changed', 'ticks', 'starved', 'depth', 'begin', 'time',
+                'log' )
+
+  def __init__( s, n_nodes, n_edges, capacity=2 ):
+    s.depth        = capacity + 1
+    s.begin        = 0
+    s.time         = 0
+    s.fired        = [ 0 ] * n_nodes
+    s.stalled      = [ 0 ] * n_nodes
+    s.active       = [ 0 ] * n_nodes
+    s.edge_stalled = [ 0 ] * n_edges
+    s.occupancy    = [ 0 ] * ( n_edges * s.depth )
+    s.changed      = [ 0 ] * n_edges
+    s.ticks        = None
+    s.starved      = None
+    s.log          = None
+
+  # clear
+  #
+  # Start counting from the given time, logging updates if log is set
+
+  def clear( s, time=0, log=False ):
+    s.begin = time
+    s.time  = time
+    for counts in ( s.fired, s.stalled, s.active, s.edge_stalled,
+                    s.occupancy ):
+      counts[:] = [ 0 ] * len( counts )
+    s.changed[:] = [ time ] * len( s.changed )
+    s.log        = [] if log else None
+
+  # Updates
+  #
+  # Logged as plain ints (k*4 + kind, see kinds), which is much cheaper
+  # on the garbage collector than logging tuples
+
+  kinds = ( 'fired', 'stalled', 'active', 'edge_stalled' )
+
+  def fire( s, i ):
+    s.fired[i] += 1
+    if s.log is not None:
+      s.log.append( i*4 )
+
+  def stall( s, i ):
+    s.stalled[i] += 1
+    if s.log is not None:
+      s.log.append( i*4 + 1 )
+
+  def activate( s, i ):
+    s.active[i] += 1
+    if s.log is not None:
+      s.log.append( i*4 + 2 )
+
+  def stall_edge( s, e ):
+    s.edge_stalled[e] += 1
+    if s.log is not None:
+      s.log.append( e*4 + 3 )
+
+  # occupy
+  #
+  # Called before the queue of edge e changes at the given time, with the
+  # number of tokens it held until then. Logged as the time of the last
+  # change followed by the (negated) histogram entry.
+
+  def occupy( s, e, count, time ):
+    k = e*s.depth + count
+    if s.log is not None:
+      s.log.append( s.changed[e] )
+      s.log.append( -1 - k )
+    s.occupancy[k] += time - s.changed[e]
+    s.changed[e]    = time
+
+  # occupancy_at
+  #
+  # Occupancy histogram at the given time, given the number of tokens in
+  # each queue at that time
+
+  def occupancy_at( s, time, count ):
+    D   = s.depth
+    occ = s.occupancy[:]
+    for e, changed in enumerate( s.changed ):
+      occ[ e*D + count[e] ] += time - changed
+    return occ
+
+  # mark
+  #
+  # Position to come back to with since
+
+  def mark( s, time ):
+    return ( time, len( s.log ) )
+
+  # copy
+  #
+  # Copy of the counters, undoing the updates logged after the given log
+  # position (if any)
+
+  def copy( s, position=None ):
+
+    c = SimCounters( 0, 0, s.depth - 1 )
+
+    c.begin        = s.begin
+    c.time         = s.time
+    c.fired        = s.fired[:]
+    c.stalled      = s.stalled[:]
+    c.active       = s.active[:]
+    c.edge_stalled = s.edge_stalled[:]
+    c.occupancy    = s.occupancy[:]
+    c.changed      = s.changed[:]
+
+    if position is not None:
+      counts = [ getattr( c, kind ) for kind in s.kinds ]
+      log    = s.log
+      j      = len( log )
+      while j > position:
+        j   -= 1
+        code = log[j]
+        if code >= 0:
+          counts[ code & 3 ][ code >> 2 ] -= 1
+        else:
+          k       = -1 - code
+          e       = k // s.depth
+          j      -= 1
+          changed = log[j]
+          c.occupancy[k] -= c.changed[e] - changed
+          c.changed[e]    = changed
+
+    return c
+
+  # since
+  #
+  # Counters from an earlier mark until the given time, given the number
+  # of tokens in each queue (which must be the same at both times, e.g.,
+  # over a steady-state period) and the number of ticks of each node in
+  # between. Without a mark, counts since the counters were cleared.
+
+  def since( s, mark, time, count, ticks ):
+
+    c = s.copy()
+
+    c.time      = time
+    c.occupancy = s.occupancy_at( time, count )
+    c.changed   = [ time ] * len( s.changed )
+
+    if mark is not None:
+      begin, position = mark
+      then = s.copy( position )
+      sub  = lambda a, b: [ x - y for x, y in zip( a, b ) ]
+      c.begin        = begin
+      c.fired        = sub( c.fired,        then.fired        )
+      c.stalled      = sub( c.stalled,      then.stalled      )
+      c.active       = sub( c.active,       then.active       )
+      c.edge_stalled = sub( c.edge_stalled, then.edge_stalled )
+      c.occupancy    = sub( c.occupancy,
+                            then.occupancy_at( begin, count ) )
+
+    c.ticks   = list( ticks )
+    c.starved = [ t - a for t, a in zip( c.ticks, c.active ) ]
+
+    return c
+
+  # summary
+  #
+  # Plain lists (indexed by node and edge) over the window of the
+  # counters (with times in nominal cycles), which can be cached and sent
+  # between processes
+
+  def summary( s, ticks_per_cycle ):
+    D = s.depth
+    return {
+      'cycles'       : ( s.time - s.begin ) / ticks_per_cycle,
+      'fired'        : s.fired[:],
+      'stalled'      : s.stalled[:],
+      'starved'      : s.starved[:],
+      'ticks'        : s.ticks[:],
+      'edge_stalled' : s.edge_stalled[:],
+      'occupancy'    : [ [ t / ticks_per_cycle
+                             for t in s.occupancy[ e*D : (e+1)*D ] ]
+                           for e in range( len( s.edge_stalled ) ) ],
+    }
 
 # Token
 #
-# Tokens represent data and live on wires. When placing data on a wire, we
-# set the token. when pulling data off a wire, we unset the token.
+# A view of one token in a token array, for debugging and plotting. When
+# placing data on a wire, we set the token. when pulling data off a wire,
+# we unset the token. A token created on its own gets its own storage.
 
 class Token( object ):
 
-  def __init__( s ):
-    s.value       = False
-    s.guard_begin = 0.0
-    s.guard_span  = 0.0
-    s.guard_set   = False
+  __slots__ = ( 'tokens', 'i' )
+
+  def __init__( s, tokens=None, i=0 ):
+    s.tokens = tokens if tokens is not None else TokenArray( 1 )
+    s.i      = i
 
   def set( s, v ):
-    s.value = v # use non-zero integer tokens for SimNode any/all to work
+    s.tokens.value[s.i] = v # use non-zero integer tokens for SimNode any/all to work
 
   def read( s ):
-    return s.value
+    return s.tokens.value[s.i]
 
   def guarded_set( s, v, time, span ):
-    s.value       = v
-    s.guard_begin = time
-    s.guard_span  = span
-    s.guard_set   = True
+    s.tokens.value[s.i]       = v
+    s.tokens.guard_begin[s.i] = time
+    s.tokens.guard_span[s.i]  = span
+    s.tokens.guard_set[s.i]   = True
 
   def guarded_read( s, time ):
-    if s.guard_set:
-      time_elapsed = time - s.guard_begin
-      diff         = time_elapsed - s.guard_span
-      # Accomodate floating-point precision (e.g., is 1.34 > 1.34 True or
-      # False?)
-      if diff > -0.001 :
-        return s.value
+    t, i = s.tokens, s.i
+    if t.guard_set[i] and time - t.guard_begin[i] >= t.guard_span[i]:
+      return t.value[i]
     return False
 
   def deassert_guard( s ):
-    s.guard_set = False
+    s.tokens.guard_set[s.i] = False
+
+  # state
+  #
+  # Hashable summary of this token for steady-state detection. Only
+  # whether a token is set matters for timing (not its iteration count),
+  # and guard times are taken relative to the current time (see
+  # Simulator.state_key).
+
+  def state( s, time ):
+    t, i = s.tokens, s.i
+    if not t.value[i]:
+      return None
+    return ( t.guard_set[i], max( t.guard_begin[i] - time, -t.guard_span[i] ),
+             t.guard_span[i] )
+
+# Queue
+#
+# A view of one queue in a queue array, for debugging and plotting. This
+# behaves like a deque( maxlen=capacity ) where new entries are pushed on
+# the left, so q[-1] is the oldest entry.
+
+class Queue( object ):
+
+  __slots__ = ( 'queues', 'i' )
+
+  def __init__( s, queues, i ):
+    s.queues = queues
+    s.i      = i
+
+  @property
+  def maxlen( s ):
+    return s.queues.capacity
+
+  def __len__( s ):
+    return s.queues.count[s.i]
+
+  def __iter__( s ):
+    return iter( s.queues.entries( s.i ) )
+
+  def __getitem__( s, k ):
+    return s.queues.entries( s.i )[k]
+
+  def __repr__( s ):
+    return 'Queue({})'.format( s.queues.entries( s.i ) )
+
+  def appendleft( s, v ):
+    s.queues.push( s.i, v )
+
+  def pop( s ):
+    return s.queues.pop( s.i )
+
+  def clear( s ):
+    s.queues.head[s.i]  = 0
+    s.queues.count[s.i] = 0
 
 # SimNode
 #
 # A simulator node wraps the underlying node with simulator-related
 # methods, including being able to 'tick', produce data onto wires, and
 # consume data from wires.
+#
+# The state of the node lives in the shared SimState at its node index,
+# and the state of its wires and input queues lives there at their edge
+# indices. The token and queue views (e.g., queues, wires_fanout) are
+# kept for debugging and plotting, while the methods below work on the
+# arrays directly.
 
 class SimNode( object ):
 
-  def __init__( s, node, verbose=False ):
+  def __init__( s, node, state, index, counters=None, verbose=False ):
 
     s.verbose = verbose
 
     s.node = node
     s.name = s.node.name
 
+    s.state = state
+    s.index = index
+
+    # Activity counters shared with the simulator (see SimCounters)
+
+    if counters is None:
+      counters = SimCounters( len( state.time ), len( state.queues ),
+                              state.queues.capacity )
+
+    s.counters = counters
+
     s.n_srcs = len( s.node.all_srcs() )
     s.n_dsts = len( s.node.all_dsts() )
 
@@ -74,42 +549,75 @@ class SimNode( object ):
     s.live_in  = False
     s.live_out = False
 
-    # Counter for sources (i.e., producing live-ins)
-    #
-    # Tokens start at 1 as valid values and increment
+    s.pipeline = False # Enable pipeline behavior
 
-    s.token_counter = 1
+    # Dirty set shared with the simulator. A node registers itself here
+    # whenever it writes its shadow wires, shadow queues, or pipewait, so
+    # the simulator only commits nodes that changed in this timestep.
 
-    # Input queues
+    s.dirty = set()
 
-    s.queues = { src: deque( maxlen=2 ) for src in s.node.all_srcs() }
-    s.shadow_queues = { src: deque( maxlen=2 ) for src in s.node.all_srcs() }
-    s.pipeline = False # Enable pipeline behavior
-    s.pipewait = False
+    # Event trace writer shared with the simulator (None if not tracing).
+    # Events are only recorded while the writer is active.
 
-    # Special token for live-out nodes, which have no fanout but still
-    # need to wait for data to propagate (e.g., for sram write)
+    s.trace = None
+
+  # Per-node state
+  #
+  # - time          : Time of the next tick (in ticks)
+  # - period        : Cycle time, looked up from the cycle time of the
+  #                   node on reset since it can change between runs
+  # - token_counter : Counter for sources (i.e., producing live-ins).
+  #                   Tokens start at 1 as valid values and increment
+  # - pipewait      : Whether this node pushed a token this timestep
+
+  @property
+  def time( s ):
+    return s.state.time[s.index]
+
+  @time.setter
+  def time( s, v ):
+    s.state.time[s.index] = v
+
+  @property
+  def period( s ):
+    return s.state.period[s.index]
 
-    s.live_out_token = Token()
+  @property
+  def token_counter( s ):
+    return s.state.token_counter[s.index]
 
-    # Initialize first tick
+  @token_counter.setter
+  def token_counter( s, v ):
+    s.state.token_counter[s.index] = v
 
-    s.time = 0.0
+  @property
+  def pipewait( s ):
+    return s.state.pipewait[s.index]
+
+  @pipewait.setter
+  def pipewait( s, v ):
+    s.state.pipewait[s.index] = v
+
+  # reset
+  #
+  # The simulator clears the shared arrays, so we only need to set the
+  # period and the token counter
 
   def reset( s ):
-    s.token_counter = 1
-    s.time = 0.0
-    for k in s.queues.keys():
-      s.queues[k].clear()
-      s.shadow_queues[k].clear()
-    s.pipewait = False
-
-  def setup( s, nodes_fanout, wires_fanout, wires_fanin, shadow_fanout, shadow_fanin ):
+    s.state.time[s.index]          = 0
+    s.state.period[s.index]        = dvfs_ticks( s.node.T )
+    s.state.token_counter[s.index] = 1
+    s.state.pipewait[s.index]      = False
+
+  def setup( s, nodes_fanout, wires_fanout, wires_fanin, shadow_fanout, shadow_fanin,
+                dirty ):
     s.nodes_fanout  = nodes_fanout
     s.wires_fanout  = wires_fanout
     s.wires_fanin   = wires_fanin
     s.shadow_fanout = shadow_fanout
     s.shadow_fanin  = shadow_fanin
+    s.dirty         = dirty
 
     if not s.shadow_fanin and s.shadow_fanout:
       s.live_in = True
@@ -117,82 +625,155 @@ class SimNode( object ):
     if s.shadow_fanin and not s.shadow_fanout:
       s.live_out = True
 
+    # Edge indices of the output wires (with the downstream nodes) and of
+    # the input queues (by source)
+
+    s.out_edges = [ ( s.nodes_fanout[dst], token.i )
+                      for dst, token in s.wires_fanout.items() ]
+    s.in_edges  = [ token.i for token in s.wires_fanin.values() ]
+    s.in_index  = { src: token.i for src, token in s.wires_fanin.items() }
+
+    # Input queues (views)
+
+    s.queues        = { src: Queue( s.state.queues, e )
+                          for src, e in s.in_index.items() }
+    s.shadow_queues = { src: Queue( s.state.shadow_queues, e )
+                          for src, e in s.in_index.items() }
+
+    # Special token for live-out nodes, which have no fanout but still
+    # need to wait for data to propagate (e.g., for sram write)
+
+    s.live_out_token = Token( s.state.live_out, s.index )
+
+  # commit
+  #
+  # Copy the shadow wires and shadow queues of this node into the real
+  # wires and queues, and clear the pipe wait. Called by the simulator
+  # when time advances, but only for nodes in the dirty set.
+
+  def commit( s ):
+    state = s.state
+    for _, e in s.out_edges:
+      state.wires.copy_from( state.shadow, e )
+    for e in s.in_edges:
+      state.queues.copy_from( state.shadow_queues, e )
+    state.pipewait[s.index] = False
+
   def tick( s ):
 
-    if s.verbose: print( s.time, ': (*)', s.name, 'tick' )
+    state  = s.state
+    wires  = state.wires
+    shadow = state.shadow
+    queues = state.queues
+    time   = state.time[s.index]
+
+    if s.verbose: print( time, ': (*)', s.name, 'tick' )
+
+    stalled = False
 
-    # For all outputs that have finished propagating (i.e., guarded_read
-    # succeeds), use this edge to try to write into the input queues of
-    # the downstream nodes. If the guarded read fails, it represents the
-    # case where data has not finished propagating. If the downstream
+    # For all outputs that have finished propagating (i.e., the guarded
+    # read succeeds), use this edge to try to write into the input queues
+    # of the downstream nodes. If the guarded read fails, it represents
+    # the case where data has not finished propagating. If the downstream
     # queue is full, it represents a "not ready" signal for this cycle,
     # which stalls this node.
 
-    for dst in s.wires_fanout:
-      token       = s.wires_fanout[dst]
-      token_value = token.guarded_read( time=s.time )
+    for downstream_node, e in s.out_edges:
+
+      if wires.guard_set[e] and time - wires.guard_begin[e] >= wires.guard_span[e]:
+        token_value = wires.value[e]
+      else:
+        token_value = False
 
       if not token_value:
-        if s.verbose: print( s.time, ':', s.name, 'found not ready --', dst )
+        if s.verbose: print( time, ':', s.name, 'found not ready --', downstream_node.name )
         continue
 
       # Check if the downstream queue for this output was ready this
       # cycle. If it was ready, then this token pushes into the downstream
       # queue and the token is consumed.
 
-      downstream_node = s.nodes_fanout[dst]
-
-      if downstream_node.ready( time=s.time, src=s.name ):
-        if s.verbose: print( s.time, ':', s.name, 'found ready --', downstream_node.name )
-        if s.verbose: print( s.time, ':', s.name, 'trying to push to', downstream_node.name )
-        downstream_node.push( time=s.time,
+      if downstream_node.ready( time=time, src=s.name ):
+        if s.verbose: print( time, ':', s.name, 'found ready --', downstream_node.name )
+        if s.verbose: print( time, ':', s.name, 'trying to push to', downstream_node.name )
+        downstream_node.push( time=time,
                               src=s.name,
                               token_value=token_value )
-        token.set( False )            # consume
-        token.deassert_guard()        # tokens
-        token = s.shadow_fanout[dst]  #
-        token.set( False )            #
-        token.deassert_guard()        #
-        s.pipewait = True
+        wires.value[e]      = False # consume
+        wires.guard_set[e]  = False # tokens
+        shadow.value[e]     = False #
+        shadow.guard_set[e] = False #
+        state.pipewait[s.index] = True
+        s.dirty.add( s )
+      else:
+        if not stalled:
+          s.counters.stall( s.index )
+          stalled = True
+        s.counters.stall_edge( e )
+        if s.trace and s.trace.active:
+          s.trace.record( STALL, time, s.index, e, queues.count[e],
+                          token_value )
 
     # Dequeue from the input queues if all fanout tokens are gone
 
     if not s.live_out:
-      fanout_empty = all( [ t.read()==False for t in s.wires_fanout.values() ] )
-      peek_values = [ q[-1] if q else False for q in s.queues.values() ]
+      fanout_empty = not any( [ wires.value[e] for _, e in s.out_edges ] )
+      peek_values = [ queues.peek( e ) for e in s.in_edges ]
       if peek_values and all( peek_values ):
+        s.counters.activate( s.index )
         if fanout_empty:
           # Dequeue the front of the input queues
-          if s.verbose: print( s.time, ':', s.name, 'pushed everything, popping input queues' )
-          for k in s.queues.keys():
-            s.queues[k].pop()
-            s.shadow_queues[k].pop()
+          if s.verbose: print( time, ':', s.name, 'pushed everything, popping input queues' )
+          for e in s.in_edges:
+            queues.pop( e )
+            s.counters.occupy( e, state.shadow_queues.count[e], time )
+            state.shadow_queues.pop( e )
+          s.dirty.add( s )
+          if s.trace and s.trace.active:
+            for e in s.in_edges:
+              s.trace.record( POP, time, s.index, e,
+                              state.shadow_queues.count[e], 0 )
           # Try to fire another token if we are ready
-          peek_values = [ q[-1] if q else False for q in s.queues.values() ]
+          peek_values = [ queues.peek( e ) for e in s.in_edges ]
           if peek_values and all( peek_values ):
             max_val = max( peek_values )
-            s.fire( time=s.time, token_value=max_val )
+            s.fire( time=time, token_value=max_val )
+      # Otherwise, the node is starved unless it has something left to
+      # send (or sent something this timestep)
+      elif not fanout_empty or s.live_in or state.pipewait[s.index]:
+        s.counters.activate( s.index )
 
     # Special handling for live-out nodes, which have no fanout but still
     # need to wait for data to propagate (e.g., for sram write)
 
     if s.live_out:
-      if s.live_out_token.guarded_read( time=s.time ):
-        if s.verbose: print( s.time, ':', s.name, 'sinking token', s.live_out_token.read() )
+      if s.live_out_token.read() or \
+         all( [ queues.count[e] for e in s.in_edges ] ):
+        s.counters.activate( s.index )
+      if s.live_out_token.guarded_read( time=time ):
+        if s.verbose: print( time, ':', s.name, 'sinking token', s.live_out_token.read() )
+        if s.trace and s.trace.active:
+          s.trace.record( SINK, time, s.index, -1, 0,
+                          s.live_out_token.read() )
         s.live_out_token.set( False )     # consume
         s.live_out_token.deassert_guard() # token
         # Dequeue the front of the input queues
-        for k in s.queues.keys():
-          if s.queues[k]:
-            s.queues[k].pop()
-          if s.shadow_queues[k]:
-            s.shadow_queues[k].pop()
-        s.pipewait = True
+        for e in s.in_edges:
+          if queues.count[e]:
+            queues.pop( e )
+          if state.shadow_queues.count[e]:
+            s.counters.occupy( e, state.shadow_queues.count[e], time )
+            state.shadow_queues.pop( e )
+            if s.trace and s.trace.active:
+              s.trace.record( POP, time, s.index, e,
+                              state.shadow_queues.count[e], 0 )
+        state.pipewait[s.index] = True
+        s.dirty.add( s )
         # Try to fire another token if we are ready
-        peek_values = [ q[-1] if q else False for q in s.queues.values() ]
+        peek_values = [ queues.peek( e ) for e in s.in_edges ]
         if peek_values and all( peek_values ):
           max_val = max( peek_values )
-          s.fire( time=s.time, token_value=max_val )
+          s.fire( time=time, token_value=max_val )
 
     # If not all tokens have finished sending, then wait..
 
@@ -200,15 +781,17 @@ class SimNode( object ):
 
     if s.live_in:
       # Check if we need to send the next token
-      token_fanout = [ t.read() for t in s.shadow_fanout.values() ]
-      produce_not_done = any( token_fanout )
+      produce_not_done = any( [ shadow.value[e] for _, e in s.out_edges ] )
       if produce_not_done: return
       # Send the next token
-      token_value = s.token_counter
-      if s.verbose: print( s.time, ':', s.name, 'sending live in token', token_value )
-      for token in s.shadow_fanout.values():
-        token.guarded_set( v=token_value, time=s.time, span=s.node.T )
-      s.token_counter += 1
+      token_value = state.token_counter[s.index]
+      if s.verbose: print( time, ':', s.name, 'sending live in token', token_value )
+      if s.trace and s.trace.active:
+        s.trace.record( FIRE, time, s.index, -1, 0, token_value )
+      s.counters.fire( s.index )
+      s.guarded_set_fanout( token_value, time )
+      s.dirty.add( s )
+      state.token_counter[s.index] += 1
 
   def ready( s, time, src ):
 
@@ -219,10 +802,12 @@ class SimNode( object ):
 
     if src != None:
       if s.verbose: print( time, ':', s.name, 'checking backpressure', src, s.queues )
-      if len( s.queues[src] ) == s.queues[src].maxlen :
+      queues = s.state.queues
+      count  = queues.count[ s.in_index[src] ]
+      if count == queues.capacity :
         return False
 
-      if not s.pipeline and len( s.queues[src] ) == s.queues[src].maxlen - 1 and s.pipewait:
+      if not s.pipeline and count == queues.capacity - 1 and s.state.pipewait[s.index]:
         if s.verbose: print( time, ':', s.name, 'pipewait', src )
         return False
 
@@ -236,12 +821,21 @@ class SimNode( object ):
 
     if s.verbose: print( time, ':', s.name, 'pushing token', token_value )
 
-    s.shadow_queues[src].appendleft( token_value )
+    shadow_queues = s.state.shadow_queues
+
+    e = s.in_index[src]
+    s.counters.occupy( e, shadow_queues.count[e], time )
+    shadow_queues.push( e, token_value )
+    s.dirty.add( s )
+
+    if s.trace and s.trace.active:
+      s.trace.record( PUSH, time, s.index, e, shadow_queues.count[e],
+                      token_value )
 
     # Check whether all input data is ready (i.e., when all tokens
     # in the input queues are set)
 
-    peek_values = [ q[-1] if q else False for q in s.shadow_queues.values() ]
+    peek_values = [ shadow_queues.peek( k ) for k in s.in_edges ]
 
     consume_ready = all( peek_values )
 
@@ -255,7 +849,7 @@ class SimNode( object ):
 
     max_val = max( peek_values )
 
-    if len( s.shadow_queues[src] ) == 1:
+    if shadow_queues.count[e] == 1:
       s.fire( time=time, token_value=max_val )
 
   # fire
@@ -265,10 +859,16 @@ class SimNode( object ):
     # Push a token toward each downstream node. Send the max of all
     # input tokens, representing the latest iteration count.
 
-    if s.verbose: print( time, ':', s.name, 'firing token', token_value, 'with guard', s.node.T )
+    if s.verbose: print( time, ':', s.name, 'firing token', token_value, 'with guard', s.period )
+
+    if s.trace and s.trace.active:
+      occupancy = sum( s.state.shadow_queues.count[e] for e in s.in_edges )
+      s.trace.record( FIRE, time, s.index, -1, occupancy, token_value )
+
+    s.counters.fire( s.index )
 
-    for token in s.shadow_fanout.values():
-      token.guarded_set( v=token_value, time=time, span=s.node.T )
+    s.guarded_set_fanout( token_value, time )
+    s.dirty.add( s )
 
     # Special handling for live-out nodes, which have no fanout but still
     # need to wait for data to propagate (e.g., for sram write)
@@ -276,7 +876,20 @@ class SimNode( object ):
     if s.live_out:
       s.live_out_token.guarded_set( v    = token_value,
                                     time = time,
-                                    span = s.node.T )
+                                    span = s.period )
+
+  # guarded_set_fanout
+  #
+  # Set the token on each shadow output wire with a guard of one period
+
+  def guarded_set_fanout( s, v, time ):
+    shadow = s.state.shadow
+    span   = s.state.period[s.index]
+    for _, e in s.out_edges:
+      shadow.value[e]       = v
+      shadow.guard_begin[e] = time
+      shadow.guard_span[e]  = span
+      shadow.guard_set[e]   = True
 
 # Simulator
 #
@@ -287,13 +900,41 @@ class SimNode( object ):
 
 class Simulator( object ):
 
-  def __init__( s, graph, verbose=False, do_plot=False ):
+  def __init__( s, graph, verbose=False, do_plot=False,
+                          tie_break='reverse_topo',
+                          max_tokens=50,
+                          trace=None, trace_window=None, trace_sample=1 ):
 
     s.g = graph
 
     s.verbose = verbose
     s.do_plot = do_plot
 
+    # Event tracing
+    #
+    # If trace is given, each run writes a binary event trace to
+    # <trace>.<run_id>.trace (see Trace.py). The trace can be restricted
+    # to a window of ( begin, end ) nominal cycles, and sampled to only
+    # record every trace_sample-th timestep.
+
+    s.trace        = trace
+    s.trace_window = trace_window
+    s.trace_sample = trace_sample
+
+    # Performance measurement knobs
+    #
+    # - max_tokens : Upper bound on the number of tokens to simulate
+    #
+    # See calc_performance.
+
+    s.max_tokens = max_tokens
+
+    # Steady state found by the last run (None if not found), and a
+    # snapshot of the simulator when it was found (see checkpoint)
+
+    s.steady          = None
+    s.steady_snapshot = None
+
     # Track how many times we have run simulation so we can tag outputs
 
     s.run_counter = 0
@@ -301,8 +942,13 @@ class Simulator( object ):
     #---------------------------------------------------------------------
     # Time
     #---------------------------------------------------------------------
+    # Time is kept in integer ticks, with ticks_per_cycle ticks in one
+    # nominal cycle (see parameters.py). Performance is reported in
+    # nominal cycles.
+
+    s.ticks_per_cycle = ticks_per_cycle
 
-    s.global_time = 0.0
+    s.global_time = 0
 
     #---------------------------------------------------------------------
     # Wire delay mode
@@ -317,6 +963,28 @@ class Simulator( object ):
     # tries to pop a token from a wire before the time guard is released,
     # the consumer node pop fails.
 
+    #---------------------------------------------------------------------
+    # State
+    #---------------------------------------------------------------------
+    # All mutable simulator state lives in flat arrays (see SimState). We
+    # number the nodes and the edges here, and the sim nodes, wires, and
+    # queues below are views into these arrays.
+
+    node_names = list( s.g.all_nodes() )
+
+    s.edges = [ ( src, dst ) for src in node_names
+                               for dst in s.g.get_node( src ).all_dsts() ]
+
+    s.state = SimState( n_nodes = len( node_names ),
+                        n_edges = len( s.edges ) )
+
+    # Activity counters of the nodes and edges (see SimCounters), and the
+    # counters over the measurement window of the last run (see run)
+
+    s.counters        = SimCounters( n_nodes = len( node_names ),
+                                     n_edges = len( s.edges ) )
+    s.counters_window = None
+
     #---------------------------------------------------------------------
     # Nodes
     #---------------------------------------------------------------------
@@ -325,10 +993,11 @@ class Simulator( object ):
 
     s.sim_nodes = {}
 
-    for node_name in s.g.all_nodes():
+    for i, node_name in enumerate( node_names ):
       node = s.g.get_node( node_name )
       s.sim_nodes[ node_name ] = \
-        SimNode( node, verbose=s.verbose )
+        SimNode( node, state=s.state, index=i, counters=s.counters,
+                       verbose=s.verbose )
 
     # Each sim node has a pointer to downstream sim nodes
 
@@ -368,14 +1037,18 @@ class Simulator( object ):
     s.wires_fanout  = {}
     s.wires_fanin   = {}
 
-    # A wire is an entry in this dictionary. A value of False within the
-    # token means the token is not set. A value of True means the token is
-    # set.
+    # A wire is an entry in this dictionary, which is a view of the token
+    # at the index of the edge in the wire array. A value of False within
+    # the token means the token is not set. A value of True means the
+    # token is set.
+
+    edge_index = { edge: e for e, edge in enumerate( s.edges ) }
 
     for sim_node in s.sim_nodes.values():
       name = sim_node.name
       s.wires_fanout[name] = \
-        { dst: Token() for dst in sim_node.node.all_dsts() }
+        { dst: Token( s.state.wires, edge_index[ ( name, dst ) ] )
+            for dst in sim_node.node.all_dsts() }
 
     # Create aliases for fanin from the fanout wires for convenience
 
@@ -389,7 +1062,8 @@ class Simulator( object ):
     for sim_node in s.sim_nodes.values():
       name = sim_node.name
       s.shadow_fanout[name] = \
-        { dst: Token() for dst in sim_node.node.all_dsts() }
+        { dst: Token( s.state.shadow, edge_index[ ( name, dst ) ] )
+            for dst in sim_node.node.all_dsts() }
 
     # Create aliases for fanin from the shadow fanout wires for convenience
 
@@ -398,6 +1072,11 @@ class Simulator( object ):
       s.shadow_fanin[name] = \
         { src: s.shadow_fanout[src][name] for src in sim_node.node.all_srcs() }
 
+    # Track the sim nodes that wrote their shadow wires or shadow queues
+    # since time last advanced. Only these need to be committed.
+
+    s.dirty = set()
+
     # Set up the wires for each sim node
 
     for sim_node in s.sim_nodes.values():
@@ -406,32 +1085,17 @@ class Simulator( object ):
                       wires_fanout  = s.wires_fanout[name],
                       wires_fanin   = s.wires_fanin[name],
                       shadow_fanout = s.shadow_fanout[name],
-                      shadow_fanin  = s.shadow_fanin[name] )
+                      shadow_fanin  = s.shadow_fanin[name],
+                      dirty         = s.dirty )
 
     #---------------------------------------------------------------------
-    # Priority queue that tracks ticks
+    # Event queue that tracks ticks
     #---------------------------------------------------------------------
-    # Quick and dirty priority queue
-
-    class PriorityQueue:
-      def __init__( s, order ):
-        s.order     = order
-        s.container = []
-      def add( s, time, name ):
-        s.container.append( ( time, name ) )
-        s.container = sorted( s.container, reverse=True, \
-          key = lambda x: ( x[0], s.order.index(x[1]) ) )
-      def pop( s ):
-        time, name = s.container[-1]
-        del( s.container[-1] )
-        return time, name
-      def empty( s ):
-        return len( s.container ) == 0
-
-    # Tick in reverse topological order
-
-    order = s.g.topological_sort()[::-1]
-    s.pq  = PriorityQueue( order )
+    # Ticks at the same time are ordered by the tie-break policy. By
+    # default, we tick in reverse topological order.
+
+    order = s.g.topological_sort()
+    s.pq  = EventQueue( order, policy=tie_break )
 
     # Reset
 
@@ -445,33 +1109,34 @@ class Simulator( object ):
 
   def reset( s ):
 
-    s.global_time = 0.0
+    s.global_time = 0
 
-    # Reset the sim nodes
+    # Drop any ticks left over from the previous run
 
-    for sim_node in s.sim_nodes.values():
-      sim_node.reset()
+    s.pq.clear()
 
-    # Reset the wires
+    # Reset the wires, shadow wires, and queues
 
-    for sim_node in s.sim_nodes.values():
-      name = sim_node.name
-      for token in s.wires_fanout[name].values():
-        token.set( False )
+    s.state.wires.clear()
+    s.state.shadow.clear()
+    s.state.queues.clear()
+    s.state.shadow_queues.clear()
+    s.state.live_out.clear()
+
+    # Reset the sim nodes (the real and shadow state are identical after
+    # reset, so nothing is dirty)
 
-    # Reset the shadow wires
+    s.dirty.clear()
 
     for sim_node in s.sim_nodes.values():
-      name = sim_node.name
-      for token in s.shadow_fanout[name].values():
-        token.set( False )
+      sim_node.reset()
 
     # Initialize recurrence wires
 
     for edge in s.g.recurrence_edges:
       src, dst = edge
-      s.shadow_fanout[src][dst].guarded_set( 1, s.global_time, 0.0 )
-      s.wires_fanout[src][dst].guarded_set( 1, s.global_time, 0.0 )
+      s.shadow_fanout[src][dst].guarded_set( 1, s.global_time, 0 )
+      s.wires_fanout[src][dst].guarded_set( 1, s.global_time, 0 )
 
     # Initialize phi nodes
 
@@ -479,22 +1144,113 @@ class Simulator( object ):
       name = sim_node.name
       if sim_node.node.op == 'phi':
         for token in s.shadow_fanout[name].values():
-          token.guarded_set( 1, s.global_time, sim_node.node.T )
+          token.guarded_set( 1, s.global_time, sim_node.period )
         for token in s.wires_fanout[name].values():
-          token.guarded_set( 1, s.global_time, sim_node.node.T )
+          token.guarded_set( 1, s.global_time, sim_node.period )
+
+  # state_key
+  #
+  # Hashable summary of the whole simulator state relative to the current
+  # time. If the same state is seen at two different times, the
+  # simulation is periodic from then on. This is called right after a
+  # commit, so the shadow wires and queues match the real ones.
+  #
+  # The summary includes the phase of each node, the occupancy of each
+  # input queue, and the state of each token on a wire (and of each
+  # live-out token). Only whether a token is set matters for timing (not
+  # its iteration count), and guard times are taken relative to the
+  # current time. Once a guard has expired, how long ago it did no longer
+  # matters, so expired guards are all summarized alike (otherwise a
+  # deadlocked graph with tokens stuck on its wires would never repeat).
+
+  def state_key( s ):
+
+    time = s.global_time
+
+    def tokens_key( tokens ):
+      return tuple( ( g, max( b - time, -span ), span ) if v else None
+                      for v, g, b, span in zip( tokens.value,
+                                                tokens.guard_set,
+                                                tokens.guard_begin,
+                                                tokens.guard_span ) )
+
+    return ( tuple( t - time for t in s.state.time ),
+             tuple( s.state.queues.count ),
+             tokens_key( s.state.wires ),
+             tokens_key( s.state.live_out ) )
+
+  # snapshot
+  #
+  # Returns a copy of the whole simulator state (including pending ticks
+  # and uncommitted writes), which restore() can return to later
+
+  def snapshot( s ):
+    return {
+      'state'       : s.state.copy(),
+      'events'      : s.pq.snapshot(),
+      'dirty'       : set( s.dirty ),
+      'global_time' : s.global_time,
+    }
+
+  # restore
+  #
+  # Return to a state saved with snapshot(). The arrays are copied in
+  # place so that the sim nodes and views stay valid, and the snapshot
+  # can be restored again.
+
+  def restore( s, snap ):
+    s.state.assign( snap['state'] )
+    s.pq.restore( snap['events'] )
+    s.dirty.clear()
+    s.dirty.update( snap['dirty'] )
+    s.global_time = snap['global_time']
 
   # run
   #
   # Run simulation
   #
+  # With steady_state=True, the simulator snapshots its state at the start
+  # of every timestep. As soon as a state repeats, the rest of the run is
+  # periodic, so we stop and extrapolate the point at which the live-in
+  # would have produced max_tokens tokens (see find_steady_state). The
+  # global time and token count then match a full-length run. If no
+  # tokens are produced over the period, the graph is deadlocked and we
+  # stop right away, with the global time set to infinity.
+  #
+  # The max_time is in nominal cycles.
+  #
+  # With resume=True, the run continues from the current state (e.g., a
+  # restored checkpoint) instead of starting the nodes from scratch.
+  #
+  # The activity counters start from zero on each run. If steady state is
+  # found, the counters are kept over exactly one period (from the
+  # history), otherwise over the whole run. Each node ticks once per
+  # period in between, so we count its ticks from its time.
+  #
 
-  def run( s, run_id, max_tokens = 10, max_time = 100000.0 ):
+  def run( s, run_id, max_tokens = 10, max_time = 100000.0,
+                      steady_state = False, resume = False ):
 #  def run( s, run_id, max_tokens = 10, max_time = 20.0 ):
 
+    s.steady          = None
+    s.steady_snapshot = None
+
+    # Snapshots of the state at the start of each timestep, and the
+    # (global time, token count, counters) at the start of each timestep
+
+    seen    = {}
+    history = []
+
+    activity   = s.counters
+    start_time = list( s.state.time )
+
+    activity.clear( s.global_time, log = steady_state )
+
     # Put all nodes at their default time into the priority queue
 
-    for sim_node in s.sim_nodes.values():
-      s.pq.add( sim_node.time, sim_node.name )
+    if not resume:
+      for sim_node in s.sim_nodes.values():
+        s.pq.add( sim_node.time, sim_node.name )
 
     # Track the token counter on any live-in node to know when to stop
 
@@ -503,13 +1259,19 @@ class Simulator( object ):
 
     token_count = live_in_node.token_counter
 
+    times    = s.state.time
+    periods  = s.state.period
+    counters = s.state.token_counter
+
+    trace = s.open_trace( run_id ) if s.trace else None
+
     # Simulate for some time
 
     while not s.pq.empty() and token_count <= max_tokens:
 
       # Time out
 
-      if s.global_time > max_time:
+      if s.global_time > max_time * s.ticks_per_cycle:
         print( 'Error: Timed out' )
         break
 
@@ -518,58 +1280,291 @@ class Simulator( object ):
       time, name = s.pq.pop()
 
       if time > s.global_time:
-        # Copy shadow wires to real wires
-        for sim_node in s.sim_nodes.values():
-          sim_node_name = sim_node.name
-          for k, token in s.shadow_fanout[sim_node_name].items():
-            s.wires_fanout[sim_node_name][k].value       = token.value
-            s.wires_fanout[sim_node_name][k].guard_begin = token.guard_begin
-            s.wires_fanout[sim_node_name][k].guard_span  = token.guard_span
-            s.wires_fanout[sim_node_name][k].guard_set   = token.guard_set
-        # Copy shadow queues to real queues
-        for sim_node in s.sim_nodes.values():
-          sim_node_name = sim_node.name
-          for k, q in sim_node.shadow_queues.items():
-            sim_node.queues[k].clear()
-            for entry in q:
-              sim_node.queues[k].append( entry )
-        # Clear pipe waits for input queues
-        for sim_node in s.sim_nodes.values():
-          sim_node.pipewait = False
+        # Copy shadow wires and shadow queues to the real wires and
+        # queues, and clear pipe waits. Nodes that did not write anything
+        # since time last advanced already match their shadows, so only
+        # the dirty nodes are committed.
+        for sim_node in s.dirty:
+          sim_node.commit()
+        s.dirty.clear()
         # Plot
-        if s.do_plot and s.global_time <= 20.0:
-          s.plot( dot_title = 'time='+str(s.global_time),
-                  dot_f     = str(s.global_time)+'.'+run_id+'.dot'  )
+        if s.do_plot and s.global_time <= 20 * s.ticks_per_cycle:
+          cycles = s.global_time / s.ticks_per_cycle
+          s.plot( dot_title = 'time='+str(cycles),
+                  dot_f     = str(cycles)+'.'+run_id+'.dot'  )
         # Update time
         s.global_time = time
+        if trace:
+          trace.advance( time )
+        # Check for steady state
+        if steady_state:
+          state = s.state_key()
+          if state in seen:
+            s.steady = s.find_steady_state( history, seen[state],
+                                            token_count, max_tokens )
+            s.counters_window = activity.since(
+              history[seen[state]][2], time, s.state.queues.count,
+              [ s.steady['period'] // period for period in periods ] )
+            s.pq.add( time, name ) # this tick has not run yet
+            if 'deadlocked' in s.steady:
+              print( 'Error: Deadlocked' )
+            else:
+              s.steady_snapshot = s.snapshot()
+              s.steady_snapshot['steady'] = s.steady
+            s.global_time = s.steady['latency']
+            live_in_node.token_counter = s.steady['tokens']
+            break
+          seen[state] = len( history )
+          history.append( ( s.global_time, token_count,
+                           activity.mark( s.global_time ) ) )
 
       sim_node = s.sim_nodes[ name ]
       sim_node.tick()
-      sim_node.time += sim_node.node.T # Advance node time
-      # Special tweak -- to make sprinting at 0.66 clock period be
-      # synchronous every 3 cycles...
-      # - E.g., three cycles of 0.66 = 1.98 -> convert to 2.00 to match
-      # the intuition of a rationally divided clock
-      if sim_node.node.T == 0.66 and str(sim_node.time).endswith('.98'):
-        sim_node.time = round( sim_node.time )
-      s.pq.add( sim_node.time, sim_node.name )
+      i = sim_node.index
+      times[i] += periods[i] # Advance node time
+      s.pq.add( times[i], name )
+
+      token_count = counters[ live_in_node.index ]
+
+    if not s.steady:
+      s.counters_window = activity.since(
+        None, s.global_time, s.state.shadow_queues.count,
+        [ ( t - t0 ) // period
+            for t, t0, period in zip( times, start_time, periods ) ] )
 
-      token_count = live_in_node.token_counter
+    if trace:
+      s.close_trace( trace )
+
+  # open_trace / close_trace
+  #
+  # Starts a trace for the given run and shares the writer with the sim
+  # nodes. The header describes the nodes (by index) and edges so that
+  # the trace can be read without the graph, along with the tokens on the
+  # wires and in the queues when the run starts (e.g., the recurrence
+  # tokens set on reset).
+
+  def open_trace( s, run_id ):
+
+    sim_nodes  = sorted( s.sim_nodes.values(), key=lambda n: n.index )
+    node_index = { n.name: n.index for n in sim_nodes }
+
+    header = {
+      'run_id'          : run_id,
+      'ticks_per_cycle' : s.ticks_per_cycle,
+      'sample'          : s.trace_sample,
+      'nodes'           : [ { 'name'     : n.name,
+                                'label'    : n.node.label,
+                                'in_edges' : n.in_edges }
+                              for n in sim_nodes ],
+      'periods'         : [ n.period for n in sim_nodes ],
+      'edges'           : [ [ node_index[src], node_index[dst] ]
+                              for src, dst in s.edges ],
+      'tokens'          : [ int( v ) for v in s.state.shadow.value ],
+      'queues'          : list( s.state.shadow_queues.count ),
+    }
+
+    window = None
+    if s.trace_window:
+      window = [ _ * s.ticks_per_cycle for _ in s.trace_window ]
+
+    trace = TraceWriter( s.trace + '.' + run_id + '.trace', header,
+                         window = window, sample = s.trace_sample )
+    trace.advance( s.global_time )
+
+    for sim_node in sim_nodes:
+      sim_node.trace = trace
+
+    return trace
+
+  def close_trace( s, trace ):
+    trace.close()
+    for sim_node in s.sim_nodes.values():
+      sim_node.trace = None
+
+  # find_steady_state
+  #
+  # Called when the state at the start of the current timestep matches
+  # the state at the start of timestep j1. The history holds the global
+  # time and token count at the start of each timestep since reset, and
+  # token_count is the current token count.
+  #
+  # Timesteps from j1 onwards repeat with a period of L timesteps, P time
+  # units and dk tokens. We extrapolate the first timestep at which the
+  # token count exceeds max_tokens, which is exactly where a full run
+  # would have stopped.
+  #
+  # Times are in ticks. If no tokens are produced in the period, the
+  # graph is deadlocked and will never produce another token, so the
+  # latency and the ii are infinite.
+
+  def find_steady_state( s, history, j1, token_count, max_tokens ):
+
+    j2 = len( history )
+    L  = j2 - j1
+    P  = s.global_time - history[j1][0]
+    dk = token_count   - history[j1][1]
+
+    if dk <= 0:
+      return {
+        'tokens'    : token_count,
+        'latency'   : float( 'inf' ),
+        'ii'        : float( 'inf' ),
+        'transient' : history[j1][0],
+        'period'    : P,
+        'period_tokens' : 0,
+        'deadlocked'    : True,
+      }
+
+    # Token count at the end of each timestep in the period
+
+    counts = [ history[j][1] for j in range( j1+1, j2 ) ] + [ token_count ]
+
+    # Find the earliest timestep whose token count exceeds max_tokens
+
+    stop = None
+    for r, count in enumerate( counts ):
+      n = max( 0, ( max_tokens - count ) // dk + 1 )
+      j = r + n * L
+      if stop is None or j < stop[0]:
+        stop = ( j, r, n )
+
+    _, r, n = stop
+
+    return {
+      'tokens'    : counts[r] + n * dk,
+      'latency'   : history[j1+r][0] + n * P,
+      'ii'        : P / dk,
+      'transient' : history[j1][0],
+      'period'    : P,
+      'period_tokens' : dk,
+    }
 
   # calc_performance
   #
   # Measure performance
+  #
+  # We simulate until the live-in node has produced max_tokens tokens to
+  # amortize any startup overhead. With steady-state detection enabled,
+  # the simulation stops as soon as the simulator state repeats, and the
+  # throughput and latency of the full-length run are extrapolated from
+  # the period. In that case, we also report the exact initiation
+  # interval (ii), the time spent before entering steady state
+  # (transient), and the period of the steady state in time units and in
+  # tokens. A deadlocked graph is reported with zero throughput, infinite
+  # latency and ii, and deadlocked set.
+
+  def calc_performance( s, max_tokens=None, steady_state=True ):
 
-  def calc_performance( s ):
+    if max_tokens is None:
+      max_tokens = s.max_tokens
 
     s.reset()
 
-    # Run for a long time to amortize any startup overhead
+    run_id = 'r' + str( s.run_counter )
+    s.run( run_id = run_id, max_tokens = max_tokens,
+                            steady_state = steady_state )
+    s.run_counter += 1
+
+    return s.perf()
+
+  # checkpoint
+  #
+  # Snapshot of the simulator in steady state from the last run of
+  # calc_performance (None if steady state was not found). This captures
+  # the whole pipeline (tokens in flight, queues, and the phase of each
+  # node), along with the steady state that was found.
+
+  def checkpoint( s ):
+    return s.steady_snapshot
+
+  # calc_performance_warm
+  #
+  # Measure performance by forking from a checkpoint instead of running
+  # from time 0. We restore the checkpoint, pick up the new cycle time of
+  # the given nodes (all nodes by default), and continue simulating until
+  # the new steady state is found. Tokens already in flight finish with
+  # the guards they were sent with.
+  #
+  # The new ii is exact, but the run did not start from time 0, so we
+  # scale the latency of the checkpointed run by the change in ii. This
+  # assumes the startup of the run (i.e., the tokens that fill the
+  # pipeline) is the same as for the checkpointed cycle times. The
+  # transient is the time from the checkpoint to the new steady state.
+  #
+  # If the new steady state is not found within max_tokens more tokens,
+  # throughput is averaged over the run since the checkpoint instead
+  # (like a cold run without steady state). Falls back to a cold run if
+  # there is no checkpoint or if no tokens were produced.
+
+  def calc_performance_warm( s, checkpoint, names=None, max_tokens=None ):
+
+    if max_tokens is None:
+      max_tokens = s.max_tokens
+
+    if checkpoint is None:
+      return s.calc_performance( max_tokens = max_tokens )
+
+    s.restore( checkpoint )
+
+    if names is None:
+      names = s.sim_nodes.keys()
+
+    for name in names:
+      sim_node = s.sim_nodes[ name ]
+      s.state.period[ sim_node.index ] = dvfs_ticks( sim_node.node.T )
+
+    live_in_node = \
+      [ n for n in s.sim_nodes.values() if n.live_in ][0]
+
+    start_time   = s.global_time
+    start_tokens = live_in_node.token_counter
 
     run_id = 'r' + str( s.run_counter )
-    s.run( run_id = run_id, max_tokens = 50 )
+    s.run( run_id = run_id,
+           max_tokens = start_tokens + max_tokens,
+           steady_state = True, resume = True )
     s.run_counter += 1
 
+    base = checkpoint['steady']
+
+    # Deadlocking from the checkpoint does not mean that the setting
+    # deadlocks from reset
+
+    if s.steady and 'deadlocked' in s.steady:
+      return s.calc_performance( max_tokens = max_tokens )
+
+    if not s.steady:
+      tokens = live_in_node.token_counter - start_tokens
+      if tokens <= 0:
+        return s.calc_performance( max_tokens = max_tokens )
+      ii      = ( s.global_time - start_time ) / tokens
+      latency = base['latency'] * ( ii / base['ii'] ) / s.ticks_per_cycle
+      return { 'throughput' : base['tokens'] / latency,
+               'latency'    : latency,
+               'counters'   : s.activity() }
+
+    scale = s.steady['ii'] / base['ii']
+
+    latency    = base['latency'] * scale / s.ticks_per_cycle
+    throughput = base['tokens'] / latency
+
+    return {
+      'throughput'    : throughput,
+      'latency'       : latency,
+      'ii'            : s.steady['ii'] / s.ticks_per_cycle,
+      'transient'     : ( s.steady['transient'] - checkpoint['global_time'] )
+                          / s.ticks_per_cycle,
+      'period'        : s.steady['period'] / s.ticks_per_cycle,
+      'period_tokens' : s.steady['period_tokens'],
+      'counters'      : s.activity(),
+    }
+
+  # perf
+  #
+  # Performance of the last run
+
+  def perf( s ):
+
     # Read the token counter on any live-in node
 
     live_in_node = \
@@ -579,19 +1574,89 @@ class Simulator( object ):
 
     # MUST run long enough for any startup overhead to be amortized
 
-    throughput = token_count / s.global_time
-    latency    = s.global_time
+    latency    = s.global_time / s.ticks_per_cycle
+    throughput = token_count / latency
+
+    perf = { 'throughput': throughput, 'latency': latency }
+
+    if s.steady:
+      perf['ii']            = s.steady['ii']        / s.ticks_per_cycle
+      perf['transient']     = s.steady['transient'] / s.ticks_per_cycle
+      perf['period']        = s.steady['period']    / s.ticks_per_cycle
+      perf['period_tokens'] = s.steady['period_tokens']
+      if 'deadlocked' in s.steady:
+        perf['deadlocked'] = True
+
+    perf['counters'] = s.activity()
+
+    return perf
+
+  # activity
+  #
+  # Activity counters of the last run over its measurement window (one
+  # steady-state period if found, otherwise the whole run), as returned
+  # in the counters of calc_performance. The lists are indexed by node
+  # index and edge index (see node_names and edges).
+
+  def activity( s ):
+    return s.counters_window.summary( s.ticks_per_cycle )
+
+  @property
+  def node_names( s ):
+    return list( s.sim_nodes.keys() )
+
+  # bottlenecks
+  #
+  # Node names ordered from the worst bottleneck, given the counters of
+  # a calc_performance result. A node is scored by how often its
+  # producers stall on its input queues, less how often it stalls on its
+  # own consumers (i.e., it is only passing the backpressure on).
+
+  def bottlenecks( s, counters ):
 
-    return { 'throughput': throughput, 'latency': latency }
+    score = [ - stalled for stalled in counters['stalled'] ]
+
+    for e, ( src, dst ) in enumerate( s.edges ):
+      score[ s.sim_nodes[dst].index ] += counters['edge_stalled'][e]
+
+    return sorted( s.node_names,
+                   key=lambda n: -score[ s.sim_nodes[n].index ] )
+
+  # print_counters
+  #
+  # Prints the per-node activity from the counters of a calc_performance
+  # result, with utilization, stall, and starve rates relative to the
+  # ticks of each node
+
+  def print_counters( s, counters ):
+
+    template = '{:20} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7}'
+
+    print( 'Activity over {:.2f} cycles'.format( counters['cycles'] ) )
+    print()
+    print( template.format( 'node', 'fired', 'stalls', 'starves', 'util',
+                            'stall', 'starve' ) )
+    print( '-' * 72 )
+
+    for name in s.bottlenecks( counters ):
+      i     = s.sim_nodes[ name ].index
+      ticks = counters['ticks'][i] or 1
+      print( template.format( name,
+        counters['fired'][i], counters['stalled'][i], counters['starved'][i],
+        '{:.2f}'.format( counters['fired'][i]   / ticks ),
+        '{:.2f}'.format( counters['stalled'][i] / ticks ),
+        '{:.2f}'.format( counters['starved'][i] / ticks ) ) )
 
   # calc_ii
   #
-  # Measure ii (i.e., initiation interval ii)
+  # Measure ii (i.e., initiation interval ii). This is exact if steady
+  # state was detected, otherwise it is estimated from the throughput.
 
   def calc_ii( s ):
-    throughput = s.calc_performance()['throughput']
-    ii         = 1.0 / throughput
-    return ii
+    perf = s.calc_performance()
+    if 'ii' in perf:
+      return perf['ii']
+    return 1.0 / perf['throughput']
 
   #-----------------------------------------------------------------------
   # Drawing
@@ -603,79 +1668,15 @@ class Simulator( object ):
 
   def plot( s, dot_title='', dot_f='graph.dot' ):
 
-    # Templates for generating graphviz dot statements
-
-    graph_template = \
-'''\
-digraph {{
-label="{title}";
-labelloc="t";
-fontsize=60;
-size="8.5;11";
-ratio="fill";
-margin=0;
-pad=1;
-rankdir="TB";
-concentrate=true;
-splines=polyline;
-center=true;
-nodesep=1.2;
-ranksep=0.8;
-{nodes}
-{edges}
-}}\
-'''
-
-    node_template = \
-      '{dot_id} [ fontsize=24, width=2, ' \
-      'penwidth=2, label="{name}\n{label}", ' \
-      'style=filled, fillcolor={color} ];'
-
-    edge_template = \
-      '{src_dot_id}:s -> {dst_dot_id}:n ' \
-      '[ arrowsize=2, penwidth=2, color={color}, label="  {token}" ];'
-
-    # Loop over all nodes and generate a graphviz node declaration
-
-    dot_nodes = []
-
-    for sim_node in s.sim_nodes.values():
-      fill        = '  '.join([ '.'*len(q) for q in sim_node.queues.values() ])
-      peek_values = [ q[-1] if q else False for q in sim_node.queues.values() ]
-      node_name          = sim_node.name
-      node_cfg           = {}
-      node_cfg['dot_id'] = node_name
-      node_cfg['name']   = fill + '\n' + str(node_name)
-      node_cfg['label']  = sim_node.node.label
-      node_cfg['color']  = 'bisque' if any( peek_values ) \
-                                    else 'white'
-
-      dot_nodes.append( node_template.format( **node_cfg ) )
-
-    # Loop over all edges and generate graphviz edge commands
+    nodes = [ ( sim_node.name, sim_node.node.label,
+                [ len( q ) for q in sim_node.queues.values() ] )
+                for sim_node in s.sim_nodes.values() ]
 
-    dot_edges = []
+    edges = [ ( src, dst, token.read() )
+                for src in s.sim_nodes.keys()
+                for dst, token in s.shadow_fanout[src].items() ]
 
-    for sim_node in s.sim_nodes.values():
-      src = sim_node.name
-      for dst, token in s.shadow_fanout[src].items():
-        token_value = token.read()
-        e_cfg = {}
-        e_cfg['src_dot_id']  = src
-        e_cfg['dst_dot_id']  = dst
-        e_cfg['color']       = 'red' if token_value else 'black'
-        e_cfg['token']       = token_value
-
-        dot_edges.append( edge_template.format( **e_cfg ) )
-
-    # Write out the graphviz dot graph file
-
-    with open( dot_f, 'w' ) as fd:
-      graph_cfg = {}
-      graph_cfg['title'] = dot_title
-      graph_cfg['nodes'] = '\n'.join( dot_nodes )
-      graph_cfg['edges'] = '\n'.join( dot_edges )
-      fd.write( graph_template.format( **graph_cfg ) )
+    dump_dot( dot_f, dot_title, nodes, edges )
 
 
 
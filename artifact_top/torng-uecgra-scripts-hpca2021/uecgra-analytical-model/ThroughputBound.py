@@ -0,0 +1,309 @@
+#! /usr/bin/env python
+#=========================================================================
+# ThroughputBound.py
+#=========================================================================
+# A static throughput solver that computes the initiation interval (ii)
+# of a DFG directly from the graph and the cycle time T of each node,
+# without propagating tokens through the Simulator.
+#
+# The firing rules of the Simulator are captured as a timed event graph
+# with three kinds of events for each iteration k:
+#
+# - F(v, k)   : node v fires iteration k
+# - D(v, k)   : node v has delivered all outputs of iteration k and pops
+#               its input queues
+# - P(u, v, k) : node u pushes the token for iteration k of node v into
+#               the input queue of v
+#
+# Each arc (a -> b, w, t) in the event graph means that event b of
+# iteration k happens at least w time units after event a of iteration
+# k - t:
+#
+# - F(v) -> D(v),    w = T_v,  t = 0  : output guard of node v
+# - D(v) -> F(v),    w = 0,    t = 1  : one token on the output wires
+# - F(u) -> P(u,v),  w = T_u,  t = m  : output guard of node u
+# - P(u,v) -> F(v),  w = 0,    t = 0  : v fires when all inputs arrive
+# - P(u,v) -> D(u),  w = 0,    t = -m : u delivers once all dsts accept
+# - D(v) -> P(u,v),  w = T_u,  t = C  : the input queue of v holds C
+#                                       tokens, and a freed slot is only
+#                                       seen on the next tick of u
+#
+# where m is one for edges that start with a token (recurrence edges and
+# the outputs of phi nodes) and zero otherwise, and C is the depth of the
+# input queues (two).
+#
+# One quirk of the Simulator is that a node fires as soon as a token is
+# pushed into its empty input queues, even if its own initial token has
+# not been delivered yet. The new token then overwrites the initial one.
+# We model this for nodes whose inputs all start with tokens that arrive
+# no later than their own (see lost_tokens), which otherwise would make
+# us overestimate the number of tokens on a cycle.
+#
+# The ii is the maximum cycle ratio (sum of w over sum of t) over all
+# cycles of the event graph, which we find with Howard's policy iteration.
+# These cycles include the recurrence cycles of the DFG as well as the
+# cycles formed with the queue-capacity back-edges (e.g., reconvergent
+# paths of unequal length).
+#
+# When all nodes run on the same clock, this matches the ii measured by
+# the Simulator. With mixed clocks, the Simulator additionally waits for
+# the next clock edge of each node, so this is a lower bound on the ii
+# (i.e., an upper bound on throughput).
+#
+
+from EventQueue import tie_break_policies
+from parameters import dvfs_ratio
+
+class ThroughputBound( object ):
+
+  def __init__( s, graph, capacity=2, epsilon=1e-9,
+                          tie_break='reverse_topo' ):
+
+    s.g         = graph
+    s.capacity  = capacity
+    s.epsilon   = epsilon
+    s.tie_break = tie_break
+
+    # Critical cycle found by the last solve (list of event names)
+
+    s.critical_cycle = []
+
+  # build
+  #
+  # Construct the timed event graph from the DFG. Returns a list of event
+  # names and a list of arcs ( src, dst, w, t ) indexed by event.
+
+  def build( s ):
+
+    events = []
+    index  = {}
+
+    def event( name ):
+      if name not in index:
+        index[name] = len( events )
+        events.append( name )
+      return index[name]
+
+    arcs = []
+
+    rank = s.tick_rank()
+    lost = s.lost_tokens( rank )
+
+    for v in s.g.all_nodes():
+      arcs.append( ( event( ('F', v) ), event( ('D', v) ), s.T( v ), 0 ) )
+      arcs.append( ( event( ('D', v) ), event( ('F', v) ), 0.0,    1 ) )
+
+    for v in s.g.all_nodes():
+      for u in s.g.get_srcs( v ):
+        T_u = s.T( u )
+        m   = 1 if s.has_token( u, v ) and u not in lost else 0
+        P   = event( ('P', u, v) )
+        arcs.append( ( event( ('F', u) ), P, T_u, m ) )
+        arcs.append( ( P, event( ('F', v) ), 0.0, 0 ) )
+        arcs.append( ( P, event( ('D', u) ), 0.0, -m ) )
+        arcs.append( ( event( ('D', v) ), P, s.slot_delay( u, v, rank ),
+                       s.capacity ) )
+
+    return events, arcs
+
+  # T
+  #
+  # Cycle time of a node as the rational divider ratio that the Simulator
+  # uses for its integer timebase (e.g., 0.66 is 2/3)
+
+  def T( s, name ):
+    return float( dvfs_ratio( s.g.get_node( name ).T ) )
+
+  # has_token
+  #
+  # Whether the edge from u to v starts with a token
+
+  def has_token( s, u, v ):
+    return ( u, v ) in s.g.recurrence_edges or s.g.get_node( u ).op == 'phi'
+
+  # tick_rank
+  #
+  # Order in which the Simulator ticks nodes within the same timestep,
+  # using the same tie-break policy
+
+  def tick_rank( s ):
+    if callable( s.tie_break ):
+      rank_fn = s.tie_break
+    else:
+      rank_fn = tie_break_policies[ s.tie_break ]
+    return rank_fn( s.g.topological_sort() )
+
+  # lost_tokens
+  #
+  # Returns the set of nodes whose initial tokens are overwritten before
+  # they are delivered. This happens when every input of the node starts
+  # with a token and all of these tokens are pushed into the node before
+  # (or in the same timestep but ahead of) the node delivering its own
+  # initial token.
+
+  def lost_tokens( s, rank ):
+
+    lost = set()
+
+    for v in s.g.all_nodes():
+      srcs = s.g.get_srcs( v )
+      dsts = s.g.get_dsts( v )
+      if not srcs or not any( s.has_token( v, d ) for d in dsts ):
+        continue
+      T_v = s.T( v )
+      def arrives_first( u ):
+        T_u = s.T( u )
+        if abs( T_u - T_v ) < s.epsilon:
+          return rank[u] < rank[v]
+        return T_u < T_v
+      if all( s.has_token( u, v ) and arrives_first( u ) for u in srcs ):
+        lost.add( v )
+
+    return lost
+
+  # slot_delay
+  #
+  # Delay from node v popping its input queue until node u sees the freed
+  # slot. The slot is hidden from u only when v ticks ahead of u in the
+  # same timestep (i.e., the pipewait), in which case u sees it on its
+  # next tick. This always happens when every tick of v lines up with a
+  # tick of u (i.e., T_v is a multiple of T_u). Otherwise we
+  # conservatively assume no delay so that the ii stays a lower bound.
+
+  def slot_delay( s, u, v, rank ):
+    T_u   = s.T( u )
+    T_v   = s.T( v )
+    ratio = T_v / T_u
+    if rank[v] < rank[u] and abs( ratio - round( ratio ) ) < 1e-3:
+      return T_u
+    return 0.0
+
+  # max_cycle_ratio
+  #
+  # Howard's policy iteration for the maximum cycle ratio. Each event
+  # keeps one chosen incoming arc (the policy). We evaluate the policy by
+  # finding the cycle that each event leads back to along the policy and
+  # computing potentials relative to that cycle, then switch arcs that
+  # improve either the cycle ratio or the potential until nothing changes.
+
+  def max_cycle_ratio( s, n_events, arcs ):
+
+    eps = s.epsilon
+
+    incoming = [ [] for _ in range( n_events ) ]
+    for arc in arcs:
+      incoming[ arc[1] ].append( arc )
+
+    # Initial policy -- the heaviest incoming arc of each event
+
+    policy = [ max( incoming[v], key=lambda a: a[2] ) for v in range( n_events ) ]
+
+    while True:
+
+      # Value determination
+
+      ratio = [ None ] * n_events
+      x     = [ 0.0  ] * n_events
+      cycle = {}
+
+      for start in range( n_events ):
+        if ratio[start] is not None:
+          continue
+
+        # Walk backwards along the policy until we revisit an event on
+        # this walk or reach an event that was already evaluated. Along
+        # the walk, the policy source of path[i] is path[i+1].
+
+        path    = []
+        on_path = {}
+        v = start
+        while ratio[v] is None and v not in on_path:
+          on_path[v] = len( path )
+          path.append( v )
+          v = policy[v][0]
+
+        if ratio[v] is None:
+
+          # Found a new cycle. Anchor its potential at v and evaluate the
+          # rest of the cycle in forward order.
+
+          cyc = path[ on_path[v]: ]
+          w   = sum( policy[c][2] for c in cyc )
+          t   = sum( policy[c][3] for c in cyc )
+          assert t > 0, \
+            'Error: Found a cycle with no tokens (the DFG deadlocks)'
+          lam = w / t
+
+          ratio[v] = lam
+          x[v]     = 0.0
+          for c in reversed( cyc[1:] ):
+            src, _, w_c, t_c = policy[c]
+            ratio[c] = lam
+            x[c]     = x[src] + w_c - lam * t_c
+
+          cycle[v] = cyc
+          path     = path[ :on_path[v] ]
+
+        # Evaluate the rest of the walk, which leads into an evaluated
+        # event, in forward order
+
+        for c in reversed( path ):
+          src, _, w_c, t_c = policy[c]
+          ratio[c] = ratio[src]
+          x[c]     = x[src] + w_c - ratio[src] * t_c
+
+      # Policy improvement -- first the cycle ratios
+
+      changed = False
+
+      for v in range( n_events ):
+        for arc in incoming[v]:
+          if ratio[ arc[0] ] > ratio[v] + eps:
+            ratio[v]  = ratio[ arc[0] ]
+            policy[v] = arc
+            changed   = True
+
+      if not changed:
+        for v in range( n_events ):
+          for arc in incoming[v]:
+            src, _, w_a, t_a = arc
+            if abs( ratio[src] - ratio[v] ) > eps:
+              continue
+            val = x[src] + w_a - ratio[v] * t_a
+            if val > x[v] + eps:
+              x[v]      = val
+              policy[v] = arc
+              changed   = True
+
+      if not changed:
+        break
+
+    # The critical cycle is the one with the largest ratio
+
+    lam = max( ratio )
+    for v, cyc in cycle.items():
+      if abs( ratio[v] - lam ) <= eps:
+        return lam, cyc
+
+    return lam, []
+
+  # calc_ii
+  #
+  # Compute the ii (i.e., initiation interval) of the DFG
+
+  def calc_ii( s ):
+    events, arcs = s.build()
+    ii, cyc = s.max_cycle_ratio( len( events ), arcs )
+    s.critical_cycle = [ events[c] for c in reversed( cyc ) ]
+    return ii
+
+  # calc_performance
+  #
+  # Same interface as Simulator.calc_performance. The throughput here is
+  # the steady-state throughput (an upper bound on the throughput measured
+  # by the Simulator for mixed clocks).
+
+  def calc_performance( s ):
+    ii = s.calc_ii()
+    return { 'throughput': 1.0 / ii, 'ii': ii }
+
@@ -0,0 +1,84 @@
+#=========================================================================
+# ThroughputBound_test.py
+#=========================================================================
+# Checks the static throughput bound against the Simulator on every DFG
+# in jsons/ that can be loaded.
+#
+# - With all nodes on the same clock, the bound is the simulated ii
+# - With one node resting and all others sprinting, the bound is a lower
+#   bound on the simulated ii, and the Simulator must not deadlock
+#
+# Both depend on the tick order of the Simulator, which comes from the
+# topological sort of the graph (and how it breaks cycles).
+#
+# Usage:
+#
+#     % pytest ThroughputBound_test.py
+#
+
+import contextlib
+import glob
+import io
+import os
+
+import pytest
+
+from Graph           import Graph
+from Simulator       import Simulator
+from ThroughputBound import ThroughputBound
+from parameters      import conf_dvfs
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+# load
+#
+# Returns the graph of a DFG json, or None if it cannot be loaded (e.g.,
+# the _dvfs configs use dvfs modes the analytical model does not know)
+
+def load( json ):
+  g = Graph()
+  try:
+    with contextlib.redirect_stdout( io.StringIO() ):
+      g.configure_json( json )
+  except AssertionError:
+    return None
+  return g
+
+jsons = [ json for json in sorted( glob.glob(
+            os.path.join( os.path.dirname( __file__ ), 'jsons', '*.json' ) ) )
+          if load( json ) ]
+
+def set_modes( g, modes ):
+  for name in g.all_nodes():
+    g.get_node( name ).set_T( conf_dvfs[ modes( name ) ]['T'] )
+
+def sim_perf( g ):
+  with contextlib.redirect_stdout( io.StringIO() ):
+    return Simulator( graph = g ).calc_performance()
+
+#-------------------------------------------------------------------------
+# Tests
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'json', jsons, ids=os.path.basename )
+def test_uniform( json ):
+  g = load( json )
+  for mode in conf_dvfs:
+    set_modes( g, lambda name: mode )
+    perf = sim_perf( g )
+    assert 'ii' in perf
+    assert ThroughputBound( graph = g ).calc_ii() == \
+             pytest.approx( perf['ii'] ), mode
+
+@pytest.mark.parametrize( 'json', jsons, ids=os.path.basename )
+def test_one_rest( json ):
+  g = load( json )
+  for rest in sorted( g.all_nodes() ):
+    set_modes( g, lambda name: 'slow' if name == rest else 'fast' )
+    perf = sim_perf( g )
+    assert 'deadlocked' not in perf, rest
+    # Without a steady state, the ii is only estimated from the run
+    if 'ii' in perf:
+      assert ThroughputBound( graph = g ).calc_ii() <= perf['ii'] + 1e-9, rest
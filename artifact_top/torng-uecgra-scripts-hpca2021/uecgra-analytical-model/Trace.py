@@ -0,0 +1,405 @@
+#! /usr/bin/env python
+#=========================================================================
+# Trace.py
+#=========================================================================
+# A compact binary event trace of the discrete-event simulator, and an
+# offline query tool for it.
+#
+# When given a trace prefix, the Simulator writes one trace per run
+# (<prefix>.<run_id>.trace) with an event for each time a node fires,
+# pushes into or pops from an input queue, is stalled by a downstream
+# queue (backpressure), or sinks a live-out token. A trace is a json
+# header (describing the nodes and edges) followed by fixed-size binary
+# records that are only ever appended.
+#
+# Traces can be restricted to a window of time and sampled (i.e., only
+# every n-th timestep is recorded), so long runs stay small.
+#
+# The query tool computes per-node statistics from a trace, and replays
+# a window of the trace into graphviz dot files (one per timestep, named
+# like the ones Simulator.plot dumps, so the Makefile can merge them into
+# a pdf flip book). Replay rebuilds the tokens on the wires and in the
+# queues from the events, so it is only exact for unsampled traces that
+# start with the run.
+#
+# Usage:
+#
+#     % python Trace.py stats r0.trace
+#     % python Trace.py stats r0.trace --window 100 200
+#     % python Trace.py dot   r0.trace --window 0 20 --pdf
+#
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+
+import numpy as np
+
+#-------------------------------------------------------------------------
+# Format
+#-------------------------------------------------------------------------
+# - time      : Time of the event (in ticks)
+# - kind      : Event kind (see below)
+# - node      : Index of the node
+# - edge      : Index of the edge (-1 if the event is not on an edge)
+# - occupancy : Number of tokens in the queue of the edge after the event
+#               (for FIRE, the number of tokens in all input queues)
+# - value     : Token value
+
+magic = b'UETRACE1'
+
+record = struct.Struct( '<QBHiBi' )
+
+record_dtype = np.dtype( [ ( 'time',      '<u8' ),
+                           ( 'kind',      'u1'  ),
+                           ( 'node',      '<u2' ),
+                           ( 'edge',      '<i4' ),
+                           ( 'occupancy', 'u1'  ),
+                           ( 'value',     '<i4' ) ] )
+
+assert record_dtype.itemsize == record.size
+
+FIRE  = 0 # node sends a token on its output wires
+PUSH  = 1 # token pushed into the input queue of node (on edge)
+POP   = 2 # token popped from the input queue of node (on edge)
+STALL = 3 # node has a token for edge, but the downstream queue is full
+SINK  = 4 # live-out node sinks a token
+
+kinds = [ 'fire', 'push', 'pop', 'stall', 'sink' ]
+
+#-------------------------------------------------------------------------
+# TraceWriter
+#-------------------------------------------------------------------------
+# The simulator calls advance() whenever time advances, and the sim
+# nodes only record events while the writer is active.
+#
+# - header : Description of the run (see Simulator.open_trace)
+# - window : ( begin, end ) in ticks, or None to record all timesteps
+# - sample : Record every sample-th timestep
+
+class TraceWriter( object ):
+
+  def __init__( s, trace_f, header, window=None, sample=1,
+                                    buffer_size=4096 ):
+
+    s.trace_f     = trace_f
+    s.window      = window
+    s.sample      = sample
+    s.buffer_size = buffer_size
+
+    s.fd     = open( trace_f, 'wb' )
+    s.buffer = []
+    s.step   = 0
+    s.active = False
+
+    header = json.dumps( header ).encode()
+    s.fd.write( magic )
+    s.fd.write( struct.pack( '<I', len( header ) ) )
+    s.fd.write( header )
+
+  # advance
+  #
+  # Called at the start of each timestep
+
+  def advance( s, time ):
+    in_window = s.window is None or s.window[0] <= time < s.window[1]
+    s.active  = in_window and s.step % s.sample == 0
+    s.step   += 1
+
+  def record( s, kind, time, node, edge, occupancy, value ):
+    s.buffer.append( record.pack( time, kind, node, edge, occupancy,
+                                  int( value ) ) )
+    if len( s.buffer ) >= s.buffer_size:
+      s.flush()
+
+  def flush( s ):
+    s.fd.write( b''.join( s.buffer ) )
+    s.buffer = []
+
+  def close( s ):
+    s.flush()
+    s.fd.close()
+    s.active = False
+
+#-------------------------------------------------------------------------
+# TraceReader
+#-------------------------------------------------------------------------
+
+class TraceReader( object ):
+
+  def __init__( s, trace_f ):
+
+    s.trace_f = trace_f
+
+    with open( trace_f, 'rb' ) as fd:
+      assert fd.read( len( magic ) ) == magic, \
+        'Error: %s is not a simulator trace' % trace_f
+      n, = struct.unpack( '<I', fd.read( 4 ) )
+      s.header = json.loads( fd.read( n ).decode() )
+      data = fd.read()
+
+    # A partially written last record (e.g., from a killed run) is ignored
+
+    n_records = len( data ) // record.size
+
+    s.records = np.frombuffer( data[ : n_records * record.size ],
+                               dtype=record_dtype )
+
+    s.ticks_per_cycle = s.header['ticks_per_cycle']
+    s.nodes           = s.header['nodes']
+    s.edges           = s.header['edges']
+
+  # window
+  #
+  # Records in [ begin, end ) given in nominal cycles (None for open)
+
+  def window( s, begin=None, end=None ):
+    records = s.records
+    if begin is not None:
+      records = records[ records['time'] >= begin * s.ticks_per_cycle ]
+    if end is not None:
+      records = records[ records['time'] <  end   * s.ticks_per_cycle ]
+    return records
+
+  # stats
+  #
+  # Per-node event counts in the window. Utilization is the fraction of
+  # the ticks of the node in the window in which it fired, and the stall
+  # rate is the fraction in which it stalled on a full downstream queue
+  # (both are relative to the recorded timesteps if the trace is sampled).
+
+  def stats( s, begin=None, end=None ):
+
+    records = s.window( begin, end )
+
+    n_nodes = len( s.nodes )
+
+    counts = np.zeros( ( n_nodes, len( kinds ) ), dtype=np.int64 )
+    np.add.at( counts, ( records['node'], records['kind'] ), 1 )
+
+    if len( records ):
+      span = int( records['time'][-1] - records['time'][0] ) + 1
+    else:
+      span = 0
+
+    span = span / s.header['sample']
+
+    # Ticks in which a node stalled (a node can stall on several edges
+    # in the same tick)
+
+    stalls = records[ records['kind'] == STALL ]
+    stall_ticks = np.zeros( n_nodes, dtype=np.int64 )
+    if len( stalls ):
+      pairs = np.unique( np.stack( [ stalls['node'].astype( np.int64 ),
+                                     stalls['time'].astype( np.int64 ) ] ),
+                         axis=1 )
+      np.add.at( stall_ticks, pairs[0], 1 )
+
+    stats = {}
+    for i, node in enumerate( s.nodes ):
+      period = s.header['periods'][i]
+      ticks  = span / period if period else 0
+      stats[ node['name'] ] = {
+        'fires'       : int( counts[i, FIRE]  ),
+        'pushes'      : int( counts[i, PUSH]  ),
+        'pops'        : int( counts[i, POP]   ),
+        'stalls'      : int( counts[i, STALL] ),
+        'sinks'       : int( counts[i, SINK]  ),
+        'utilization' : counts[i, FIRE] / ticks    if ticks else 0.0,
+        'stall_rate'  : stall_ticks[i]  / ticks    if ticks else 0.0,
+      }
+
+    return stats
+
+  # print_stats
+
+  def print_stats( s, begin=None, end=None ):
+
+    template = '{:20} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7}'
+
+    print( template.format( 'node', 'fires', 'pushes', 'pops', 'stalls',
+                            'util', 'stall' ) )
+    print( '-' * 72 )
+
+    for name, st in s.stats( begin, end ).items():
+      print( template.format( name, st['fires'], st['pushes'], st['pops'],
+                              st['stalls'],
+                              '{:.2f}'.format( st['utilization'] ),
+                              '{:.2f}'.format( st['stall_rate'] ) ) )
+
+  # replay
+  #
+  # Replays the trace and yields ( time, queues, tokens ) at the end of
+  # each timestep in [ begin, end ) (in nominal cycles), where queues is
+  # the number of tokens in the queue of each edge, and tokens is the
+  # token on each wire (False if there is none).
+
+  def replay( s, begin=None, end=None ):
+
+    begin = -1 if begin is None else begin * s.ticks_per_cycle
+    end   = float( 'inf' ) if end is None else end * s.ticks_per_cycle
+
+    out_edges = [ [] for _ in s.nodes ]
+    for e, ( src, dst ) in enumerate( s.edges ):
+      out_edges[ src ].append( e )
+
+    queues = list( s.header['queues'] )
+    tokens = [ v or False for v in s.header['tokens'] ]
+
+    time = None
+
+    for r in s.records:
+      t = int( r['time'] )
+      if t != time:
+        if time is not None and begin <= time < end:
+          yield time, queues, tokens
+        if t >= end:
+          return
+        time = t
+      kind = r['kind']
+      if kind == FIRE:
+        for e in out_edges[ r['node'] ]:
+          tokens[e] = int( r['value'] )
+      elif kind == PUSH:
+        queues[ r['edge'] ] = int( r['occupancy'] )
+        tokens[ r['edge'] ] = False
+      elif kind == POP:
+        queues[ r['edge'] ] = int( r['occupancy'] )
+
+    if time is not None and begin <= time < end:
+      yield time, queues, tokens
+
+  # dump_dots
+  #
+  # Dumps a dot file for each timestep in the window and returns the
+  # file names
+
+  def dump_dots( s, begin=None, end=None ):
+
+    run_id = s.header['run_id']
+
+    dot_fs = []
+
+    for time, queues, tokens in s.replay( begin, end ):
+      cycles = time / s.ticks_per_cycle
+      nodes  = [ ( node['name'], node['label'],
+                   [ queues[e] for e in node['in_edges'] ] )
+                   for node in s.nodes ]
+      edges  = [ ( s.nodes[src]['name'], s.nodes[dst]['name'], tokens[e] )
+                   for e, ( src, dst ) in enumerate( s.edges ) ]
+      dot_f  = str( cycles ) + '.' + run_id + '.dot'
+      dump_dot( dot_f, 'time=' + str( cycles ), nodes, edges )
+      dot_fs.append( dot_f )
+
+    return dot_fs
+
+#-------------------------------------------------------------------------
+# dump_dot
+#-------------------------------------------------------------------------
+# Dumps a graphviz dot file of the tokens in flight
+#
+# - nodes : List of ( name, label, queue occupancies )
+# - edges : List of ( src name, dst name, token )
+
+def dump_dot( dot_f, dot_title, nodes, edges ):
+
+  # Templates for generating graphviz dot statements
+
+  graph_template = \
+'''\
+digraph {{
+label="{title}";
+labelloc="t";
+fontsize=60;
+size="8.5;11";
+ratio="fill";
+margin=0;
+pad=1;
+rankdir="TB";
+concentrate=true;
+splines=polyline;
+center=true;
+nodesep=1.2;
+ranksep=0.8;
+{nodes}
+{edges}
+}}\
+'''
+
+  node_template = \
+    '{dot_id} [ fontsize=24, width=2, ' \
+    'penwidth=2, label="{name}\n{label}", ' \
+    'style=filled, fillcolor={color} ];'
+
+  edge_template = \
+    '{src_dot_id}:s -> {dst_dot_id}:n ' \
+    '[ arrowsize=2, penwidth=2, color={color}, label="  {token}" ];'
+
+  # Loop over all nodes and generate a graphviz node declaration
+
+  dot_nodes = []
+
+  for node_name, label, occupancies in nodes:
+    fill               = '  '.join([ '.'*n for n in occupancies ])
+    node_cfg           = {}
+    node_cfg['dot_id'] = node_name
+    node_cfg['name']   = fill + '\n' + str(node_name)
+    node_cfg['label']  = label
+    node_cfg['color']  = 'bisque' if any( occupancies ) \
+                                  else 'white'
+
+    dot_nodes.append( node_template.format( **node_cfg ) )
+
+  # Loop over all edges and generate graphviz edge commands
+
+  dot_edges = []
+
+  for src, dst, token_value in edges:
+    e_cfg = {}
+    e_cfg['src_dot_id']  = src
+    e_cfg['dst_dot_id']  = dst
+    e_cfg['color']       = 'red' if token_value else 'black'
+    e_cfg['token']       = token_value
+
+    dot_edges.append( edge_template.format( **e_cfg ) )
+
+  # Write out the graphviz dot graph file
+
+  with open( dot_f, 'w' ) as fd:
+    graph_cfg = {}
+    graph_cfg['title'] = dot_title
+    graph_cfg['nodes'] = '\n'.join( dot_nodes )
+    graph_cfg['edges'] = '\n'.join( dot_edges )
+    fd.write( graph_template.format( **graph_cfg ) )
+
+#-------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser( description='Query simulator traces' )
+  parser.add_argument( 'command', choices=[ 'stats', 'dot' ],
+    help='stats: per-node statistics, dot: dump a dot file per timestep' )
+  parser.add_argument( 'trace', help='Trace file' )
+  parser.add_argument( '--window', type=float, nargs=2, default=None,
+    metavar=( 'BEGIN', 'END' ), help='Window in nominal cycles' )
+  parser.add_argument( '--pdf', action='store_true',
+    help='Also convert each dot file to pdf (needs graphviz)' )
+  args = parser.parse_args()
+
+  reader = TraceReader( args.trace )
+  begin, end = args.window if args.window else ( None, None )
+
+  if args.command == 'stats':
+    reader.print_stats( begin, end )
+
+  if args.command == 'dot':
+    dot_fs = reader.dump_dots( begin, end )
+    print( 'Dumped {} dot files'.format( len( dot_fs ) ) )
+    if args.pdf:
+      for dot_f in dot_fs:
+        with open( os.path.splitext( dot_f )[0] + '.pdf', 'wb' ) as fd:
+          subprocess.run( [ 'dot', '-Tpdf', dot_f ], stdout=fd, check=True )
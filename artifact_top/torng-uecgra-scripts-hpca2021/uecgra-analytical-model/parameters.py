@@ -18,12 +18,62 @@
 # to achieve a rational clocking relationship).
 #
 
+from fractions import Fraction
+from functools import reduce
+from math      import gcd
+
 conf_dvfs = {
   'nominal' : { 'V': 0.90, 'T': 1.00 },
   'fast'    : { 'V': 1.23, 'T': 0.66 },
   'slow'    : { 'V': 0.61, 'T': 3.00 },
 }
 
+# Integer timebase
+#
+# Each cycle time in conf_dvfs stands for a rational divider ratio of the
+# nominal clock (e.g., 0.66 is really 2/3, three fast cycles per two
+# nominal cycles). The simulator counts time in integer ticks, where one
+# nominal cycle is the LCM of the denominators of these ratios. Every
+# cycle time is then a whole number of ticks, so event times and guard
+# spans compare exactly.
+#
+# Note that this changes results compared with the earlier floating-point
+# timebase, which advanced fast nodes by 0.66 and only snapped them back
+# to the nominal clock now and then. Fast nodes now run at exactly 2/3,
+# so all-fast mappings are about 1% slower, and mappings that mix modes
+# line up their clock edges differently (see README).
+#
+# - max_divider   : Largest denominator considered when recovering the
+#                   ratio from a cycle time
+# - max_ratio_err : Largest difference (in nominal cycles) allowed between
+#                   a cycle time and its ratio
+#
+
+max_divider   = 12
+max_ratio_err = 0.01
+
+def dvfs_ratio( T ):
+  ratio = Fraction( T ).limit_denominator( max_divider )
+  assert abs( ratio - T ) <= max_ratio_err, \
+    'Error: Cycle time %f is not a rational divider ratio' % T
+  return ratio
+
+def lcm( a, b ):
+  return a * b // gcd( a, b )
+
+ticks_per_cycle = reduce( lcm, [ dvfs_ratio( conf['T'] ).denominator
+                                   for conf in conf_dvfs.values() ] )
+
+# dvfs_ticks
+#
+# Cycle time in integer ticks
+
+def dvfs_ticks( T ):
+  ticks = dvfs_ratio( T ) * ticks_per_cycle
+  assert ticks.denominator == 1, \
+    'Error: Cycle time %f is not a multiple of the timebase' % T
+  return int( ticks )
+
 # Map intended configured operation to the subset of operations known in
 # the analytical model..
 #
@@ -16,7 +16,7 @@ from .TileStatic import TileStatic
 
 class StaticCGRA( Component ):
 
-  def construct( s, Type, CfgMsgType, ncols=2, nrows=2, mul_ncycles=0, elasticity="elastic", fifo_depth=2 ):
+  def construct( s, Type, CfgMsgType, ncols=2, nrows=2, mul_ncycles=0, elasticity="elastic", fifo_depth=2, instrument=False ):
 
     s.clk = InPort( Bits1 )
     s.reset = InPort( Bits1 )
@@ -42,9 +42,17 @@ class StaticCGRA( Component ):
     s.cfg_en = InPort( mk_bits(ntiles) )
     s.imm    = [ InPort( Type ) for _ in range( ntiles ) ]
 
+    # Per-tile activity counters if instrumented (see TileCounters)
+
+    if instrument:
+      s.cnt_fire   = [ OutPort( Bits32 ) for _ in range( ntiles ) ]
+      s.cnt_bypass = [ OutPort( Bits32 ) for _ in range( ntiles ) ]
+      s.cnt_starve = [ OutPort( Bits32 ) for _ in range( ntiles ) ]
+      s.cnt_stall  = [ OutPort( Bits32 ) for _ in range( ntiles ) ]
+
     # Components
 
-    s.tiles = [ TileStatic( Type, CfgMsgType, mul_ncycles, elasticity, fifo_depth=fifo_depth ) for _ in range( ntiles ) ]
+    s.tiles = [ TileStatic( Type, CfgMsgType, mul_ncycles, elasticity, fifo_depth=fifo_depth, instrument=instrument ) for _ in range( ntiles ) ]
 
     # Connections
 
@@ -55,6 +63,13 @@ class StaticCGRA( Component ):
       connect( s.tiles[i].cfg_en, s.cfg_en[i] )
       connect( s.tiles[i].imm,    s.imm[i]    )
 
+    if instrument:
+      for i in range( ntiles ):
+        connect( s.tiles[i].cnt_fire,   s.cnt_fire[i]   )
+        connect( s.tiles[i].cnt_bypass, s.cnt_bypass[i] )
+        connect( s.tiles[i].cnt_starve, s.cnt_starve[i] )
+        connect( s.tiles[i].cnt_stall,  s.cnt_stall[i]  )
+
     for y in range( nrows ):
       for x in range( ncols ):
 
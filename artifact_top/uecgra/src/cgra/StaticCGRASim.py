@@ -0,0 +1,618 @@
+"""
+==========================================================================
+StaticCGRASim.py
+==========================================================================
+Fast cycle-level model of the elastic static CGRA.
+
+The model takes the same configuration messages as StaticCGRA (e.g. from
+test_utils.json_to_cfgs) and follows TileStaticCtrl signal by signal,
+but on plain ints. It relies on two properties of the RTL:
+
+  - The input queues are normal queues, so every deq_rdy and every
+    send_rdy (the enq_rdy of the next tile) only depends on registered
+    state.
+  - The compute node is combinational (Mul does not use mul_ncycles),
+    so a tile fires in the same cycle its operands are ready.
+
+Each cycle therefore evaluates every tile once against the registered
+state and then clocks the queues, the accumulate registers and the
+recurrence init units. run() drives the boundary ports like the
+TestSrcCL/TestSinkCL of StaticCGRA_test and returns the same cycle
+count as its run_sim.
+
+"""
+from collections import deque
+
+from .enums import CfgMsg as CFG, TileDirection as TD
+
+# Plain-int copies of the encodings used in the inner loop
+
+_NORTH = TD.NORTH
+_SOUTH = TD.SOUTH
+_WEST  = TD.WEST
+_EAST  = TD.EAST
+_SELF  = TD.SELF
+
+_SELF_BIT = 1 << _SELF
+
+_B_TYPE = int( CFG.OP_B_TYPE )
+
+_CP0 = int( CFG.CP0 )
+_CP1 = int( CFG.CP1 )
+_ADD = int( CFG.ADD )
+_SUB = int( CFG.SUB )
+_SLL = int( CFG.SLL )
+_SRL = int( CFG.SRL )
+_AND = int( CFG.AND )
+_OR  = int( CFG.OR  )
+_XOR = int( CFG.XOR )
+_EQ  = int( CFG.EQ  )
+_NE  = int( CFG.NE  )
+_GT  = int( CFG.GT  )
+_GEQ = int( CFG.GEQ )
+_LT  = int( CFG.LT  )
+_LEQ = int( CFG.LEQ )
+_MUL = int( CFG.MUL )
+_PHI = int( CFG.PHI )
+_NOP = int( CFG.NOP )
+
+# Output and accumulate register mux selects
+
+_COMPUTE = 0
+_BYPASS  = 1
+_BPS_ALT = 2
+
+# Single-direction destination masks, as checked by the branch logic
+
+_dst_dir = { 1 << d: d for d in ( _NORTH, _SOUTH, _WEST, _EAST ) }
+
+_opposite = { _NORTH: _SOUTH, _SOUTH: _NORTH, _WEST: _EAST, _EAST: _WEST }
+
+def _dirs( mask ):
+  return tuple( d for d in range( 5 ) if mask >> d & 1 )
+
+#-------------------------------------------------------------------------
+# _Tile
+#-------------------------------------------------------------------------
+# One TileStatic: four input queues, the accumulate register and the
+# recurrence init unit, plus the ctrl decoded from its config.
+
+class _Tile:
+
+  def __init__( s, cfg, imm, fifo_depth, nbits ):
+
+    s.opcode    = int( cfg.opcode      )
+    s.func      = int( cfg.func        )
+    s.src_a     = int( cfg.src_opd_a   )
+    s.src_b     = int( cfg.src_opd_b   )
+    s.dst_c     = int( cfg.dst_compute )
+    s.src_bps   = int( cfg.src_bypass  )
+    s.dst_bps   = int( cfg.dst_bypass  )
+    s.src_alt   = int( cfg.src_altbps  )
+    s.dst_alt   = int( cfg.dst_altbps  )
+    s.imm       = int( imm )
+
+    s.mask      = ( 1 << nbits ) - 1
+    s.shamt     = ( 1 << ( nbits - 1 ).bit_length() ) - 1
+
+    s.is_branch = s.opcode == _B_TYPE
+    s.is_phi    = s.func == _PHI
+    s.is_nop    = s.func == _NOP
+
+    # Forwarding an operand?
+
+    s.bps_opd = s.dst_bps != 0 and s.src_bps in ( s.src_a, s.src_b )
+    s.alt_opd = s.dst_alt != 0 and s.src_alt in ( s.src_a, s.src_b )
+
+    s.dst_c_dirs   = _dirs( s.dst_c   )
+    s.dst_bps_dirs = _dirs( s.dst_bps )
+    s.dst_alt_dirs = _dirs( s.dst_alt )
+
+    # A tile with nothing to compute or bypass never does anything
+
+    s.idle = s.is_nop and not s.dst_bps and not s.dst_alt
+
+    # Which rule drives the deq_en of each input queue (see up_deq_en_*)
+
+    s.deq_rule = []
+    for d in ( _NORTH, _SOUTH, _WEST, _EAST ):
+      if   s.bps_opd and s.src_bps == d: rule = 'bps_opd'
+      elif s.src_bps == d:               rule = 'bps'
+      elif s.alt_opd and s.src_alt == d: rule = 'alt_opd'
+      elif s.src_alt == d:               rule = 'alt'
+      elif d in ( s.src_a, s.src_b ):    rule = 'phi' if s.is_phi else 'opd'
+      else:                              rule = None
+      s.deq_rule.append( rule )
+
+    # Output mux selects, compute has priority (see up_send_mux_*_sel)
+
+    s.sel = []
+    for d in range( 5 ):
+      sel = _COMPUTE
+      if s.dst_bps >> d & 1: sel = _BYPASS
+      if s.dst_alt >> d & 1: sel = _BPS_ALT
+      if s.dst_c   >> d & 1: sel = _COMPUTE
+      s.sel.append( sel )
+
+    # State
+
+    s.depth = fifo_depth
+    s.buf   = [ [ 0 ] * fifo_depth for _ in range( 4 ) ]
+    s.rptr  = [ 0, 0, 0, 0 ]
+    s.cnt   = [ 0, 0, 0, 0 ]
+    s.acc   = 0
+    s.riu   = True
+
+    s.fire   = 0
+    s.bypass = 0
+    s.starve = 0
+    s.stall  = 0
+    s.events = None
+
+  #-----------------------------------------------------------------------
+  # Queues
+  #-----------------------------------------------------------------------
+
+  def full( s, d ):
+    return s.cnt[d] == s.depth
+
+  def enq( s, d, msg ):
+    s.buf[d][ ( s.rptr[d] + s.cnt[d] ) % s.depth ] = msg
+    s.cnt[d] += 1
+
+  def deq( s, d ):
+    s.rptr[d] = ( s.rptr[d] + 1 ) % s.depth
+    s.cnt[d] -= 1
+
+  # Output of an input mux; an empty queue shows whatever entry its read
+  # pointer is at, like the register file in NormalQueuePow2RTL.
+
+  def value( s, src ):
+    if src == _SELF:
+      return s.acc
+    src &= 3
+    return s.buf[src][ s.rptr[src] ]
+
+  #-----------------------------------------------------------------------
+  # Compute node
+  #-----------------------------------------------------------------------
+
+  def compute( s, fn, a, b ):
+    if   fn == _CP0: return a
+    elif fn == _CP1: return b
+    elif fn == _ADD: return ( a + b ) & s.mask
+    elif fn == _SUB: return ( a - b ) & s.mask
+    elif fn == _SLL: return ( a << ( b & s.shamt ) ) & s.mask
+    elif fn == _SRL: return a >> ( b & s.shamt )
+    elif fn == _AND: return a & b
+    elif fn == _OR : return a | b
+    elif fn == _XOR: return a ^ b
+    elif fn == _EQ : return int( a == b )
+    elif fn == _NE : return int( a != b )
+    elif fn == _GT : return int( a >  b )
+    elif fn == _GEQ: return int( a >= b )
+    elif fn == _LT : return int( a <  b )
+    elif fn == _LEQ: return int( a <= b )
+    elif fn == _MUL: return ( a * b ) & s.mask
+    else:            return 0
+
+  #-----------------------------------------------------------------------
+  # eval
+  #-----------------------------------------------------------------------
+  # Combinational ctrl and datapath of one cycle. send_rdy holds the rdy
+  # of the north, south, west and east outputs. Returns the deq_en of the
+  # four queues, the (direction, msg) pairs sent, the new accumulate
+  # register value (or None) and whether the recurrence init unit is
+  # dequeued.
+
+  def eval( s, send_rdy ):
+
+    cnt = s.cnt
+
+    # Operands
+
+    if s.src_a == _SELF: a_rdy = s.riu if s.is_phi else True
+    else:                a_rdy = cnt[ s.src_a & 3 ] > 0
+    if s.src_b == _SELF: b_rdy = s.riu if s.is_phi else True
+    else:                b_rdy = cnt[ s.src_b & 3 ] > 0
+
+    opds_rdy = a_rdy and b_rdy
+
+    # Bypass and alternative bypass
+
+    if   s.bps_opd:          bps_rdy = opds_rdy
+    elif s.src_bps == _SELF: bps_rdy = True
+    else:                    bps_rdy = cnt[ s.src_bps & 3 ] > 0
+
+    if   s.alt_opd:          alt_rdy = opds_rdy
+    elif s.src_alt == _SELF: alt_rdy = True
+    else:                    alt_rdy = cnt[ s.src_alt & 3 ] > 0
+
+    bps_send_rdy = bool( s.dst_bps ) and all( send_rdy[d] for d in s.dst_bps_dirs )
+    alt_send_rdy = bool( s.dst_alt ) and all( send_rdy[d] for d in s.dst_alt_dirs )
+
+    # send_rdy of the compute node
+
+    if s.is_branch:
+      taken = s.value( s.src_b ) != 0
+      dst   = s.dst_c if taken else s.func
+      node_send_rdy = send_rdy[ _dst_dir[dst] ] if dst in _dst_dir else True
+      if   s.bps_opd: node_send_rdy = node_send_rdy and bps_send_rdy
+      elif s.alt_opd: node_send_rdy = node_send_rdy and alt_send_rdy
+    elif not s.dst_c:
+      node_send_rdy = False
+    else:
+      node_send_rdy = all( send_rdy[d] for d in s.dst_c_dirs )
+      if s.bps_opd: node_send_rdy = node_send_rdy and bps_send_rdy
+      if s.alt_opd: node_send_rdy = node_send_rdy and alt_send_rdy
+
+    # PHI copies whichever operand is ready, branch forwards the data
+
+    if   s.is_branch: node_cfg = _CP0
+    elif s.is_phi:    node_cfg = _CP0 if a_rdy else _CP1 if b_rdy else _PHI
+    else:             node_cfg = s.func
+
+    node_recv_rdy = node_send_rdy and node_cfg != _NOP
+
+    # Fire
+
+    if s.is_nop:
+      node_en = False
+    elif s.is_phi:
+      node_en = ( a_rdy or b_rdy ) and node_recv_rdy
+      if   s.bps_opd: node_en = node_en and bps_rdy
+      elif s.alt_opd: node_en = node_en and alt_rdy
+    elif s.bps_opd:
+      node_en = opds_rdy and bps_rdy and node_recv_rdy
+    elif s.alt_opd:
+      node_en = opds_rdy and alt_rdy and node_recv_rdy
+    else:
+      node_en = opds_rdy and node_recv_rdy
+
+    riu_deq = s.is_phi and node_recv_rdy and s.riu
+
+    # deq_en
+
+    deq_en = [ False, False, False, False ]
+    for d in range( 4 ):
+      rule = s.deq_rule[d]
+      if rule is None:
+        continue
+      elif rule == 'bps_opd': deq_en[d] = bps_rdy and bps_send_rdy and node_recv_rdy
+      elif rule == 'bps':     deq_en[d] = bps_rdy and bps_send_rdy
+      elif rule == 'alt_opd': deq_en[d] = alt_rdy and alt_send_rdy and node_recv_rdy
+      elif rule == 'alt':     deq_en[d] = alt_rdy and alt_send_rdy
+      elif rule == 'phi':     deq_en[d] = cnt[d] > 0
+      else:                   deq_en[d] = opds_rdy and node_recv_rdy
+
+    # send_en, a later rule overrides an earlier one like in up_send_en_*
+
+    bps_en = bps_rdy and bps_send_rdy
+    alt_en = alt_rdy and alt_send_rdy
+
+    node_out = None
+    sends    = []
+    for d in range( 4 ):
+      bit = 1 << d
+      en  = False
+      if s.dst_bps & bit: en = node_en if s.bps_opd else bps_en
+      if s.dst_alt & bit: en = node_en if s.alt_opd else alt_en
+      if s.is_branch:
+        if ( s.dst_c if taken else s.func ) & bit: en = node_en
+      elif s.dst_c & bit:
+        en = node_en
+      if en:
+        sel = s.sel[d]
+        if sel == _COMPUTE:
+          if node_out is None:
+            node_out = s.compute( node_cfg, s.value( s.src_a ), s.value( s.src_b ) )
+          sends.append( ( d, node_out ) )
+        elif sel == _BYPASS:
+          sends.append( ( d, s.value( s.src_bps ) ) )
+        else:
+          sends.append( ( d, s.value( s.src_alt ) ) )
+
+    # Accumulate register
+
+    if   s.dst_c   & _SELF_BIT: acc_en = node_en
+    elif s.dst_bps & _SELF_BIT: acc_en = bps_rdy
+    elif s.dst_alt & _SELF_BIT: acc_en = alt_rdy
+    else:                       acc_en = False
+
+    acc_in = None
+    if acc_en:
+      sel = s.sel[ _SELF ]
+      if sel == _COMPUTE:
+        if node_out is None:
+          node_out = s.compute( node_cfg, s.value( s.src_a ), s.value( s.src_b ) )
+        acc_in = node_out
+      elif sel == _BYPASS:
+        acc_in = s.value( s.src_bps )
+      else:
+        acc_in = s.value( s.src_alt )
+
+    # Activity events (see TileCounters)
+
+    if s.is_branch:
+      computes, opd_rdy = True, opds_rdy
+    elif s.is_phi:
+      computes, opd_rdy = True, a_rdy or b_rdy
+    else:
+      computes, opd_rdy = not s.is_nop, opds_rdy
+
+    if computes:
+      starve = not opd_rdy
+      stall  = opd_rdy and not node_en
+    elif s.dst_bps:
+      starve = not bps_rdy
+      stall  = bps_rdy and not bps_send_rdy
+    else:
+      starve = stall = False
+
+    nbypass = 0
+    if s.dst_bps and ( node_en if s.bps_opd else bps_en ): nbypass += 1
+    if s.dst_alt and ( node_en if s.alt_opd else alt_en ): nbypass += 1
+
+    s.events = ( node_en, nbypass, starve, stall )
+
+    return deq_en, sends, acc_in, riu_deq
+
+  # Counters are registered: the events of a cycle land on the next edge
+
+  def count( s ):
+    if s.events is not None:
+      fire, nbypass, starve, stall = s.events
+      s.fire   += fire
+      s.bypass += nbypass
+      s.starve += starve
+      s.stall  += stall
+      s.events  = None
+
+
+#-------------------------------------------------------------------------
+# _Src and _Sink
+#-------------------------------------------------------------------------
+# Boundary ports driven like TestSrcCL and TestSinkCL behind their RTL
+# adapters: a source offers its next message every cycle, a sink is
+# always ready and is done two cycles after its last message.
+
+class _Src:
+
+  def __init__( s, tile, d, msgs ):
+    s.tile  = tile
+    s.d     = d
+    s.msgs  = deque( int( msg ) for msg in msgs )
+    s.entry = None
+
+  def done( s ):
+    return not s.msgs
+
+class _Sink:
+
+  def __init__( s, name, msgs, skip_check ):
+    s.name       = name
+    s.msgs       = [ int( msg ) for msg in msgs ]
+    s.skip_check = skip_check
+    s.received   = []
+
+    # The sink already counts during reset, so an empty one is done
+    s.all_msg_recved = not s.msgs
+    s.done_flag      = not s.msgs
+
+  def update( s ):
+    if s.all_msg_recved:
+      s.done_flag = True
+    if len( s.received ) >= len( s.msgs ):
+      s.all_msg_recved = True
+
+  def recv( s, msg ):
+    idx = len( s.received )
+    assert idx < len( s.msgs ), \
+      f'Test sink {s.name} received more msgs than expected!\nReceived : {msg}'
+    assert s.skip_check or msg == s.msgs[ idx ], \
+      f'Test sink {s.name} received WRONG message!\n' \
+      f'Expected : {s.msgs[ idx ]}\nReceived : {msg}'
+    s.received.append( msg )
+
+  def done( s ):
+    return s.done_flag
+
+#-------------------------------------------------------------------------
+# StaticCGRASim
+#-------------------------------------------------------------------------
+
+class StaticCGRASim:
+
+  def __init__( s, Type, cfg_msgs, ncols=2, nrows=2, imms=None, fifo_depth=2 ):
+
+    # Same constraint as NormalQueuePow2RTL
+    assert ( fifo_depth == 1 ) or ( fifo_depth >= 2 and fifo_depth % 2 == 0 )
+    assert len( cfg_msgs ) == ncols * nrows
+
+    s.ncols  = ncols
+    s.nrows  = nrows
+    s.ntiles = ncols * nrows
+
+    if not imms:
+      imms = [ 0 for _ in range( s.ntiles ) ]
+
+    s.tiles  = [ _Tile( cfg_msgs[i], imms[i], fifo_depth, Type.nbits )
+                 for i in range( s.ntiles ) ]
+    s.active = [ tile for tile in s.tiles if not tile.idle ]
+
+    # Neighbor ( tile, direction ) of each output, None on the boundary
+
+    for y in range( nrows ):
+      for x in range( ncols ):
+        tid = y * ncols + x
+        s.tiles[tid].links = [
+          ( s.tiles[tid+ncols], _SOUTH ) if y < nrows-1 else None, # north
+          ( s.tiles[tid-ncols], _NORTH ) if y > 0       else None, # south
+          ( s.tiles[tid-1],     _EAST  ) if x > 0       else None, # west
+          ( s.tiles[tid+1],     _WEST  ) if x < ncols-1 else None, # east
+        ]
+        s.tiles[tid].sinks = [ None ] * 4
+
+    # Boundary ports in the order of StaticCGRA's recv_*/send_* lists
+
+    s.ports = {
+      'n' : [ ( ( nrows-1 ) * ncols + x, _NORTH ) for x in range( ncols ) ],
+      's' : [ ( x,                       _SOUTH ) for x in range( ncols ) ],
+      'w' : [ ( y * ncols,               _WEST  ) for y in range( nrows ) ],
+      'e' : [ ( y * ncols + ncols-1,     _EAST  ) for y in range( nrows ) ],
+    }
+
+    s.srcs  = []
+    s.sinks = []
+
+  #-----------------------------------------------------------------------
+  # tick
+  #-----------------------------------------------------------------------
+
+  def tick( s, cfg_en=False ):
+
+    # Registered events of the previous cycle
+
+    for tile in s.active:
+      tile.count()
+
+    for sink in s.sinks:
+      sink.update()
+
+    for src in s.srcs:
+      if src.entry is None and src.msgs:
+        src.entry = src.msgs.popleft()
+
+    # Evaluate every tile against the registered state
+
+    deqs = []
+    enqs = []
+    accs = []
+    rius = []
+
+    if cfg_en:
+      # Configuring kills every en signal and loads the constants
+      for tile in s.tiles:
+        accs.append( ( tile, tile.imm ) )
+
+    else:
+      for tile in s.active:
+        links    = tile.links
+        send_rdy = [ link is None or not link[0].full( link[1] ) for link in links ]
+        send_rdy.append( True )
+
+        deq_en, sends, acc_in, riu_deq = tile.eval( send_rdy )
+
+        for d in range( 4 ):
+          if deq_en[d] and tile.cnt[d] > 0:
+            deqs.append( ( tile, d ) )
+
+        for d, msg in sends:
+          if links[d] is None:
+            tile.sinks[d].recv( msg )
+          elif not links[d][0].full( links[d][1] ):
+            enqs.append( ( links[d][0], links[d][1], msg ) )
+
+        if acc_in is not None:
+          accs.append( ( tile, acc_in ) )
+        if riu_deq:
+          rius.append( tile )
+
+    for src in s.srcs:
+      if src.entry is not None and not src.tile.full( src.d ):
+        enqs.append( ( src.tile, src.d, src.entry ) )
+        src.entry = None
+
+    # Clock edge
+
+    for tile, d in deqs:
+      tile.deq( d )
+    for tile, d, msg in enqs:
+      tile.enq( d, msg )
+    for tile, acc in accs:
+      tile.acc = acc
+    for tile in rius:
+      tile.riu = False
+
+  #-----------------------------------------------------------------------
+  # load
+  #-----------------------------------------------------------------------
+  # Attach a source and a sink to every boundary port, like the
+  # TestHarness of StaticCGRA_test. The messages received by each sink are
+  # collected in s.sink_msgs[ side ][ i ].
+
+  def load( s, src_n_msgs, src_s_msgs, src_w_msgs, src_e_msgs,
+            sink_n_msgs, sink_s_msgs, sink_w_msgs, sink_e_msgs,
+            skip_check=False ):
+
+    src_msgs  = { 'n': src_n_msgs,  's': src_s_msgs,  'w': src_w_msgs,  'e': src_e_msgs  }
+    sink_msgs = { 'n': sink_n_msgs, 's': sink_s_msgs, 'w': sink_w_msgs, 'e': sink_e_msgs }
+
+    s.srcs      = []
+    s.sinks     = []
+    s.sink_msgs = {}
+
+    for side, ports in s.ports.items():
+      s.sink_msgs[ side ] = []
+      for i, ( tid, d ) in enumerate( ports ):
+        tile = s.tiles[ tid ]
+        sink = _Sink( f'sink_{side}[{i}]', sink_msgs[ side ][i], skip_check )
+        tile.sinks[d] = sink
+        s.sinks.append( sink )
+        s.sink_msgs[ side ].append( sink.received )
+        s.srcs.append( _Src( tile, d, src_msgs[ side ][i] ) )
+
+  def configure( s ):
+    s.tick( cfg_en=True )
+
+  def done( s ):
+    return all( src.done() for src in s.srcs ) and \
+           all( sink.done() for sink in s.sinks )
+
+  #-----------------------------------------------------------------------
+  # run
+  #-----------------------------------------------------------------------
+  # Load the messages, configure the array and tick until every source is
+  # drained and every sink got its messages, like StaticCGRA_Tests.run_sim.
+  # Returns the number of cycles.
+
+  def run( s, src_n_msgs, src_s_msgs, src_w_msgs, src_e_msgs,
+           sink_n_msgs, sink_s_msgs, sink_w_msgs, sink_e_msgs,
+           max_cycles=100, skip_check=False ):
+
+    s.load( src_n_msgs,  src_s_msgs,  src_w_msgs,  src_e_msgs,
+            sink_n_msgs, sink_s_msgs, sink_w_msgs, sink_e_msgs, skip_check )
+
+    s.configure()
+    ncycles = 0
+    s.tick()
+    ncycles += 1
+
+    while not s.done() and ncycles < max_cycles:
+      s.tick()
+      ncycles += 1
+
+    assert ncycles < max_cycles
+    return ncycles
+
+  #-----------------------------------------------------------------------
+  # Activity counters
+  #-----------------------------------------------------------------------
+  # Same per-tile lists as an instrumented StaticCGRA, so that
+  # test_utils.read_counters works on both.
+
+  @property
+  def cnt_fire( s ):
+    return [ tile.fire for tile in s.tiles ]
+
+  @property
+  def cnt_bypass( s ):
+    return [ tile.bypass for tile in s.tiles ]
+
+  @property
+  def cnt_starve( s ):
+    return [ tile.starve for tile in s.tiles ]
+
+  @property
+  def cnt_stall( s ):
+    return [ tile.stall for tile in s.tiles ]
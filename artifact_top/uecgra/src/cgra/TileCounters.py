@@ -0,0 +1,79 @@
+"""
+==========================================================================
+TileCounters.py
+==========================================================================
+Activity counters of an instrumented CGRA tile. Each counter counts the
+cycles in which the tile ctrl raised the corresponding event:
+
+  fire   : the compute unit accepted a set of operands
+  bypass : a token was bypassed (a bypass and an alternative bypass in
+           the same cycle count as two)
+  starve : the tile was waiting for its inputs
+  stall  : the inputs were ready but the compute unit or an output was
+           not (backpressure)
+
+The counters are cleared on reset and wrap around.
+
+"""
+from pymtl3 import *
+
+class TileCounters( Component ):
+
+  def construct( s, nbits=32 ):
+
+    # Local parameters
+
+    CntType = mk_bits( nbits )
+
+    # Clock and reset
+
+    s.clk   = InPort( Bits1 )
+    s.reset = InPort( Bits1 )
+
+    # Interface
+
+    s.fire_en   = InPort( Bits1 )
+    s.bypass_en = InPort( Bits1 )
+    s.altbps_en = InPort( Bits1 )
+    s.starve_en = InPort( Bits1 )
+    s.stall_en  = InPort( Bits1 )
+
+    s.fire   = OutPort( CntType )
+    s.bypass = OutPort( CntType )
+    s.starve = OutPort( CntType )
+    s.stall  = OutPort( CntType )
+
+    # Logic
+
+    @s.update_on_edge
+    def up_fire():
+      if s.reset:
+        s.fire = CntType(0)
+      elif s.fire_en:
+        s.fire = s.fire + CntType(1)
+
+    @s.update_on_edge
+    def up_bypass():
+      if s.reset:
+        s.bypass = CntType(0)
+      elif s.bypass_en & s.altbps_en:
+        s.bypass = s.bypass + CntType(2)
+      elif s.bypass_en | s.altbps_en:
+        s.bypass = s.bypass + CntType(1)
+
+    @s.update_on_edge
+    def up_starve():
+      if s.reset:
+        s.starve = CntType(0)
+      elif s.starve_en:
+        s.starve = s.starve + CntType(1)
+
+    @s.update_on_edge
+    def up_stall():
+      if s.reset:
+        s.stall = CntType(0)
+      elif s.stall_en:
+        s.stall = s.stall + CntType(1)
+
+  def line_trace( s ):
+    return f'{s.fire}|{s.bypass}|{s.starve}|{s.stall}'
@@ -28,10 +28,11 @@ from fifos.ZeroBackPressureBuffer import ZeroBackPressureBuffer
 from .enums import CfgMsg as CFG, TileDirection as TD
 from .TileStaticDpath import TileStaticDpath
 from .TileStaticCtrl import TileStaticCtrl
+from .TileCounters import TileCounters
 
 class TileStatic( Component ):
 
-  def construct( s, Type, CfgMsgType, mul_ncycles=0, elasticity="elastic", fifo_depth=2 ):
+  def construct( s, Type, CfgMsgType, mul_ncycles=0, elasticity="elastic", fifo_depth=2, instrument=False ):
 
     # Check elasticity setting
     assert elasticity in ['elastic', 'inelastic']
@@ -52,7 +53,7 @@ class TileStatic( Component ):
 
     # Components
 
-    s.ctrl  = TileStaticCtrl( Type, CfgMsgType, elasticity )
+    s.ctrl  = TileStaticCtrl( Type, CfgMsgType, elasticity, instrument )
     s.dpath = TileStaticDpath( Type, mul_ncycles )
 
     if elasticity == "elastic":
@@ -134,6 +135,29 @@ class TileStatic( Component ):
       s.send[TD.EAST ].msg, s.dpath.send_msg_e,
     )
 
+    # Activity counters (see TileCounters)
+
+    if instrument:
+
+      s.cnt_fire   = OutPort( Bits32 )
+      s.cnt_bypass = OutPort( Bits32 )
+      s.cnt_starve = OutPort( Bits32 )
+      s.cnt_stall  = OutPort( Bits32 )
+
+      s.counters = TileCounters( 32 )(
+        clk       = s.clk,
+        reset     = s.reset,
+        fire_en   = s.ctrl.evt_fire,
+        bypass_en = s.ctrl.evt_bypass,
+        altbps_en = s.ctrl.evt_altbps,
+        starve_en = s.ctrl.evt_starve,
+        stall_en  = s.ctrl.evt_stall,
+        fire      = s.cnt_fire,
+        bypass    = s.cnt_bypass,
+        starve    = s.cnt_starve,
+        stall     = s.cnt_stall,
+      )
+
   def line_trace( s ):
     recv_str = '|'.join([ str(s.recv[i]) for i in range(4) ])
     send_str = '|'.join([ str(s.send[i]) for i in range(4) ])
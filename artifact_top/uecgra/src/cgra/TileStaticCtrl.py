@@ -15,7 +15,7 @@ from .RecurInitUnit import RecurInitUnit
 
 class TileStaticCtrl( Component ):
 
-  def construct( s, Type, CfgMsgType, elasticity="elastic" ):
+  def construct( s, Type, CfgMsgType, elasticity="elastic", instrument=False ):
 
     # Local parameters
 
@@ -826,3 +826,70 @@ class TileStaticCtrl( Component ):
         # Other
         elif s.cfg.dst_compute[ TD_EAST ]:
             s.send_en_e = s.node_send_en
+
+    #---------------------------------------------------------------------
+    # Activity events
+    #---------------------------------------------------------------------
+    # If instrumented, also report what the tile did in each cycle (see
+    # TileCounters). Each cycle of a tile configured to compute is either
+    # a fire, a starve (operands missing), or a stall (operands ready but
+    # the compute unit or the outputs are not). A tile that only bypasses
+    # starves or stalls on its bypass instead.
+
+    if instrument:
+
+      s.evt_fire   = OutPort( Bits1 )
+      s.evt_bypass = OutPort( Bits1 )
+      s.evt_altbps = OutPort( Bits1 )
+      s.evt_starve = OutPort( Bits1 )
+      s.evt_stall  = OutPort( Bits1 )
+
+      s.evt_computes = Wire( Bits1 )
+      s.evt_opd_rdy  = Wire( Bits1 )
+
+      @s.update
+      def up_evt_opd_rdy():
+        if s.is_branch:
+          s.evt_computes = b1(1)
+          s.evt_opd_rdy  = s.operands_deq_rdy
+        # For PHI node only either of src needs to be ready
+        elif s.cfg.func == CfgMsg_PHI:
+          s.evt_computes = b1(1)
+          s.evt_opd_rdy  = s.opd_a_deq_rdy | s.opd_b_deq_rdy
+        else:
+          s.evt_computes = ( s.cfg.func != CfgMsg_NOP )
+          s.evt_opd_rdy  = s.operands_deq_rdy
+
+      @s.update
+      def up_evt_fire():
+        s.evt_fire = s.node_recv_en
+
+      @s.update
+      def up_evt_bypass():
+        s.evt_bypass = b1(0)
+        if ~s.cfg_en & ( s.cfg.dst_bypass != CfgMsg_DST_NONE ):
+          if s.bypass_opd:
+            s.evt_bypass = s.node_send_en
+          else:
+            s.evt_bypass = s.bypass_deq_rdy & s.bypass_send_rdy
+
+      @s.update
+      def up_evt_altbps():
+        s.evt_altbps = b1(0)
+        if ~s.cfg_en & ( s.cfg.dst_altbps != CfgMsg_DST_NONE ):
+          if s.altbps_opd:
+            s.evt_altbps = s.node_send_en
+          else:
+            s.evt_altbps = s.altbps_deq_rdy & s.altbps_send_rdy
+
+      @s.update
+      def up_evt_starve_stall():
+        s.evt_starve = b1(0)
+        s.evt_stall  = b1(0)
+        if ~s.cfg_en:
+          if s.evt_computes:
+            s.evt_starve = ~s.evt_opd_rdy
+            s.evt_stall  = s.evt_opd_rdy & ~s.node_recv_en
+          elif s.cfg.dst_bypass != CfgMsg_DST_NONE:
+            s.evt_starve = ~s.bypass_deq_rdy
+            s.evt_stall  = s.bypass_deq_rdy & ~s.bypass_send_rdy
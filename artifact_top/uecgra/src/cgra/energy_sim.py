@@ -7,6 +7,8 @@ energy_sim.py
  -h, --help    : show help.
  -o, --output  : output path for the energy breakdown json.
      --config  : path for the configuration json.
+     --configs : paths for many configuration jsons (batch mode).
+     --fires   : path for a json of measured per-tile fire counts.
      --ntokens : number of tokens, 32 by default.
      --ncols   : number of columns of the CGRA, 8 by default.
      --nrows   : number of rows of the CGRA, 8 by default.
@@ -23,15 +25,33 @@ energy_sim.py
      --ld-fast : number of SRAM banks configured to perform store and
                  operate at fast voltage and frequency, 0 by default.
 
+By default every active tile is assumed to fire ntokens times. The
+--fires json replaces this with measured counts. It maps the name of
+each config (the file name without .json) to the counts of its tiles,
+either one count for both compute and bypass, or a list of [ compute
+fires, bypass transfers ]. Tiles that are missing fire ntokens times:
+
+  { "fft_pro_dvfs": { "tile_1_0": 32, "tile_2_0": [ 16, 32 ] } }
+
+In batch mode (--configs), the tile energy of all configs is computed
+in one vectorized pass, and a summary of each config is printed. The
+same functions are available as a library:
+
+  batch     = load_configs( glob.glob( 'benchmark/evaluation/*_dvfs*.json' ) )
+  e_e, e_ue = tile_energy( batch, ntokens=32 )
+
 Author : Yanghui Ou
   Date : Sep 2, 2019
 
 """
 import argparse
 import json
+import os
 import sys
 from dataclasses import dataclass
 
+import numpy as np
+
 #-------------------------------------------------------------------------
 # ArgumentParserWithCustomError
 #-------------------------------------------------------------------------
@@ -63,6 +83,7 @@ e_sram_write = 6.413 # pJ/write
 alpha = {
   'mul' : 1.000,
   'add' : 0.525,
+  'sub' : 0.525, # same adder as add
   'sll' : 0.458,
   'srl' : 0.430,
   'cp0' : 0.419,
@@ -86,6 +107,7 @@ alpha = {
 beta = {
   'mul' : 1.328,
   'add' : 1.057,
+  'sub' : 1.057, # same adder as add
   'sll' : 1.172,
   'srl' : 1.181,
   'cp0' : 1.196,
@@ -105,16 +127,22 @@ beta = {
   'nop' : 1.000,
 }
 
+# The power-mapping pass writes rest/sprint for slow/fast
+
 voltage = {
   'nominal' : 0.90,
   'slow'    : 0.61,
   'fast'    : 1.23,
+  'rest'    : 0.61,
+  'sprint'  : 1.23,
 }
 
 t_clk = {
   'nominal' : 2.00,
   'slow'    : 6.00,
   'fast'    : 1.33,
+  'rest'    : 6.00,
+  'sprint'  : 1.33,
 }
 
 #-------------------------------------------------------------------------
@@ -127,8 +155,171 @@ class Tile:
   bps  : bool  = False
   v    : float = voltage['nominal']
   f    : float = 1.0 / t_clk['nominal']
-  e_e  : float = 0.0
-  e_ue : float = 0.0
+
+# A batch of configs as arrays with one row per config and one column
+# per tile (in tile id order, i.e., y * ncols + x).
+
+@dataclass
+class ConfigBatch:
+  names : list
+  ncols : int
+  nrows : int
+  alpha : np.ndarray # alpha of the op
+  beta  : np.ndarray # beta of the op
+  bps   : np.ndarray # whether the tile bypasses
+  v     : np.ndarray # voltage
+  f     : np.ndarray # frequency
+
+  def tile_names( self ):
+    return [ f'tile_{x}_{y}' for y in range(self.nrows)
+                             for x in range(self.ncols) ]
+
+#-------------------------------------------------------------------------
+# load_config
+#-------------------------------------------------------------------------
+# Decode a configuration json to a list of tiles.
+
+def load_config( path, ncols=8, nrows=8 ):
+  cgra = [ Tile() for _ in range(ncols * nrows) ]
+
+  with open( path, 'r' ) as f:
+    cfg_lst = json.load( f )
+
+  for t in cfg_lst:
+
+    assert 'x' in t; assert 'y' in t; assert 'op' in t
+    tid = t['y'] * ncols + t['x']
+    cgra[tid].op = t['op'].lower()
+    assert cgra[tid].op in alpha, f'{path}: unknown op {t["op"]}'
+
+    # Add bypass energy
+    if 'bps_dst' in t:
+      if not 'none' in [ x.lower() for x in t['bps_dst'] ]:
+        cgra[tid].bps = True
+
+    if 'dvfs' in t:
+      cgra[tid].v = voltage[ t['dvfs'].lower() ]
+      cgra[tid].f = 1.0 / t_clk[ t['dvfs'].lower() ]
+
+  return cgra
+
+#-------------------------------------------------------------------------
+# load_configs
+#-------------------------------------------------------------------------
+# Decode many configuration jsons into a batch.
+
+def load_configs( paths, ncols=8, nrows=8 ):
+  cgras = [ load_config( path, ncols, nrows ) for path in paths ]
+
+  def array( field ):
+    return np.array( [ [ field( tile ) for tile in cgra ] for cgra in cgras ],
+                     dtype=float ).reshape( len(cgras), ncols * nrows )
+
+  return ConfigBatch(
+    names = [ config_name( path ) for path in paths ],
+    ncols = ncols,
+    nrows = nrows,
+    alpha = array( lambda tile: alpha[ tile.op ] ),
+    beta  = array( lambda tile: beta [ tile.op ] ),
+    bps   = array( lambda tile: tile.bps ).astype( bool ),
+    v     = array( lambda tile: tile.v ),
+    f     = array( lambda tile: tile.f ),
+  )
+
+def config_name( path ):
+  return os.path.splitext( os.path.basename( path ) )[0]
+
+#-------------------------------------------------------------------------
+# load_fires
+#-------------------------------------------------------------------------
+# Read measured fire counts (see the format above) into arrays of
+# compute fires and bypass transfers for the given batch.
+
+def load_fires( path, batch, ntokens=32 ):
+  shape     = ( len(batch.names), batch.ncols * batch.nrows )
+  fires     = np.full( shape, ntokens, dtype=float )
+  bps_fires = np.full( shape, ntokens, dtype=float )
+  tids      = { name: tid for tid, name in enumerate( batch.tile_names() ) }
+
+  with open( path, 'r' ) as f:
+    counts = json.load( f )
+
+  for i, name in enumerate( batch.names ):
+    for tile, count in counts.get( name, {} ).items():
+      if not isinstance( count, list ):
+        count = [ count, count ]
+      fires    [ i, tids[tile] ] = count[0]
+      bps_fires[ i, tids[tile] ] = count[1]
+
+  return fires, bps_fires
+
+#-------------------------------------------------------------------------
+# tile_energy
+#-------------------------------------------------------------------------
+# E-tile and UE-tile energy of every tile of every config in the batch,
+# as two arrays of shape ( nconfigs, ntiles ). Every active tile fires
+# ntokens times, unless fires (and bps_fires for the bypass) give the
+# measured counts of each tile, as scalars or arrays that broadcast to
+# that shape.
+
+def tile_energy( batch, ntokens=32, fires=None, bps_fires=None ):
+  v_e = voltage['nominal']
+
+  if fires is None:
+    fires = ntokens
+  if bps_fires is None:
+    bps_fires = fires
+
+  fires     = np.asarray( fires,     dtype=float )
+  bps_fires = np.asarray( bps_fires, dtype=float )
+
+  # ECGRA energy - everything is nominal
+  e_e = e_mul * batch.alpha * fires \
+      + np.where( batch.bps, e_mul * alpha['bps'] * bps_fires, 0.0 )
+
+  # UECGRA energy - with dvfs and UE overhead
+  e_ue = e_mul * batch.alpha * batch.beta * (batch.v**2)/(v_e**2) * fires \
+       + np.where( batch.bps, e_mul * alpha['bps'] * beta['bps'] \
+                                * (batch.v**2)/(v_e**2) * bps_fires, 0.0 )
+
+  return e_e, e_ue
+
+#-------------------------------------------------------------------------
+# sram_energy
+#-------------------------------------------------------------------------
+# E and UE energy breakdowns of the SRAM banks for ntokens tokens, given
+# the number of banks that load and store at each level.
+
+def sram_energy( ntokens=32, ld_nom=0, ld_slow=0, ld_fast=0,
+                             st_nom=0, st_slow=0, st_fast=0 ):
+  v_e = voltage['nominal']
+
+  e_sram_ld = ( ld_nom + ld_slow + ld_fast ) * e_sram_read
+  e_sram_st = ( st_nom + st_slow + st_fast ) * e_sram_write
+
+  e_dict = {
+    'sram_ld' : e_sram_ld * ntokens,
+    'sram_st' : e_sram_st * ntokens,
+  }
+
+  ue_sram_ld_nom  = ld_nom  * e_sram_read
+  ue_sram_ld_slow = ld_slow * e_sram_read * (voltage['slow']**2)/(v_e**2)
+  ue_sram_ld_fast = ld_fast * e_sram_read * (voltage['fast']**2)/(v_e**2)
+
+  ue_sram_st_nom  = st_nom  * e_sram_write
+  ue_sram_st_slow = st_slow * e_sram_write * (voltage['slow']**2)/(v_e**2)
+  ue_sram_st_fast = st_fast * e_sram_write * (voltage['fast']**2)/(v_e**2)
+
+  ue_dict = {
+    'sram_ld_nominal' : ue_sram_ld_nom  * ntokens,
+    'sram_ld_slow'    : ue_sram_ld_slow * ntokens,
+    'sram_ld_fast'    : ue_sram_ld_fast * ntokens,
+    'sram_st_nominal' : ue_sram_st_nom  * ntokens,
+    'sram_st_slow'    : ue_sram_st_slow * ntokens,
+    'sram_st_fast'    : ue_sram_st_fast * ntokens,
+  }
+
+  return e_dict, ue_dict
 
 #-------------------------------------------------------------------------
 # parse_cmdline
@@ -139,10 +330,12 @@ def parse_cmdline():
   p.add_argument( '-v', '--verbose', action='store_true'       )
   p.add_argument( '-h', '--help',    action='store_true'       )
   p.add_argument(       '--config'                             )
+  p.add_argument(       '--configs', nargs='+'                 )
+  p.add_argument(       '--fires'                              )
   p.add_argument( '-o', '--output',  default='energy_sim.json' )
-  p.add_argument(       '--ntokens', default=32                )
-  p.add_argument(       '--ncols',   default=8                 )
-  p.add_argument(       '--nrows',   default=8                 )
+  p.add_argument(       '--ntokens', type=int, default=32      )
+  p.add_argument(       '--ncols',   type=int, default=8       )
+  p.add_argument(       '--nrows',   type=int, default=8       )
   # SRAMs
   p.add_argument(       '--ld-nom',  type=int, default=0       )
   p.add_argument(       '--ld-slow', type=int, default=0       )
@@ -165,111 +358,50 @@ def main():
   if opts.help:
     return
 
-  ncols = opts.ncols
-  nrows = opts.nrows
-  ntiles = ncols * nrows
-
-  ntokens = int(opts.ntokens)
+  ntokens = opts.ntokens
+  paths   = opts.configs or [ opts.config ]
 
-  v_e = voltage['nominal']
+  batch = load_configs( paths, opts.ncols, opts.nrows )
 
-  cgra  = [ Tile() for _ in range(ntiles) ]
-  edict = {}
-
-  # Load config data
-  with open( opts.config, 'r' ) as f:
-    cfg_lst = json.load( f )
+  fires, bps_fires = None, None
+  if opts.fires:
+    fires, bps_fires = load_fires( opts.fires, batch, ntokens )
 
-    for t in cfg_lst:
+  e_e, e_ue = tile_energy( batch, ntokens, fires, bps_fires )
 
-      assert 'x' in t; assert 'y' in t; assert 'op' in t
-      tid = t['y'] * ncols + t['x']
-      cgra[tid].op = t['op'].lower()
-
-      # Add bypass energy
-      if 'bps_dst' in t:
-        if not 'none' in [ x.lower() for x in t['bps_dst'] ]:
-          cgra[tid].bps = True
-
-      if 'dvfs' in t:
-        cgra[tid].v = voltage[ t['dvfs'] ]
-        cgra[tid].f = 1.0 / t_clk[ t['dvfs'] ]
-
-      op   = cgra[tid].op
-      v_ue = cgra[tid].v
-      bps  = cgra[tid].bps
-
-      # ECGRA energy - everything is nominal
-      e_e = e_mul * alpha[ op ] * ntokens
-      if bps:
-        e_e += e_mul * alpha[ 'bps' ] * ntokens
-
-      # UECGRA energy - with dvfs and UE overhead
-      e_ue = e_mul * alpha[ op ] * beta[ op ] * (v_ue**2)/(v_e**2) * ntokens
-      if bps:
-        e_ue += e_mul * alpha[ 'bps' ] * beta[ 'bps' ] * (v_ue**2)/(v_e**2) * ntokens
-
-      cgra[tid].e_e  = e_e
-      cgra[tid].e_ue = e_ue
+  e_sram, ue_sram = sram_energy( ntokens,
+                                 opts.ld_nom, opts.ld_slow, opts.ld_fast,
+                                 opts.st_nom, opts.st_slow, opts.st_fast )
 
   # Save energy breakdown
-  e_dict  = {}
-  ue_dict = {}
-
-  for y in range(nrows):
-    for x in range(ncols):
-      tid = y * ncols + x
-      e_dict [f'tile_{x}_{y}'] = cgra[tid].e_e
-      ue_dict[f'tile_{x}_{y}'] = cgra[tid].e_ue
-
-  # Compute sram energy
-  e_sram_ld = ( opts.ld_nom + opts.ld_slow + opts.ld_fast ) * e_sram_read
-  e_sram_st = ( opts.st_nom + opts.st_slow + opts.st_fast ) * e_sram_write
-
-  e_dict['sram_ld'] = e_sram_ld * ntokens
-  e_dict['sram_st'] = e_sram_st * ntokens
-
-  ue_sram_ld_nom  = opts.ld_nom  * e_sram_read
-  ue_sram_ld_slow = opts.ld_slow * e_sram_read * (voltage['slow']**2)/(v_e**2)
-  ue_sram_ld_fast = opts.ld_fast * e_sram_read * (voltage['fast']**2)/(v_e**2)
-
-  ue_sram_st_nom  = opts.st_nom  * e_sram_write
-  ue_sram_st_slow = opts.st_slow * e_sram_write * (voltage['slow']**2)/(v_e**2)
-  ue_sram_st_fast = opts.st_fast * e_sram_write * (voltage['fast']**2)/(v_e**2)
-
-  ue_dict['sram_ld_nominal'] = ue_sram_ld_nom  * ntokens
-  ue_dict['sram_ld_slow'   ] = ue_sram_ld_slow * ntokens
-  ue_dict['sram_ld_fast'   ] = ue_sram_ld_fast * ntokens
-  ue_dict['sram_st_nominal'] = ue_sram_st_nom  * ntokens
-  ue_dict['sram_st_slow'   ] = ue_sram_st_slow * ntokens
-  ue_dict['sram_st_fast'   ] = ue_sram_st_fast * ntokens
-
-  with open( opts.output, 'w' ) as f:
-    res = {
+  res = {}
+  for i, name in enumerate( batch.names ):
+    e_dict  = dict( zip( batch.tile_names(), e_e [i].tolist() ) )
+    ue_dict = dict( zip( batch.tile_names(), e_ue[i].tolist() ) )
+    e_dict .update( e_sram  )
+    ue_dict.update( ue_sram )
+    res[name] = {
       'ecgra_energy'  : e_dict,
       'uecgra_energy' : ue_dict,
     }
-    json.dump( res, f, indent=2 )
+
+  with open( opts.output, 'w' ) as f:
+    json.dump( res if opts.configs else res[ batch.names[0] ], f, indent=2 )
 
   # Report total energy
-  total_e  = 0.0
-  total_ue = 0.0
-  for tile in cgra:
-    total_e  += tile.e_e
-    total_ue += tile.e_ue
-
-  total_e += e_sram_ld * ntokens
-  total_e += e_sram_st * ntokens
-
-  total_ue += ue_sram_ld_nom  * ntokens
-  total_ue += ue_sram_ld_slow * ntokens
-  total_ue += ue_sram_ld_fast * ntokens
-  total_ue += ue_sram_st_nom  * ntokens
-  total_ue += ue_sram_st_slow * ntokens
-  total_ue += ue_sram_st_fast * ntokens
-
-  print(f'UECGRA energy for {ntokens} tokens: {total_ue:.3f} pJ ({total_ue/ntokens:.3f} pJ/token).')
-  print(f'ECGRA  energy for {ntokens} tokens: {total_e:.3f} pJ ({total_e/ntokens:.3f} pJ/token).')
-  print(f'Energy efficiency ratio (UECGRA/ECGRA): {total_e/total_ue:.3f}.')
-
-main()
+  total_e  = e_e .sum( axis=1 ) + sum( e_sram .values() )
+  total_ue = e_ue.sum( axis=1 ) + sum( ue_sram.values() )
+
+  if not opts.configs:
+    total_e, total_ue = total_e[0], total_ue[0]
+    print(f'UECGRA energy for {ntokens} tokens: {total_ue:.3f} pJ ({total_ue/ntokens:.3f} pJ/token).')
+    print(f'ECGRA  energy for {ntokens} tokens: {total_e:.3f} pJ ({total_e/ntokens:.3f} pJ/token).')
+    print(f'Energy efficiency ratio (UECGRA/ECGRA): {total_e/total_ue:.3f}.')
+    return
+
+  print(f'{"config":32} {"UECGRA (pJ)":>12} {"ECGRA (pJ)":>12} {"ratio":>7}')
+  for name, e, ue in zip( batch.names, total_e, total_ue ):
+    print(f'{name:32} {ue:12.3f} {e:12.3f} {e/ue:7.3f}')
+
+if __name__ == '__main__':
+  main()
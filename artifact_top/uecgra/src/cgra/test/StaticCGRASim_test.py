@@ -0,0 +1,208 @@
+"""
+==========================================================================
+StaticCGRASim_test.py
+==========================================================================
+Runs the StaticCGRA test cases on the fast cycle-level model and checks
+the model against the PyMTL simulation of the RTL.
+
+"""
+import inspect
+from random import randint
+from types import SimpleNamespace
+
+import pytest
+
+from pymtl3 import *
+
+from .test_utils import json_to_cfgs, read_counters
+from . import StaticCGRA_test as rtl
+from .StaticCGRA_test import TestHarness, mk_cfg
+from ..StaticCGRASim import StaticCGRASim
+from ..ConfigMsg import ConfigMsg
+
+#-------------------------------------------------------------------------
+# Test cases - model
+#-------------------------------------------------------------------------
+# Every StaticCGRA test case, with the model built from the arguments of
+# the test harness instead of elaborating it. We import the RTL test
+# module instead of its test class so that pytest does not collect the
+# RTL test cases a second time from this file.
+
+class StaticCGRASim_Tests( rtl.StaticCGRA_Tests ):
+
+  # Neither of these runs the model
+
+  @pytest.mark.skip( reason='elaborates the RTL, not the model' )
+  def test_elaborate( s ):
+    pass
+
+  @pytest.mark.skip( reason='adpcm is not implemented' )
+  def test_adpcm( s, request ):
+    pass
+
+  def run_sim( s, n_iter, th, max_cycles=100, **kwargs ):
+    args = inspect.signature( TestHarness.construct ).bind(
+      th, *th._dsl.args, **th._dsl.kwargs )
+    args.apply_defaults()
+    a = args.arguments
+
+    sim = StaticCGRASim( a['Type'], a['cfg_msgs'], a['ncols'], a['nrows'],
+                         a['imms'], a['fifo_depth'] )
+    ncycles = sim.run(
+      a['src_n_msgs'],  a['src_s_msgs'],  a['src_w_msgs'],  a['src_e_msgs'],
+      a['sink_n_msgs'], a['sink_s_msgs'], a['sink_w_msgs'], a['sink_e_msgs'],
+      max_cycles, a['skip_check'],
+    )
+    return SimpleNamespace( dut=sim ), ncycles
+
+  #-----------------------------------------------------------------------
+  # Cross-check against the RTL
+  #-----------------------------------------------------------------------
+  # Run the same harness on the instrumented RTL and on the model: the
+  # cycle count, the messages and the activity counters must match.
+
+  def cross_check( s, mk_th, max_cycles ):
+    rtl_th = mk_th()
+    rtl_th.set_param( 'top.dut.construct', instrument=True )
+    rtl_th, rtl_ncycles = rtl.StaticCGRA_Tests.run_sim( s, 0, rtl_th, max_cycles )
+
+    th, ncycles = s.run_sim( 0, mk_th(), max_cycles )
+    sim = th.dut
+
+    assert ncycles == rtl_ncycles
+    assert read_counters( sim, sim.ncols, sim.nrows ) == \
+           read_counters( rtl_th.dut, sim.ncols, sim.nrows )
+
+  def mk_kernel_th( s, json_file, imms, src_s_msgs, sink_n_msgs,
+                    skip_check=False, fifo_depth=2 ):
+    ncols = 8; nrows = 8
+    cfg_msgs = json_to_cfgs( json_file, ncols, nrows )
+    empty = [ [] for _ in range( ncols ) ]
+    return lambda: TestHarness(
+      Bits32, ConfigMsg, ncols, nrows, cfg_msgs,
+      empty, src_s_msgs, empty, empty,
+      sink_n_msgs, empty, empty, empty,
+      imms, fifo_depth=fifo_depth, skip_check=skip_check,
+    )
+
+  @pytest.mark.parametrize(
+    "fifo_depth", [ 1, 2, 4 ]
+  )
+  def test_rtl_1d_conv_8x8( s, fifo_depth ):
+    ncols = 8; nrows = 8
+    ntiles = ncols * nrows
+
+    cfg_msgs = [ mk_cfg( 'nop', 'self', 'self', 'self' ) for _ in range(ntiles) ]
+
+    cfg_msgs[49] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  )
+    cfg_msgs[50] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  )
+    cfg_msgs[51] = mk_cfg( 'ADD', 'WEST',  'NORTH', 'EAST'  )
+    cfg_msgs[52] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  )
+    cfg_msgs[53] = mk_cfg( 'ADD', 'WEST',  'NORTH', 'EAST'  )
+    cfg_msgs[54] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  )
+    cfg_msgs[55] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  )
+
+    cfg_msgs[56] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  )
+    cfg_msgs[57] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' )
+    cfg_msgs[58] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  )
+    cfg_msgs[59] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' )
+    cfg_msgs[60] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  )
+    cfg_msgs[61] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' )
+
+    # Uneven input rates so that tiles stall as well as starve
+
+    src_n_msgs = [
+      [ b16(1), b16(2) ] * 10,
+      [ b16(1), b16(1) ] * 10,
+      [ b16(2), b16(3) ] * 10,
+      [ b16(1), b16(1) ] * 10,
+      [ b16(3), b16(4) ] * 10,
+      [ b16(1), b16(1) ] * 10,
+      [],
+      [],
+    ]
+    empty_cols = [ [] for _ in range( ncols ) ]
+    empty_rows = [ [] for _ in range( nrows ) ]
+
+    sink_e_msgs = [ [] for _ in range( nrows ) ]
+    sink_e_msgs[6] = [ b16(6), b16(9) ] * 10
+
+    s.cross_check( lambda: TestHarness(
+      Bits16, ConfigMsg, ncols, nrows, cfg_msgs,
+      src_n_msgs, empty_cols, empty_rows, empty_rows,
+      empty_cols, empty_cols, empty_rows, sink_e_msgs,
+      fifo_depth=fifo_depth,
+    ), max_cycles=200 )
+
+  def test_rtl_fir( s ):
+    ntiles = 64
+    niter  = 10
+
+    imms = [ b32(0) for _ in range( ntiles ) ]
+    imms[35] = b32(1)
+    imms[27] = b32(niter)
+
+    src_s_msgs  = [ [] for _ in range( 8 ) ]
+    sink_n_msgs = [ [] for _ in range( 8 ) ]
+
+    for i in range( niter ):
+      src_s_msgs[1].append( b32(randint(0, 2**32-1)) )
+      src_s_msgs[2].append( b32(randint(0, 2**32-1)) )
+
+    sink_n_msgs[5].append( b32(sum(map(lambda x: x[0]*x[1], zip(src_s_msgs[1], src_s_msgs[2])))) )
+
+    s.cross_check( s.mk_kernel_th( 'fir.json', imms, src_s_msgs, sink_n_msgs ),
+                   max_cycles=10*niter )
+
+  def test_rtl_dither( s ):
+    ntiles = 64
+    niter  = 20
+
+    imms = [ b32(0) for _ in range( ntiles ) ]
+    imms[18] = b32(127)
+    imms[29] = b32(0xff)
+    imms[32] = b32(niter)
+    imms[41] = b32(1)
+
+    src_s_msgs  = [ [] for _ in range( 8 ) ]
+    sink_n_msgs = [ [] for _ in range( 8 ) ]
+
+    for i in range( niter ):
+      src_s_msgs[1].append( b32(i*13) )
+
+    error = 0
+    for i in range( niter ):
+      out = src_s_msgs[1][i] + error
+      if out > 127:
+        dest_pixel = 0xff
+        error = out - dest_pixel
+      else:
+        dest_pixel = 0
+        error = out
+      sink_n_msgs[1].append( b32(dest_pixel) )
+
+    s.cross_check( s.mk_kernel_th( 'dither.json', imms, src_s_msgs, sink_n_msgs ),
+                   max_cycles=20*niter )
+
+  def test_rtl_llist( s ):
+    ntiles = 64
+    niter  = 10
+
+    imms = [ b32(0) for _ in range( ntiles ) ]
+    imms[11] = b32(42)
+    imms[18] = b32(4)
+    imms[19] = b32(0xdeadbeef)
+    imms[21] = b32(-1)
+
+    src_s_msgs  = [ [] for _ in range( 8 ) ]
+    sink_n_msgs = [ [] for _ in range( 8 ) ]
+
+    for i in range( niter - 1 ):
+      src_s_msgs[2].append( b32(randint(0, 2**32-1)) )
+      src_s_msgs[3].append( b32(100) )
+    src_s_msgs[3].append( b32(42) )
+
+    sink_n_msgs[6].append( b32(42) )
+
+    s.cross_check( s.mk_kernel_th( 'llist.json', imms, src_s_msgs, sink_n_msgs ),
+                   max_cycles=20*niter )
@@ -20,7 +20,7 @@ from pymtl3 import *
 from pymtl3.stdlib.test import TestSrcCL, TestSinkCL
 from pymtl3.passes.yosys import TranslationImportPass, ImportConfigs
 
-from .test_utils import json_to_cfgs, to_vcd_cycle_time
+from .test_utils import json_to_cfgs, to_vcd_cycle_time, read_counters
 from ..enums import CfgMsg as CFG, TileDirection as TD
 from ..StaticCGRA import StaticCGRA
 from ..ConfigMsg import ConfigMsg
@@ -213,6 +213,7 @@ class StaticCGRA_Tests:
 
     print( f'{ncycles:3}:{th.line_trace()}' )
     assert ncycles < max_cycles
+    return th, ncycles
 
   def test_elaborate( s ):
     dut = StaticCGRA( Bits16, ConfigMsg )
@@ -351,6 +352,70 @@ class StaticCGRA_Tests:
                       sink_n_msgs, sink_s_msgs, sink_w_msgs, sink_e_msgs )
     s.run_sim( 100, th, max_cycles=500 )
 
+  def test_1d_conv_8x8_counters( s ):
+    ncols = 8; nrows = 8
+    ntiles = ncols * nrows
+    nmsgs  = 50
+
+    cfg_msgs = [  mk_cfg( 'nop', 'self', 'self', 'self' ) for _ in range(ntiles) ]
+
+    cfg_msgs[49] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  ) # pass data
+    cfg_msgs[50] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  ) # pass data
+    cfg_msgs[51] = mk_cfg( 'ADD', 'WEST',  'NORTH', 'EAST'  ) # add
+    cfg_msgs[52] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  ) # pass data
+    cfg_msgs[53] = mk_cfg( 'ADD', 'WEST',  'NORTH', 'EAST'  ) # add - exit point
+    cfg_msgs[54] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  ) # pass data
+    cfg_msgs[55] = mk_cfg( 'CP0', 'WEST',  'SELF',  'EAST'  ) # pass data
+
+    cfg_msgs[56] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  ) # pass data
+    cfg_msgs[57] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' ) # mul
+    cfg_msgs[58] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  ) # pass data
+    cfg_msgs[59] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' ) # mul
+    cfg_msgs[60] = mk_cfg( 'CP0', 'NORTH', 'SELF',  'EAST'  ) # pass data
+    cfg_msgs[61] = mk_cfg( 'MUL', 'WEST',  'NORTH', 'SOUTH' ) # mul
+
+    src_n_msgs = [
+      [ b16(1), b16(2) ] * ( nmsgs//2 ), # a0
+      [ b16(1), b16(1) ] * ( nmsgs//2 ), # b0
+      [ b16(2), b16(3) ] * ( nmsgs//2 ), # a1
+      [ b16(1), b16(1) ] * ( nmsgs//2 ), # b1
+      [ b16(3), b16(4) ] * ( nmsgs//2 ), # a2
+      [ b16(1), b16(1) ] * ( nmsgs//2 ), # b2
+      [],
+      [],
+    ]
+    src_s_msgs = [ [] for _ in range( ncols ) ]
+    src_w_msgs = [ [] for _ in range( nrows ) ]
+    src_e_msgs = [ [] for _ in range( nrows ) ]
+
+    sink_n_msgs = [ [] for _ in range( ncols ) ]
+    sink_s_msgs = [ [] for _ in range( ncols ) ]
+    sink_w_msgs = [ [] for _ in range( nrows ) ]
+    sink_e_msgs = [ [] for _ in range( nrows ) ]
+    sink_e_msgs[6] = [ b16(6), b16(9) ] * ( nmsgs//2 )
+
+    th = TestHarness( Bits16, ConfigMsg, ncols, nrows, cfg_msgs,
+                      src_n_msgs, src_s_msgs, src_w_msgs, src_e_msgs,
+                      sink_n_msgs, sink_s_msgs, sink_w_msgs, sink_e_msgs )
+    th.set_param( 'top.dut.construct', instrument=True )
+    th, ncycles = s.run_sim( nmsgs, th, max_cycles=500 )
+
+    # Read from the simulated harness (which may be the imported model)
+
+    counters = read_counters( th.dut, ncols, nrows )
+
+    # Every used tile fires once per message, and spends every other
+    # cycle either starved or stalled. The counters are registered, so the
+    # events of the last cycle are not in yet when the run stops.
+
+    for tid in range( 49, 62 ):
+      cnt = counters[ f'tile_{tid % ncols}_{tid // ncols}' ]
+      assert cnt['fire'] == nmsgs
+      assert cnt['bypass'] == 0
+      assert cnt['fire'] + cnt['starve'] + cnt['stall'] == ncycles - 1
+
+    assert counters['tile_0_0'] == { 'fire': 0, 'bypass': 0, 'starve': 0, 'stall': 0 }
+
   def test_32b_1d_conv_8x8( s ):
     ncols = 8; nrows = 8
     ntiles = ncols * nrows
@@ -925,8 +990,11 @@ class StaticCGRA_Trans_Tests( StaticCGRA_Tests ):
     if not silent_timeout:
       assert ncycles < max_cycles
 
+    nticks  = ncycles
     ncycles = ncycles * (float(clock_time)/1.33)
 
     print(f"Number of iterations = {n_iter}")
     print(f"Number of nominal cycles = {ncycles}")
     print("Throughput: {} iters/nominal cycle".format(n_iter/float(ncycles)))
+
+    return th, nticks
@@ -0,0 +1,89 @@
+"""
+==========================================================================
+energy_sim_test.py
+==========================================================================
+Test cases for the batch API of energy_sim.
+
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+from ..energy_sim import alpha, beta, e_mul, voltage, load_config, \
+                        load_configs, load_fires, tile_energy
+
+cfgs_dir = os.path.join( os.path.dirname( __file__ ), 'cfgs' )
+cfgs     = sorted( glob.glob( os.path.join( cfgs_dir, '*.json' ) ) )
+
+#-------------------------------------------------------------------------
+# ref_tile_energy
+#-------------------------------------------------------------------------
+# E-tile and UE-tile energy of each tile of one config, one tile at a
+# time as energy_sim used to compute it.
+
+def ref_tile_energy( path, ntokens ):
+  v_e = voltage['nominal']
+  e_e, e_ue = [], []
+  for tile in load_config( path ):
+    e  = e_mul * alpha[ tile.op ] * ntokens
+    ue = e_mul * alpha[ tile.op ] * beta[ tile.op ] \
+           * (tile.v**2)/(v_e**2) * ntokens
+    if tile.bps:
+      e  += e_mul * alpha[ 'bps' ] * ntokens
+      ue += e_mul * alpha[ 'bps' ] * beta[ 'bps' ] \
+              * (tile.v**2)/(v_e**2) * ntokens
+    e_e .append( e  )
+    e_ue.append( ue )
+  return e_e, e_ue
+
+#-------------------------------------------------------------------------
+# Test cases
+#-------------------------------------------------------------------------
+
+# The batch of all configs must match each config on its own
+
+def test_batch():
+  e_e, e_ue = tile_energy( load_configs( cfgs ), ntokens=32 )
+  for i, path in enumerate( cfgs ):
+    one_e, one_ue = tile_energy( load_configs( [ path ] ), ntokens=32 )
+    ref_e, ref_ue = ref_tile_energy( path, 32 )
+    assert np.allclose( e_e [i], one_e [0] ), path
+    assert np.allclose( e_ue[i], one_ue[0] ), path
+    assert np.allclose( e_e [i], ref_e     ), path
+    assert np.allclose( e_ue[i], ref_ue    ), path
+
+# A measured count overrides ntokens for that tile only, either for both
+# compute and bypass or as [ compute fires, bypass transfers ]
+
+def test_fires( tmpdir ):
+  batch = load_configs( [ os.path.join( cfgs_dir, 'bf_dvfs.json' ) ] )
+  name  = batch.names[0]
+  tiles = batch.tile_names()
+
+  # An active tile that bypasses and one that does not
+
+  active = batch.alpha[0] > 0
+  t_bps  = np.flatnonzero( active &  batch.bps[0] )[0]
+  t_cmp  = np.flatnonzero( active & ~batch.bps[0] )[0]
+
+  fires_f = tmpdir.join( 'fires.json' )
+  fires_f.write( json.dumps( { name: {
+    tiles[t_cmp] : 5,
+    tiles[t_bps] : [ 7, 3 ],
+  } } ) )
+
+  fires, bps_fires = load_fires( str( fires_f ), batch, ntokens=32 )
+  e_e,   e_ue      = tile_energy( batch, 32, fires, bps_fires )
+  ref_e, ref_ue    = tile_energy( batch, 32 )
+
+  assert np.isclose( e_e[0, t_cmp], e_mul * batch.alpha[0, t_cmp] * 5 )
+  assert np.isclose( e_e[0, t_bps], e_mul * batch.alpha[0, t_bps] * 7
+                                  + e_mul * alpha['bps'] * 3 )
+
+  others = np.ones( len( tiles ), dtype=bool )
+  others[ [ t_cmp, t_bps ] ] = False
+  assert np.array_equal( e_e [0, others], ref_e [0, others] )
+  assert np.array_equal( e_ue[0, others], ref_ue[0, others] )
+  assert np.all( e_ue[0, [ t_cmp, t_bps ]] < ref_ue[0, [ t_cmp, t_bps ]] )
@@ -227,3 +227,27 @@ def to_vcd_cycle_time(clock_time):
     if t % 2 != 0:
         t += 1
     return t
+
+#-------------------------------------------------------------------------
+# read_counters
+#-------------------------------------------------------------------------
+# Read the per-tile activity counters of an instrumented StaticCGRA
+# (either the PyMTL model or the imported Verilator model) after a run.
+# Tiles are named tile_x_y as in energy_sim.py, and to_fires converts the
+# counters into the fire counts that energy_sim.py takes with --fires.
+
+_counter_names = [ 'fire', 'bypass', 'starve', 'stall' ]
+
+def read_counters( dut, ncols=2, nrows=2 ):
+  counters = {}
+  for y in range( nrows ):
+    for x in range( ncols ):
+      tid = y * ncols + x
+      counters[ f'tile_{x}_{y}' ] = {
+        name: int( getattr( dut, 'cnt_' + name )[ tid ] )
+        for name in _counter_names
+      }
+  return counters
+
+def to_fires( counters ):
+  return { tile: [ cnt['fire'], cnt['bypass'] ] for tile, cnt in counters.items() }